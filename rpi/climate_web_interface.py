@@ -1,35 +1,79 @@
+import hmac
 import json
 import logging
+import math
 import os
 import psutil
 import shutil
 import time
-from flask import Flask, request, render_template, url_for, redirect, send_file, g
+from datetime import datetime
+from flask import Flask, Response, request, render_template, url_for, redirect, send_file, g, jsonify, abort
 from glob import glob
 from multiprocessing import Process
-from typing import Optional
+from typing import List, Optional
 from werkzeug.utils import secure_filename
 from climate_web_utilities import (
     plot_excel,
     check_profile_validity,
     ClimateConfig,
+    CONFIG_NAME,
+    HISTORY_NAME,
+    LIVE_FOLDER_PATH,
+    PROFILE_EXTENSIONS,
+    RETRIEVE_CONFIG,
+    STATIC_FOLDER_PATH,
+    compile_profile_sequence,
+    natural_sort_key,
+    open_compiled_profile,
+    parse_local_time,
+    parse_repeats,
 )
+from compiled_profile import COMPILED_EXT
 from control_lights import control_lights
-
-app = Flask(__name__)
-UPLOAD_FOLDER: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
-LIVE_FOLDER: str = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), "static/live"
+from fleet_deploy import DEFAULT_START_DELAY, deploy, select_devices
+from log_files import setup_logging
+from solar_profile import DEFAULT_LATITUDE, generate_solar_profile
+from timeline import Timeline
+from profile_library import ProfileLibrary
+from profile_simplify import DEFAULT_MAX_ERROR, DEFAULT_MIN_DWELL, DEFAULT_TOLERANCE
+import profiling
+from plot_tiles import ZOOM_SPANS, TileCache, render_tile, tile_key, tile_range
+from profile_export import (
+    EXPORT_FORMATS,
+    IS_PARQUET_AVAILABLE,
+    iter_applied_history,
+    iter_schedule,
+    stream_csv,
+    stream_parquet,
 )
+
+app = Flask(__name__, static_folder=STATIC_FOLDER_PATH)
+UPLOAD_FOLDER: str = STATIC_FOLDER_PATH
+LIVE_FOLDER: str = LIVE_FOLDER_PATH
 DATA_FOLDER: str = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "data"
 )
+INVALID_SIMPLIFY_MESSAGE: str = (
+    "Invalid simplification settings. Please enter a tolerance, minimum dwell (seconds) and "
+    "maximum error that are finite numbers of zero or more."
+)
+INVALID_PROFILE_MESSAGE: str = (
+    "Invalid file format. Please upload a .xlsx, .csv, .parquet or .arrow/.feather file with 2 columns: "
+    "Time and Light Intensity Value, or a compiled .npy profile. Times may be times of day, HH:MM:SS, "
+    "durations, timestamps or Excel fractional days (not whole numbers such as seconds); intensities "
+    "must be numbers."
+)
+# Defaults of the optional simplification settings on the upload forms.
+SIMPLIFY_DEFAULTS: dict = {"tolerance": DEFAULT_TOLERANCE, "min_dwell": DEFAULT_MIN_DWELL, "max_error": DEFAULT_MAX_ERROR}
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["LIVE_FOLDER"] = LIVE_FOLDER
+LIBRARY: ProfileLibrary = ProfileLibrary(os.path.join(STATIC_FOLDER_PATH, "library"))
+TILE_CACHE: TileCache = TileCache(os.path.join(STATIC_FOLDER_PATH, "tiles"))
 ACTIVE_CONFIG: Optional[ClimateConfig] = None
 LIGHT_CONTROLLER: Optional[Process] = None
 
-logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+# Logs go through a queue to web_app.log (and the console) so requests never wait on a write.
+setup_logging("web_app")
 logger = logging.getLogger(__name__)
 
 with open(DATA_FOLDER + "/devices.json", 'r', encoding='utf-8') as infile:
@@ -88,6 +132,17 @@ if os.path.exists(os.path.join(LIVE_FOLDER, "climate_config.json")):
                     ACTIVE_CONFIG.retrieve_config()
                     g.pid = ACTIVE_CONFIG.pid
 
+# Adds requests handled during a web app cProfile capture to it (otherwise does nothing).
+@app.before_request
+def start_request_profile():
+    profiling.request_started()
+
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    profiling.request_finished()
+
+
 # Main Page
 @app.get("/")
 def main_page():
@@ -117,7 +172,94 @@ def live_light_profile():
             ACTIVE_CONFIG.update(retreive=True)
     device = device_info(request.headers.get('Host'))
     return render_template("live_light_profile.html",
-                           location=device["location"])
+                           location=device["location"],
+                           scheduling_error=ACTIVE_CONFIG.scheduling_error if ACTIVE_CONFIG else None)
+
+
+# Where the live profile is and what intensity is scheduled, now or at ?at=<iso datetime>,...
+@app.get("/status")
+def status():
+    config = RETRIEVE_CONFIG()
+    if not config or not config["_profile_filepath"]:
+        return jsonify({"running": False})
+    profile = open_compiled_profile(config["_profile_filepath"])
+    timeline = Timeline(profile, config["_started"], config["run_continuously"])
+    now = datetime.now()
+    cycle_num, cycle_start, dur_into_cycle = timeline.position(now)
+    segment = profile.segment_at(min(dur_into_cycle, timeline.cycle_duration).total_seconds())
+    result = {
+        "running": bool(config["pid"]),
+        "profile": os.path.basename(config["_profile_filepath"]),
+        "started": config["_started"].isoformat(),
+        "run_continuously": config["run_continuously"],
+        "completed": timeline.completed(now),
+        "cycle": cycle_num + 1,
+        "cycle_start": cycle_start.isoformat(),
+        "seconds_into_cycle": dur_into_cycle.total_seconds(),
+        "scheduled_intensity": float(timeline.intensity_at([now])[0]),
+        "last_intensity": config["last_intensity"],
+        "last_updated": config["last_updated"].isoformat() if config["last_updated"] else None,
+        "sequence": (
+            {"day": segment["index"] + 1, "days": profile.segment_count, "profile": segment["name"]}
+            if segment
+            else None
+        ),
+    }
+    if "at" in request.args:
+        try:
+            at = [parse_local_time(moment) for moment in request.args["at"].split(",")]
+        except ValueError:
+            abort(400)
+        intensities = timeline.intensity_at(at)
+        result["at"] = {
+            moment.isoformat(): None if intensity != intensity else float(intensity)
+            for moment, intensity in zip(at, intensities)
+        }
+    return jsonify(result)
+
+
+# Zoomable plot of the live profile's schedule and applied intensities, by tiles.
+@app.get("/tiles")
+def tile_viewer():
+    config = RETRIEVE_CONFIG()
+    if not config or not config["_profile_filepath"]:
+        return "There is no live profile to plot.", 404
+    device = device_info(request.headers.get('Host'))
+    return render_template("plot_tiles.html",
+                           location=device["location"],
+                           profile=os.path.basename(config["_profile_filepath"]),
+                           started_ms=int(config["_started"].timestamp() * 1000),
+                           now_ms=int(datetime.now().timestamp() * 1000),
+                           spans_ms=[int(span.total_seconds() * 1000) for span in ZOOM_SPANS])
+
+
+# One tile of the zoomable plot, rendered on first request then served from the cache.
+@app.get("/tiles/<int:zoom>/<int:index>.png")
+def plot_tile(zoom: int, index: int):
+    if zoom >= len(ZOOM_SPANS):
+        abort(404)
+    config = RETRIEVE_CONFIG()
+    if not config or not config["_profile_filepath"]:
+        abort(404)
+    timeline = Timeline(
+        open_compiled_profile(config["_profile_filepath"]), config["_started"], config["run_continuously"]
+    )
+    start, end = tile_range(config["_started"], zoom, index)
+    history_path = os.path.join(app.config["LIVE_FOLDER"], HISTORY_NAME)
+    now = datetime.now()
+    path = TILE_CACHE.get(
+        tile_key(config, zoom, index, now),
+        lambda tile_path: render_tile(timeline, history_path, start, end, tile_path, now),
+    )
+    return send_file(path, mimetype="image/png", max_age=0)
+
+
+# Distribution of how late the Light Controller's intensity changes landed.
+@app.get("/jitter")
+def scheduling_error():
+    # Read straight from the json the Light Controller keeps up to date.
+    config = RETRIEVE_CONFIG()
+    return jsonify({"realtime": config.get("realtime"), "scheduling_error": config.get("scheduling_error")})
 
 
 # Upload and Run Profile Page
@@ -126,13 +268,14 @@ def run_light_profile():
     device = device_info(request.headers.get('Host'))
     return render_template("run_light_profile.html",
                            desc= device["description"],
-                           location=device["location"])
+                           location=device["location"],
+                           simplify_defaults=SIMPLIFY_DEFAULTS)
 
 
 # Light Profile Viewer Page
 @app.get("/viewer")
 def view_light_profile():
-    return render_template("view_light_profile.html")
+    return render_template("view_light_profile.html", simplify_defaults=SIMPLIFY_DEFAULTS)
 
 
 # this is triggered when user clicks "Choose File" button
@@ -145,92 +288,369 @@ def view_profile():
     file = request.files["file"]
     if file.filename == "":
         return redirect(request.url)
+    try:
+        simplify = parse_simplify(request.form)
+    except ValueError:
+        return INVALID_SIMPLIFY_MESSAGE
 
-    # save the file in 'static/'
+    # save the file in 'static/' then store it in the library, which checks (and optionally simplifies) it
     safe_fn = secure_filename(file.filename)
     filepath = os.path.join(app.config["UPLOAD_FOLDER"], safe_fn)
     logger.info("filepath: %s", filepath)
     file.save(filepath)
-
-    # check file format validity
-    if check_profile_validity(filepath) == False:
-        os.remove(filepath)  # delete the file if it's invalid
-        return "Invalid file format. Please upload .xlsx or .csv file with 2 columns: Time and Light Intensity Value."
+    entry = LIBRARY.add(filepath, safe_fn, simplify)
+    if not entry:
+        return INVALID_PROFILE_MESSAGE
 
     # create a profile plot and save it
-    plot_excel(filepath)
-
-    # remove excel files to reduce clutter
-    for filename in os.listdir(app.config["UPLOAD_FOLDER"]):
-        if filename.endswith(".xlsx"):
-            file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            os.remove(file_path)
+    plot_excel(
+        LIBRARY.compiled_path(entry), plot_path=os.path.join(app.config["UPLOAD_FOLDER"], "plot.png")
+    )
 
     # all is well, return .html with the plot
-    return render_template("view_light_profile.html", file_uploaded=True)
+    return render_template("view_light_profile.html", file_uploaded=True, entry=entry,
+                           simplify_defaults=simplify or SIMPLIFY_DEFAULTS)
 
 
-# this is triggered when user clicks "Send to Lights" button on the 'run' page
-@app.post("/run")
-def send_light_profile():
-    global ACTIVE_CONFIG, LIGHT_CONTROLLER, logger
-
-    # check if file is real from the HTML request
-    if "file" not in request.files:
-        return redirect(request.url)
-
-    file = request.files["file"]
-    loop = request.form.get("run_continuous")
-    run_continuous = True if loop else False
-    if file.filename == "":
-        return redirect(request.url)
-    # save the file in 'static/live'
-    safe_fn = secure_filename(file.filename)
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], safe_fn)
-    file.save(filepath)
-    # check file format validity
-    if check_profile_validity(filepath) == False:
-        os.remove(filepath)  # delete the file if it's invalid
-        return "Invalid file format. Please upload .xlsx or .csv file with 2 columns: Time and Light Intensity Value."
-    livepath = os.path.join(app.config["LIVE_FOLDER"], safe_fn)
-
+def stop_light_controller() -> None:
+    """Stops any running Light Controller and clears the 'live' folder."""
+    global ACTIVE_CONFIG, LIGHT_CONTROLLER
     g.pid = None
     # If there is an active LIGHT_CONTROLLER running, kill it.
     if LIGHT_CONTROLLER and LIGHT_CONTROLLER.is_alive():
         LIGHT_CONTROLLER.kill()
+        # Wait for it to exit (and reap it) so it can't write to the 'live' folder after it's cleared.
+        LIGHT_CONTROLLER.join(timeout=5)
         LIGHT_CONTROLLER = None
-    # If there is an active config eliminate it.
+    # If there is an active config clean up after it.
     if ACTIVE_CONFIG:
+        ACTIVE_CONFIG.cleanup()
         ACTIVE_CONFIG = None
-        # Give the garbage collector a moment to do its thing.
-        time.sleep(2)
     # delete any other plots, configs or profiles in the 'live' folder
     for pathname in glob(os.path.join(app.config["LIVE_FOLDER"], "*.png")):
         os.remove(pathname)
     for pathname in glob(os.path.join(app.config["LIVE_FOLDER"], "*.json")):
         os.remove(pathname)
-    for pathname in glob(os.path.join(app.config["LIVE_FOLDER"], "*.xlsx")):
-        os.remove(pathname)
+    for extension in PROFILE_EXTENSIONS + (COMPILED_EXT,):
+        for pathname in glob(os.path.join(app.config["LIVE_FOLDER"], "*" + extension)):
+            os.remove(pathname)
 
-    shutil.move(filepath, livepath)
-    logger.info("New validated profile uploaded: %s", livepath)
+
+def start_light_controller(livepath: str, run_continuous: bool, started: Optional[datetime] = None) -> None:
+    """Starts a Light Controller running the profile at livepath (in the 'live' folder) from started (default: now)."""
+    global ACTIVE_CONFIG, LIGHT_CONTROLLER
     logger.info(
         "The new profile was set to run %s.",
         "continuously looping" if run_continuous else "once",
     )
-
-    ACTIVE_CONFIG = ClimateConfig(livepath, run_continuous)
+    ACTIVE_CONFIG = ClimateConfig(livepath, run_continuous, started)
     ACTIVE_CONFIG.update()
     LIGHT_CONTROLLER = Process(target=control_lights)
     LIGHT_CONTROLLER.start()
     # climate_config.json's pid key/value will be saved by control_lights.
     g.pid = LIGHT_CONTROLLER.pid
 
+
+def parse_simplify(form) -> Optional[dict]:
+    """Returns an upload form's simplification settings, or None if it isn't to be simplified.
+
+    Raises:
+        ValueError: If a setting isn't a finite number of zero or more.
+    """
+    if not form.get("simplify"):
+        return None
+    settings = {key: float(form.get(key) or default) for key, default in SIMPLIFY_DEFAULTS.items()}
+    if not all(math.isfinite(value) and value >= 0 for value in settings.values()):
+        raise ValueError(settings)
+    return settings
+
+
+# this is triggered when user clicks "Send to Lights" button on the 'run' page
+@app.post("/run")
+def send_light_profile():
+    # check if files are real from the HTML request
+    if "file" not in request.files:
+        return redirect(request.url)
+
+    # Several files make a sequence, run in filename order (day2 before day10), which the
+    # repeat counts follow.
+    files = sorted(
+        (file for file in request.files.getlist("file") if file.filename),
+        key=lambda file: natural_sort_key(secure_filename(file.filename)),
+    )
+    loop = request.form.get("run_continuous")
+    run_continuous = True if loop else False
+    if not files:
+        return redirect(request.url)
+    repeats = parse_repeats(request.form.get("repeats", ""), len(files))
+    if not repeats:
+        return "Invalid repeat counts. Please give one whole number per profile, separated by commas."
+    try:
+        simplify = parse_simplify(request.form)
+    except ValueError:
+        return INVALID_SIMPLIFY_MESSAGE
+    # save the files in 'static/' then store them in the library, which checks and
+    # compiles each new one in a single parse
+    entries = []
+    for file in files:
+        safe_fn = secure_filename(file.filename)
+        filepath = os.path.join(app.config["UPLOAD_FOLDER"], safe_fn)
+        file.save(filepath)
+        entries.append(LIBRARY.add(filepath, safe_fn, simplify))
+    if not all(entries):
+        return INVALID_PROFILE_MESSAGE
+    return run_library_profiles(entries, repeats, run_continuous)
+
+
+def run_library_profiles(entries: List[dict], repeats: List[int], run_continuous: bool):
+    """Runs library profiles, several (or one repeated) as a sequence, and shows the 'live' page."""
+    launch_library_profiles(entries, repeats, run_continuous)
+
+    # It may take a short bit to start the run.
+    time.sleep(1)
+    return redirect(url_for("live_light_profile"))
+
+
+def launch_library_profiles(
+    entries: List[dict], repeats: List[int], run_continuous: bool, started: Optional[datetime] = None
+) -> None:
+    """Starts a Light Controller running library profiles, several (or one repeated) as a sequence."""
+    stop_light_controller()
+    if len(entries) > 1 or repeats[0] > 1:
+        # Compile the sequence into one schedule that's run like a single profile.
+        livepath = os.path.join(app.config["LIVE_FOLDER"], "sequence" + COMPILED_EXT)
+        compile_profile_sequence(
+            [LIBRARY.compiled_path(entry) for entry in entries],
+            repeats,
+            livepath,
+            names=[entry["name"] for entry in entries],
+        )
+        for entry in entries:
+            LIBRARY.record_run(entry)
+        logger.info(
+            "Profiles sequenced: %s",
+            ", ".join(f"{entry['name']} x{count}" for entry, count in zip(entries, repeats)),
+        )
+    else:
+        livepath = LIBRARY.checkout(entries[0], app.config["LIVE_FOLDER"])
+        logger.info("Library profile %s (%s) set live: %s", entries[0]["name"], entries[0]["hash"], livepath)
+    start_light_controller(livepath, run_continuous, started)
+
+
+# Profile Library Page, searchable by ?q=<name or hash prefix>
+@app.get("/library")
+def profile_library():
+    query = request.args.get("q", "")
+    device = device_info(request.headers.get('Host'))
+    return render_template("profile_library.html",
+                           location=device["location"],
+                           query=query,
+                           profiles=LIBRARY.search(query))
+
+
+@app.get("/library/<content_hash>/thumbnail.png")
+def library_thumbnail(content_hash: str):
+    entry = LIBRARY.get(content_hash)
+    if not entry:
+        abort(404)
+    return send_file(LIBRARY.thumbnail_path(entry), mimetype="image/png")
+
+
+# Downloads a library profile as it was uploaded.
+@app.get("/library/<content_hash>/download")
+def library_download(content_hash: str):
+    entry = LIBRARY.get(content_hash)
+    if not entry:
+        abort(404)
+    return send_file(LIBRARY.original_path(entry), as_attachment=True, download_name=entry["name"])
+
+
+# this is triggered when user clicks "Run" on a profile on the 'library' page
+@app.post("/library/<content_hash>/run")
+def run_library_profile(content_hash: str):
+    entry = LIBRARY.get(content_hash)
+    if not entry:
+        abort(404)
+    return run_library_profiles([entry], [1], True if request.form.get("run_continuous") else False)
+
+
+def check_deploy_token() -> None:
+    """Aborts unless the request carries ADMIN_TOKEN, refusing every request (403) if none is set.
+
+    The fleet API can replace what runs on the lights, so unlike the /run form it's never open.
+    """
+    if not profiling.ADMIN_TOKEN:
+        abort(403)
+    check_admin_token()
+
+
+# Fleet deployment: whether this device's library holds a profile, by its content hash.
+@app.get("/api/library/<content_hash>")
+def api_library_entry(content_hash: str):
+    check_deploy_token()
+    entry = LIBRARY.get(content_hash)
+    if not entry:
+        abort(404)
+    return jsonify(entry)
+
+
+# Fleet deployment: adds an uploaded profile (with an optional catalog name, and simplification
+# settings as the /run form sends them) to the library.
+@app.post("/api/library")
+def api_library_add():
+    check_deploy_token()
+    file = request.files.get("file")
+    if not file or not file.filename:
+        abort(400)
+    try:
+        simplify = parse_simplify(request.form)
+    except ValueError:
+        return jsonify({"error": INVALID_SIMPLIFY_MESSAGE}), 400
+    safe_fn = secure_filename(file.filename)
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], safe_fn)
+    file.save(filepath)
+    # The name becomes a file name when the profile is run, so it's made safe as one.
+    entry = LIBRARY.add(filepath, secure_filename(request.form.get("name", "")) or safe_fn, simplify)
+    if not entry:
+        return jsonify({"error": INVALID_PROFILE_MESSAGE}), 400
+    return jsonify(entry)
+
+
+# Fleet deployment: runs a library profile, from a JSON {"started": <iso datetime>,
+# "run_continuous": <bool>} so several devices can share a start time. A start time with a
+# UTC offset is converted to local time.
+@app.post("/api/library/<content_hash>/run")
+def api_library_run(content_hash: str):
+    check_deploy_token()
+    entry = LIBRARY.get(content_hash)
+    if not entry:
+        abort(404)
+    body = request.get_json(silent=True) or {}
+    try:
+        started = parse_local_time(body["started"]) if body.get("started") else None
+    except (TypeError, ValueError):
+        abort(400)
+    launch_library_profiles([entry], [1], bool(body.get("run_continuous")), started)
+    return jsonify({"hash": entry["hash"], "started": ACTIVE_CONFIG.started.isoformat(), "pid": LIGHT_CONTROLLER.pid})
+
+
+# Deploys a library profile to devices in devices.json concurrently, from a common start,
+# given a JSON {"hash", "devices": [names or addresses] (default: all), "start_in": <seconds>,
+# "run_continuous"}. Returns each device's result and latency.
+@app.post("/api/deploy")
+def api_deploy():
+    check_deploy_token()
+    body = request.get_json(silent=True) or {}
+    entry = LIBRARY.get(body.get("hash", ""))
+    if not entry:
+        abort(404)
+    try:
+        devices = select_devices(DEVICES, body.get("devices"))
+        start_in = float(body.get("start_in", DEFAULT_START_DELAY))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    results = deploy(
+        LIBRARY.original_path(entry),
+        devices,
+        name=entry["name"],
+        start_in=start_in,
+        run_continuous=bool(body.get("run_continuous")),
+        token=profiling.ADMIN_TOKEN,
+        content_hash=entry["hash"],
+        simplify=json.loads(entry["simplify"]) if entry["simplify"] else None,
+    )
+    return jsonify(results)
+
+
+# Procedurally generated solar profile page
+@app.get("/generate")
+def generate_page():
+    device = device_info(request.headers.get('Host'))
+    return render_template("generate_profile.html",
+                           location=device["location"],
+                           default_latitude=DEFAULT_LATITUDE)
+
+
+# this is triggered when user clicks "Preview" or "Send to Lights" on the 'generate' page
+@app.post("/generate")
+def generate_profile():
+    form = request.form
+    try:
+        options = dict(
+            latitude=float(form.get("latitude") or DEFAULT_LATITUDE),
+            day_of_year=int(form.get("day_of_year") or 172),
+            days=int(form.get("days") or 1),
+            resolution=float(form.get("resolution") or 1),
+            peak_intensity=float(form.get("peak_intensity") or 100),
+            photoperiod=float(form["photoperiod"]) if form.get("photoperiod") else None,
+            cloud_cover=float(form.get("cloud_cover") or 0),
+            cloud_timescale=float(form.get("cloud_timescale") or 600),
+            seed=int(form.get("seed") or 0),
+        )
+    except ValueError:
+        return "Invalid generator settings. Please enter numbers in every field you fill in."
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], "solar_profile" + COMPILED_EXT)
+    try:
+        generate_solar_profile(filepath, **options)
+    except ValueError as e:
+        return f"Invalid generator settings. {e}"
+    if check_profile_validity(filepath) == False:
+        os.remove(filepath)
+        return INVALID_PROFILE_MESSAGE
+
+    if form.get("action") != "run":
+        # create a profile plot and save it, then clean up as the viewer does
+        plot_excel(filepath)
+        os.remove(filepath)
+        return render_template("generate_profile.html",
+                               location=device_info(request.headers.get('Host'))["location"],
+                               default_latitude=DEFAULT_LATITUDE,
+                               file_uploaded=True)
+
+    stop_light_controller()
+    livepath = os.path.join(app.config["LIVE_FOLDER"], os.path.basename(filepath))
+    shutil.move(filepath, livepath)
+    logger.info("New generated profile: %s %s", livepath, options)
+    start_light_controller(livepath, True if form.get("run_continuous") else False)
+
     # It may take a short bit to start the run.
     time.sleep(1)
     return redirect(url_for("live_light_profile"))
 
 
+# Streams the live profile's schedule or applied-intensity history over an optional
+# ?start=<iso datetime>&end=<iso datetime> range as csv or parquet.
+@app.get("/export/<source>.<fmt>")
+def export_data(source: str, fmt: str):
+    if source not in ("profile", "applied") or fmt not in EXPORT_FORMATS:
+        abort(404)
+    if fmt == "parquet" and not IS_PARQUET_AVAILABLE:
+        return "Parquet export requires pyarrow to be installed on the Raspberry Pi.", 501
+    config = RETRIEVE_CONFIG()
+    if not config or not config["_profile_filepath"]:
+        return "There is no live profile to export.", 404
+    try:
+        start = parse_local_time(request.args["start"]) if "start" in request.args else None
+        end = parse_local_time(request.args["end"]) if "end" in request.args else None
+    except ValueError:
+        abort(400)
+    if source == "profile":
+        timeline = Timeline(
+            open_compiled_profile(config["_profile_filepath"]), config["_started"], config["run_continuously"]
+        )
+        start = start or config["_started"]
+        end = end or start + timeline.cycle_duration
+        chunks = iter_schedule(timeline, start, end)
+    else:
+        chunks = iter_applied_history(os.path.join(app.config["LIVE_FOLDER"], HISTORY_NAME), start, end)
+    # The response is generated as it's sent so the download never sits in memory.
+    return Response(
+        stream_csv(chunks) if fmt == "csv" else stream_parquet(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={source}.{fmt}"},
+    )
+
+
 # this is called by HTML after user clicks 'View Profile' button
 # this grabs the plot.png that was created by upload_file() and displays it
 @app.get("/display_plot")
@@ -238,6 +658,59 @@ def display_plot():
     return redirect(url_for("static", filename="plot.png"))
 
 
+def check_admin_token() -> None:
+    """Aborts unless the request carries ADMIN_TOKEN (as X-Admin-Token or ?token=)."""
+    if not profiling.ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get("X-Admin-Token") or request.args.get("token", "")
+    if not hmac.compare_digest(token.encode(), profiling.ADMIN_TOKEN.encode()):
+        abort(403)
+
+
+# Profiles the web app or Light Controller for ?seconds=<n> (default 10), by ?mode=sample
+# (default) or cprofile, and returns the top ?top=<n> functions with a link to the stats file.
+@app.get("/admin/profile/<target>")
+def admin_profile(target: str):
+    check_admin_token()
+    mode = request.args.get("mode", "sample")
+    if target not in ("web", "controller") or mode not in profiling.PROFILE_MODES:
+        abort(404)
+    try:
+        seconds = float(request.args.get("seconds", 10))
+        top = int(request.args.get("top", profiling.DEFAULT_TOP))
+    except ValueError:
+        abort(400)
+    if not math.isfinite(seconds) or seconds <= 0 or top <= 0:
+        abort(400)
+    seconds = min(seconds, profiling.MAX_CAPTURE_SECONDS)
+    os.makedirs(profiling.PROFILE_FOLDER, exist_ok=True)
+    stem = os.path.join(profiling.PROFILE_FOLDER, f"{target}_{mode}_{datetime.now():%Y%m%d_%H%M%S}")
+    if target == "web":
+        summary = profiling.capture_web_app(mode, seconds, stem, top)
+    else:
+        # A stale pid in the config may since have been reused by an unrelated process, so
+        # it's only signalled if it's still the Light Controller's.
+        pid = profiling.controller_pid(
+            RETRIEVE_CONFIG().get("pid"), os.path.join(app.config["LIVE_FOLDER"], CONFIG_NAME)
+        )
+        if not pid:
+            return "There is no Light Controller running to profile.", 404
+        summary = profiling.request_controller_capture(app.config["LIVE_FOLDER"], pid, mode, seconds, stem, top)
+        if summary is None:
+            return "The Light Controller didn't save a profile in time.", 504
+    summary["download"] = url_for("admin_profile_download", filename=summary["file"])
+    return jsonify(summary)
+
+
+@app.get("/admin/profile/download/<filename>")
+def admin_profile_download(filename: str):
+    check_admin_token()
+    path = os.path.join(profiling.PROFILE_FOLDER, secure_filename(filename))
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True)
+
+
 # Custom error handler for 400 Bad Request
 @app.errorhandler(400)
 def bad_request(error):
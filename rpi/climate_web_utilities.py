@@ -2,26 +2,58 @@ import json
 import logging
 import matplotlib
 import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
+import numpy as np
 import os
 import pandas as pd
+import re
+import threading
 from abc import ABC
 from datetime import datetime, date, time, timedelta
 from glob import glob
+from matplotlib.figure import Figure
 from multiprocessing import Process
-from typing import Optional
+from typing import List, Optional, Tuple
+from compiled_profile import (
+    COMPILED_EXT,
+    CompiledProfile,
+    check_compiled_rows,
+    compile_profile,
+    compile_sequence,
+    segments_path,
+)
+from timeline import Timeline
 
 CONFIG_NAME: str = "climate_config.json"
-LIVE_FOLDER_PATH: str = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), "static/live"
+# Appended to by the Light Controller with each intensity it applies.
+HISTORY_NAME: str = "applied_history.csv"
+HISTORY_COLUMNS: Tuple[str, ...] = ("time", "intensity", "scheduled_time")
+# CLIMATE_STATIC_FOLDER relocates uploads and the live folder (e.g. to a temp folder for testing).
+STATIC_FOLDER_PATH: str = os.environ.get(
+    "CLIMATE_STATIC_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 )
+LIVE_FOLDER_PATH: str = os.path.join(STATIC_FOLDER_PATH, "live")
 DEFAULT_PROFILE: str = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "default_profiles/base.xlsx"
 )
+# File extensions read_profile can load (compiled profiles are opened directly).
+PROFILE_EXTENSIONS: Tuple[str, ...] = (".xlsx", ".csv", ".parquet", ".arrow", ".feather")
+
+# Use the fastest installed parsers.
+try:
+    import python_calamine  # noqa: F401
+
+    EXCEL_ENGINE: str = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+try:
+    import pyarrow  # noqa: F401
+
+    CSV_ENGINE: str = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
 
 matplotlib.use("Agg")
 
-logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 
@@ -71,22 +103,206 @@ def RETRIEVE_CONFIG() -> dict:
         if "last_intensity" in data and isinstance(data["last_intensity"], int)
         else int(data["last_intensity"]) if data["last_intensity"].isnumeric() else 0
     )
+    config["realtime"] = (
+        data["realtime"] if "realtime" in data and isinstance(data["realtime"], dict) else None
+    )
+    config["scheduling_error"] = (
+        data["scheduling_error"]
+        if "scheduling_error" in data and isinstance(data["scheduling_error"], dict)
+        else None
+    )
     return config
 
 
 def times_to_timedeltas(df: pd.DataFrame) -> pd.DataFrame:
-    if df.dtypes[df.columns[0]] == "O" and isinstance(df.iloc[0, 0], time):
-        # Pandas column datatype is 'Object', specifically a python datetime.time, in Excel it is a time
-        time_deltas = [
-            datetime.combine(date.min, x) - datetime.min for x in df.iloc[:, 0].tolist()
-        ]
-    elif df.dtypes[df.columns[0]] == "<M8[ns]":
-        # Pandas column datatype is a pandas Timestamp, in Excel it is a date (with time)
-        time_deltas = [(x - df.iloc[0, 0]).to_pytimedelta() for x in df.iloc[:, 0]]
+    """Normalizes the first (time) column of a profile to timedeltas in one vectorized pass.
+
+    Handled time representations:
+        - times of day (python datetime.time, in Excel a time): the time since midnight.
+        - timestamps (in Excel a date with time): the time since the first timestamp.
+        - strings such as "HH:MM:SS", "36:00:00" or "1 day 02:00:00": the duration given.
+        - numbers (Excel fractional days, e.g. 0.5 = 12:00:00): that many days. Whole
+          numbers only are refused, as they may as well be seconds or minutes.
+        - durations (in Excel a [h]:mm:ss cell), including those longer than 24 hrs.
+
+    Arguments:
+        df (DataFrame): Profile with times in the first column.
+
+    Returns (DataFrame):
+        The profile with its first column converted to timedelta64 values.
+
+    Raises:
+        ValueError: If the time column can't be interpreted or is only whole numbers.
+    """
+    col = df.iloc[:, 0]
+    if pd.api.types.is_timedelta64_dtype(col):
+        time_deltas = col
+    elif pd.api.types.is_datetime64_any_dtype(col):
+        time_deltas = col - col.iloc[0]
+    elif pd.api.types.is_numeric_dtype(col):
+        # A csv or parquet of 0, 60, 120 is far more likely seconds than 120 days.
+        if pd.api.types.is_bool_dtype(col) or (np.mod(col.to_numpy(dtype=np.float64), 1) == 0).all():
+            raise ValueError(
+                "Numeric times are read as Excel fractional days, and whole numbers are ambiguous. "
+                "Give times as HH:MM:SS, durations, times of day or timestamps."
+            )
+        time_deltas = pd.to_timedelta(col, unit="D")
+    elif isinstance(col.iloc[0], datetime):
+        timestamps = pd.to_datetime(col)
+        time_deltas = timestamps - timestamps.iloc[0]
+    else:
+        # Times of day, durations and strings all share pandas' duration string parser.
+        time_deltas = pd.to_timedelta(col.astype(str))
     df[df.columns[0]] = time_deltas
     return df
 
 
+def read_profile(filepath: str) -> pd.DataFrame:
+    """Reads a profile file into a dataframe with a first column of timedeltas.
+
+    The reader is chosen by file extension (see PROFILE_EXTENSIONS) and uses the fastest
+    parser installed: calamine for Excel and pyarrow for csv, when available.
+
+    Arguments:
+        filepath (str): Path to an .xlsx, .csv, .parquet, .arrow or .feather profile.
+
+    Returns (DataFrame):
+        The profile with times normalized by times_to_timedeltas.
+
+    Raises:
+        ValueError: If the file extension isn't a supported profile format.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".xlsx":
+        df = pd.read_excel(filepath, engine=EXCEL_ENGINE)
+    elif extension == ".csv":
+        df = pd.read_csv(filepath, engine=CSV_ENGINE)
+    elif extension == ".parquet":
+        df = pd.read_parquet(filepath)
+    elif extension in (".arrow", ".feather"):
+        df = pd.read_feather(filepath)
+    else:
+        raise ValueError(f"Unsupported profile format: {extension}")
+    return times_to_timedeltas(df)
+
+
+def compiled_profile_path(filepath: str) -> str:
+    """Returns the path of the compiled profile kept alongside a profile file."""
+    if filepath.endswith(COMPILED_EXT):
+        return filepath
+    return os.path.splitext(filepath)[0] + COMPILED_EXT
+
+
+def open_compiled_profile(filepath: str) -> CompiledProfile:
+    """Opens the compiled form of a profile, compiling it first if needed.
+
+    A spreadsheet is parsed only when its compiled profile is missing or older than it,
+    so the web app and the light controller share a single parse of each upload.
+
+    Arguments:
+        filepath (str): Path to a profile spreadsheet or an already compiled profile.
+
+    Returns (CompiledProfile):
+        Windowed, memory-mapped access to the profile.
+    """
+    compiled_path = compiled_profile_path(filepath)
+    if compiled_path != filepath and (
+        not os.path.exists(compiled_path)
+        or os.path.getmtime(compiled_path) < os.path.getmtime(filepath)
+    ):
+        df = read_profile(filepath)
+        compile_profile(
+            pd.to_timedelta(df.iloc[:, 0]).dt.total_seconds().to_numpy(),
+            df.iloc[:, 1].to_numpy(),
+            compiled_path,
+        )
+    return CompiledProfile(compiled_path)
+
+
+def compile_valid_profile(filepath: str) -> Optional[CompiledProfile]:
+    """Checks and compiles a profile in a single parse.
+
+    Arguments:
+        filepath (str): Path to a profile file or an already compiled profile.
+
+    Returns (CompiledProfile):
+        The compiled profile (alongside filepath), or None if it isn't a valid profile.
+    """
+    if filepath.endswith(COMPILED_EXT):
+        return CompiledProfile(filepath) if check_profile_validity(filepath) else None
+    try:
+        df = read_profile(filepath)
+    except Exception as e:
+        logger.warning("Couldn't read profile %s: %s", os.path.basename(filepath), e)
+        return None
+    if not is_valid_profile_frame(df):
+        return None
+    try:
+        compiled_path = compile_profile(
+            pd.to_timedelta(df.iloc[:, 0]).dt.total_seconds().to_numpy(),
+            df.iloc[:, 1].to_numpy(),
+            compiled_profile_path(filepath),
+        )
+    except (TypeError, ValueError):
+        return None
+    return CompiledProfile(compiled_path)
+
+
+def natural_sort_key(name: str) -> list:
+    """Returns a key sorting names with their numbers in numeric order, e.g. day2 before day10."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def parse_repeats(repeats: str, count: int) -> Optional[List[int]]:
+    """Parses comma separated repeat counts for count profiles, blank meaning once each.
+
+    Returns (list of int):
+        The repeat counts, or None unless there's a whole number above 0 for each profile.
+    """
+    if not repeats.strip():
+        return [1] * count
+    try:
+        parsed = [int(repeat) for repeat in repeats.split(",")]
+    except ValueError:
+        return None
+    return parsed if len(parsed) == count and min(parsed) > 0 else None
+
+
+def parse_local_time(text: str) -> datetime:
+    """Parses an ISO date/time as a local time, as profiles are run by.
+
+    One with a UTC offset (e.g. "2024-05-01T06:00:00+02:00") is converted to local time,
+    since it's compared with the Light Controller's naive local times.
+
+    Raises:
+        ValueError: If it isn't an ISO date/time.
+    """
+    moment = datetime.fromisoformat(text)
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def compile_profile_sequence(
+    filepaths: List[str], repeats: List[int], path: str, names: Optional[List[str]] = None
+) -> CompiledProfile:
+    """Compiles profiles to be run back to back, each a number of times, into one schedule.
+
+    Arguments:
+        filepaths (list): Paths of the profiles in the order they're to run.
+        repeats (list): How many times in a row each profile is run.
+        path (str): Path of the compiled sequence (.npy) to create.
+        names (list): Names of the profiles in the sequence index (default: file names).
+
+    Returns (CompiledProfile):
+        The compiled sequence, with its segment index.
+    """
+    names = names or [os.path.basename(filepath) for filepath in filepaths]
+    parts = [
+        (name, open_compiled_profile(filepath), count)
+        for name, filepath, count in zip(names, filepaths, repeats)
+    ]
+    return CompiledProfile(compile_sequence(parts, path))
+
+
 class ClimateConfig(ABC):
     """A class to contain the current configuration of the Climate Simulation.
 
@@ -94,19 +310,30 @@ class ClimateConfig(ABC):
         run_continuously (bool): Is the climate controller running continously or just for 24 hrs?
         last_updated (datetime): The last date and time the instance has been updated
         rpi_time_script_finished: The date and time the profile script finished.
+        realtime (dict): What the Light Controller's real-time mode achieved, if enabled.
+        scheduling_error (dict): Distribution of how late the Light Controller's changes were.
         _profile_filepath: The path to the running or completed profile.
-        _started (datetime): The date and time the config was instantiated.
+        _started (datetime): The date and time the profile starts, by default when the config was instantiated.
 
     Methods:
         profile_filename (str): Returns the filename portion of _profile_filepath.
         started (datetime): Returns _started.
         update: Saves a copy of an instances's state to {LIVE_FOLDER_PATH}/{CONFIG_NAME} (a .json)
         retrieve_config: Repopulates an instance with what's in {LIVE_FOLDER_PATH}/{CONFIG_NAME}
-        __del__: Upon deletion of an instance any saved state file is deleted.
+        cleanup: Deletes the saved state and live profile files once a run is over.
     """
 
-    def __init__(self, profile_path: str = None, run_continuously: bool = True):
-        """Initializes the ClimateConfig class."""
+    def __init__(
+        self, profile_path: str = None, run_continuously: bool = True, started: Optional[datetime] = None
+    ):
+        """Initializes the ClimateConfig class.
+
+        Arguments:
+            profile_path (str): The profile to run.
+            run_continuously (bool): Loop the profile rather than run it once.
+            started (datetime): When the profile starts (default: now). A later time, e.g. one
+                shared by several devices, has the Light Controller wait for it.
+        """
         self._profile_filepath: Optional[str] = None
         # If a saved config json exists recover it. (e.g. power outage may have happened)
         live_config = glob(os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME))
@@ -114,12 +341,14 @@ class ClimateConfig(ABC):
             logger.info("An existing config was found - instantiating from it!")
             self.retrieve_config()
         else:
-            now = datetime.now()
+            now = started or datetime.now()
             self._started: datetime = now - timedelta(microseconds=now.microsecond)
             self.run_continuously: bool = run_continuously
             self.rpi_time_script_finished: Optional[datetime] = None
             self.last_intensity: int = 0
             self.pid: Optional[int] = None
+            self.realtime: Optional[dict] = None
+            self.scheduling_error: Optional[dict] = None
 
             if profile_path:
                 if os.path.exists(profile_path):
@@ -132,17 +361,20 @@ class ClimateConfig(ABC):
                         "The provided profile path did not exist: %s", profile_path
                     )
                     # If a profile currently exists
-                    xlsx_files: list = glob(os.path.join(LIVE_FOLDER_PATH, "*.xlsx"))
-                    if xlsx_files:
+                    profile_files: list = [
+                        path
+                        for extension in PROFILE_EXTENSIONS + (COMPILED_EXT,)
+                        for path in glob(os.path.join(LIVE_FOLDER_PATH, "*" + extension))
+                        if os.path.basename(path) != HISTORY_NAME
+                    ]
+                    if profile_files:
                         logger.info(
-                            "An existing profile xlsx was found, using it: %s",
-                            xlsx_files[0],
+                            "An existing profile file was found, using it: %s",
+                            profile_files[0],
                         )
-                        self._profile_filepath = xlsx_files[0]
-        # Note: Due to when python garbage collection happens, if you reinstantiate a instance of this class
-        # the __del__ may occur AFTER the save() that happens in the update() below leaving no .json.
-        # A new json will be created the next save() but if this becomes a problem it will have to be dealt
-        # with. This should normally never be a problem with one, prolonged instance of the class.
+                        self._profile_filepath = profile_files[0]
+        # Note: Files are only removed by an explicit cleanup(), never when an instance is garbage
+        # collected, so temporary instances (e.g. to read the config) are safe to create and drop.
 
     @property
     def started(self) -> datetime:
@@ -174,10 +406,12 @@ class ClimateConfig(ABC):
 
     def save(self) -> None:
         """Saves the state of the config to live/{CONFIG_NAME}."""
-        with open(
-            os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME), "w", encoding="utf-8"
-        ) as outfile:
+        config_path = os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME)
+        # Written to a temporary file and moved into place so it's never read half written.
+        tmp_path = f"{config_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as outfile:
             json.dump(self.__dict__, outfile, indent=4, sort_keys=True, default=str)
+        os.replace(tmp_path, config_path)
 
     def retrieve_config(self) -> None:
         """Retrieves climate configuration from static/live/{CONFIG_NAME}."""
@@ -214,6 +448,8 @@ class ClimateConfig(ABC):
             else None
         )
         self.pid = data["pid"] if "pid" in data else None
+        self.realtime = data["realtime"]
+        self.scheduling_error = data["scheduling_error"]
         if not self._profile_filepath:
             logger.warning(
                 "No valid profile file found in config! Populated with 'None'."
@@ -222,192 +458,208 @@ class ClimateConfig(ABC):
             missing = [key for key in self.__dict__.keys() if key not in data]
             logger.warning("Data for %s keys missing in the config found: ", missing)
 
-    def __del__(self) -> None:
-        """Function called when a ClimateConfig instance is deleted."""
+    def cleanup(self) -> None:
+        """Deletes the saved config, live profile, live plot and history of this run."""
         # Note: This could add the start and finish times to the name and move to a history folder.
         # Instead it now just cleans up after itself.
         if os.path.exists(os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME)):
             os.remove(os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME))
-        if os.path.exists(self._profile_filepath):
+        if self._profile_filepath and os.path.exists(self._profile_filepath):
+            compiled_path = compiled_profile_path(self._profile_filepath)
             os.remove(self._profile_filepath)
+            if os.path.exists(compiled_path):
+                os.remove(compiled_path)
+            if os.path.exists(segments_path(compiled_path)):
+                os.remove(segments_path(compiled_path))
         if os.path.exists(os.path.join(LIVE_FOLDER_PATH, "live_plot.png")):
             os.remove(os.path.join(LIVE_FOLDER_PATH, "live_plot.png"))
+        if os.path.exists(os.path.join(LIVE_FOLDER_PATH, HISTORY_NAME)):
+            os.remove(os.path.join(LIVE_FOLDER_PATH, HISTORY_NAME))
+
 
+def expand_profile_points(
+    seconds: np.ndarray, values: np.ndarray, start: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pads profile steps with extra points to capture the step nature of profiles.
 
-def expand_profile_points(df: pd.DataFrame) -> pd.DataFrame:
-    """Pads a dataframe of duration, intensity values to capture step nature of profiles.
+    A profile whose first step comes after its start is drawn from the start: the Light
+    Controller sets the first step's intensity as soon as a profile starts, so that
+    intensity (rather than 0) is drawn up to the first step.
 
     Arguments:
-        df(DataFrame): Dataframe with first column of timedeltas (time since start) and
-        second column of light intensity values.
+        seconds (ndarray): Time of each step in seconds since the start of the profile.
+        values (ndarray): Light intensity value of each step.
+        start (float): Time in seconds the plot starts from.
 
-    Returns (DataFrame):
-        Dataframe with extra rows facilitating the plotting of light intensity setting
-        steps where the source dataframe specifies only the time and intensity values
-        at the steps.
+    Returns (tuple of ndarrays):
+        x and y values facilitating the plotting of light intensity setting steps where
+        the source arrays specify only the time and intensity values at the steps.
     """
-    df2 = pd.DataFrame(columns=df.columns)
-    idx2 = 0
-    zero = pd.Timedelta(seconds=0)
-    time_col = df.columns[0]
-    intensity_col = df.columns[1]
-    for idx, row in df.iterrows():
-        duration = row[time_col]
-        if idx == 0:
-            # If the first row isn't duration = zero create one.
-            if duration == zero:
-                df2.loc[0] = [timedelta(0), 0]
-                row.name = 0
-                last_row = row
-            else:
-                # Otherwise use the initial row.
-                first_row = row.copy()
-                first_row.name = 0
-                first_row[time_col] = zero
-                first_row[intensity_col] = 0
-                df2 = df2._append(first_row)
-                last_row = first_row
-            idx2 += 1
-        if duration == zero or row[intensity_col] == last_row[intensity_col]:
-            # Skip any duplicate duration = zero rows or duplicate intensities in profile
-            if idx < len(df) - 1:  # Keep the last row of the profile.
-                continue
-        # Add a row that has new timedelta and intensity from the last row.
-        new_row = last_row.copy()
-        new_row[time_col] = row[time_col]
-        new_row.name = idx2
-        df2 = df2._append(new_row)
-        idx2 += 1
-        # Finally append the next row
-        row.name = idx2
-        df2 = df2._append(row)
-        last_row = row.copy()
-        idx2 += 1
-    return df2
-
-
-def plot_excel(filepath: str = "", config: Optional[ClimateConfig] = None):
+    if not len(seconds):
+        return seconds, values
+    if seconds[0] > start:
+        seconds, values = np.insert(seconds, 0, start), np.insert(values, 0, values[0])
+    # Skip duplicate intensities in the profile, but keep the last row of the profile.
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    keep[-1] = True
+    seconds, values = seconds[keep], values[keep]
+    # Each step holds its intensity until the time of the next step.
+    return np.repeat(seconds, 2)[1:], np.repeat(values, 2)[:-1]
+
+
+def plot_excel(filepath: str = "", config: Optional[ClimateConfig] = None, plot_path: Optional[str] = None):
     now = datetime.now()
     now = now - timedelta(microseconds=now.microsecond)
     # Get the profile
-    df = pd.read_excel(filepath)
-    # Transform input data time column to timedeltas
-    df = times_to_timedeltas(df)
-    # Add data points that facilitate plotting step changes
-    df = expand_profile_points(df)
+    profile = open_compiled_profile(filepath)
     # Determine the profile cycle length and last cycle start time.
-    cycle_dur = min(max(df[df.columns[0]]), timedelta(days=1))
+    cycle_dur = profile.cycle_duration
+    # At most a day of the profile is plotted at a time.
+    view_dur = min(cycle_dur, timedelta(days=1))
     if config:
         if now - config.last_updated < timedelta(seconds=1.2):
             now = config.last_updated
-        total_elapsed_time = now - config.started
-        cycle_num = total_elapsed_time // cycle_dur
-        if config.run_continuously:
-            cycle_start = config.started + cycle_num * cycle_dur
+        timeline = Timeline(profile, config.started, config.run_continuously)
+        cycle_num, cycle_start, dur_into_cycle = timeline.position(now)
+        # Show the day of a long profile (or of the sequence's current profile) that
+        # contains the current time.
+        dur_into_cycle = max(timedelta(0), min(dur_into_cycle, cycle_dur))
+        segment = profile.segment_at(dur_into_cycle.total_seconds())
+        if segment:
+            segment_offset = timedelta(seconds=segment["offset"])
+            segment_dur = timedelta(seconds=segment["duration"])
+            view_dur = min(segment_dur, timedelta(days=1))
+            view_offset = segment_offset + min(
+                (dur_into_cycle - segment_offset) // view_dur * view_dur, segment_dur - view_dur
+            )
         else:
-            cycle_start = config.started
+            view_offset = min(dur_into_cycle // view_dur * view_dur, cycle_dur - view_dur)
     else:
         # Facilitates Light Profile View
         cycle_start = datetime(
             year=now.year, month=now.month, day=now.day, hour=0, second=0
         )
         cycle_num = 0
+        view_offset = timedelta(0)
+    # Read only the slice of the profile being plotted and add data points that
+    # facilitate plotting step changes.
+    view_start = view_offset.total_seconds()
+    view_end = (view_offset + view_dur).total_seconds()
+    seconds, values = expand_profile_points(*profile.between(view_start, view_end), view_start)
+    seconds = np.clip(seconds, view_start, view_end)
     # Calculate plot x values for the current (or first) cycle.
-    times = [cycle_start + x for x in df.iloc[:, 0]]
-    values = df.iloc[:, 1]
+    times = cycle_start + pd.to_timedelta(seconds, unit="s")
 
-    # Build plot
-    plt.figure(figsize=(10, 6))
+    # Build plot. A Figure (rather than pyplot) is freed with its last reference and is
+    # safe to draw from the web app's request threads.
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
 
     # plot cols
-    plt.plot(times, values, marker=".")
-    plt.grid("both")
-    plt.xlabel("Duration from Start of Profile")
-    plt.ylabel("Light Intensity Value")
-    plt.title(str(os.path.basename(filepath)))
-    plt.tight_layout()
-
-    time_fmt = "%H:%M:%S" if cycle_dur < timedelta(minutes=10) else "%H:%M"
+    ax.plot(times, values, marker="." if len(values) <= 2000 else None)
+    ax.grid("both")
+    ax.set_xlabel("Duration from Start of Profile")
+    ax.set_ylabel("Light Intensity Value")
+    ax.set_title(str(os.path.basename(filepath)))
+    fig.tight_layout()
+
+    time_fmt = "%H:%M:%S" if view_dur < timedelta(minutes=10) else "%H:%M"
     if config:
         # For life profile label plots with start and current time/duration.
-        dur = now - cycle_start
-        if dur > cycle_dur and not config.run_continuously:
+        completed = timeline.completed(now)
+        if completed:
             now = cycle_start + cycle_dur
-            dur = cycle_dur
-            completed = True
-        else:
-            completed = False
         dur_str = now.strftime("%m/%d " + time_fmt)
-        plt.axvline(x=now, linestyle="--", color="r")
+        ax.axvline(x=now, linestyle="--", color="r")
         an_y = (78, 80.5) if config.last_intensity < 60. else (0, 2.5)
         intensity = config.last_intensity
-        plt.annotate(f"{intensity}", xy=(now, intensity),
-                     xytext=(now + 2*cycle_dur/100, intensity + 5),
+        ax.annotate(f"{intensity}", xy=(now, intensity),
+                     xytext=(now + 2*view_dur/100, intensity + 5),
                      arrowprops=dict(facecolor='black', width=1,
                                      headwidth=6, headlength=6)
                      )
-        plt.annotate(dur_str, [now, an_y[0]], rotation=90, ha="right")
-        # TODO: To plot value we need to determine what it is. This should be done by
-        #       the same function that does it for control_lights.py.
-        # plt.annotate(0, [now, 0], ha="left")
-        plt.annotate("Last Update", [now, an_y[1]], rotation=90, ha="left")
-        if config.run_continuously and cycle_num:
-            plt.axvline(x=cycle_start, linestyle="--", color="r")
-            plt.annotate(
+        ax.annotate(dur_str, [now, an_y[0]], rotation=90, ha="right")
+        scheduled = float(timeline.intensity_at([now])[0])
+        ax.annotate(f"{scheduled:g}", [now, scheduled], ha="left")
+        ax.annotate("Last Update", [now, an_y[1]], rotation=90, ha="left")
+        if config.run_continuously and cycle_num and not view_offset:
+            ax.axvline(x=cycle_start, linestyle="--", color="r")
+            ax.annotate(
                 cycle_start.strftime("%m/%d %H:%M:%S"),
                 [cycle_start, 41],
                 rotation=90,
                 ha="right",
             )
-            plt.annotate(
+            ax.annotate(
                 f"Cycle {cycle_num + 1:,} Start Time",
                 [cycle_start, 39],
                 rotation=90,
                 ha="left",
             )
-        plt.xlabel("Rasberry Pi Time of Day")
-        plt.title(
+        ax.set_xlabel("Rasberry Pi Time of Day")
+        ax.set_title(
             f"Controlling Profile: {config.profile_filename}"
             f"{' (looping)' if config.run_continuously else ' (COMPLETED)' if completed else ''}"
             f"\n Started: {config._started.strftime('%m/%d %H:%M:%S')}"
+            + (
+                f", Day {segment['index'] + 1} of {profile.segment_count}: {segment['name']}"
+                if segment
+                else ""
+            )
         )
-        plt.tight_layout()
+        fig.tight_layout()
 
-    plt.gcf().autofmt_xdate(rotation=90, ha="center")
-    ax = plt.gca()
+    fig.autofmt_xdate(rotation=90, ha="center")
     ax.xaxis.set_major_formatter(mdates.DateFormatter(time_fmt))
 
     # save plot to 'static' folder
-    plot_path = (
-        os.path.join(LIVE_FOLDER_PATH, "live_plot.png")
-        if config
-        else os.path.join(os.path.dirname(filepath), "plot.png")
-    )
-    plt.savefig(plot_path)
-    plt.close()
+    if not plot_path:
+        plot_path = (
+            os.path.join(LIVE_FOLDER_PATH, "live_plot.png")
+            if config
+            else os.path.join(os.path.dirname(filepath), "plot.png")
+        )
+    fig.savefig(plot_path)
 
 
 def check_profile_validity(filepath):
 
-    # 1. check if excel file or csv file
-    if filepath.endswith(".xlsx"):
-        df = pd.read_excel(filepath)
+    # 1. check if an already compiled profile
+    if filepath.endswith(COMPILED_EXT):
+        try:
+            check_compiled_rows(CompiledProfile(filepath))
+        except (ValueError, OSError):
+            return False
+        return True
+
+    # 2. check if a readable profile file with a time column
+    try:
+        df = read_profile(filepath)
+    except Exception:
+        return False
+
+    # 3. check its columns and times
+    return is_valid_profile_frame(df)
 
-    elif filepath.endswith(".csv"):
-        df = pd.read_csv(filepath)
 
-    else:
+def is_valid_profile_frame(df: pd.DataFrame) -> bool:
+    """Checks a profile read by read_profile has 2 columns, 2 rows, understood, non-decreasing times
+    and numeric intensities."""
+    # 1. check if file has 2 columns and at least a start and an end
+    if len(df.columns) != 2 or len(df) < 2:
         return False
 
-    # 2. check if file has 2 columns
-    if len(df.columns) != 2:
+    # 2. check if every time was understood and they don't go backwards
+    time_deltas = df.iloc[:, 0]
+    if time_deltas.isna().any() or not time_deltas.is_monotonic_increasing:
         return False
 
-    # 3. check if first column is time
-    try:
-        # convert first col to pd time
-        df.iloc[:, 0] = pd.to_datetime(df.iloc[:, 0], format="%H:%M:%S").dt.time
-    except:
+    # 3. check every intensity is a number
+    intensities = df.iloc[:, 1]
+    if not pd.api.types.is_numeric_dtype(intensities) or pd.api.types.is_bool_dtype(intensities):
+        return False
+    if intensities.isna().any():
         return False
 
     # if passed all the tests, return True!
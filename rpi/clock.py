@@ -0,0 +1,54 @@
+"""Clocks the Light Controller tells and waits for time by.
+
+SYSTEM_CLOCK is the real clock. A VirtualClock's time only moves when something sleeps on
+it, and instantly, so tests can run the controller through thousands of cycles of a profile
+in seconds.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class ClockStopped(Exception):
+    """Raised by a VirtualClock when time reaches its stop_at."""
+
+
+class SystemClock:
+    """The real clock."""
+
+    def now(self) -> datetime:
+        """Returns the current local date and time."""
+        return datetime.now()
+
+    def sleep(self, seconds: float) -> None:
+        """Sleeps for a number of seconds."""
+        time.sleep(seconds)
+
+
+class VirtualClock(SystemClock):
+    """A clock that jumps ahead by however long is slept, without waiting.
+
+    Attributes:
+        stop_at (datetime): When set, sleeping to or past this time raises ClockStopped.
+        sleeps (int): Number of times the clock has been slept on.
+    """
+
+    def __init__(self, start: datetime, stop_at: Optional[datetime] = None):
+        """Initializes the VirtualClock class."""
+        self._now = start
+        self.stop_at = stop_at
+        self.sleeps: int = 0
+
+    def now(self) -> datetime:
+        """Returns the virtual date and time."""
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        """Moves the virtual time ahead by a number of seconds."""
+        self._now += timedelta(seconds=seconds)
+        self.sleeps += 1
+        if self.stop_at is not None and self._now >= self.stop_at:
+            raise ClockStopped(self._now)
+
+
+SYSTEM_CLOCK: SystemClock = SystemClock()
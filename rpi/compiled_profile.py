@@ -0,0 +1,324 @@
+"""Compiled light profiles: an on-disk, memory-mapped format for very long profiles.
+
+A compiled profile is a standard numpy ``.npy`` file holding a (2, n) float64 array.
+Row 0 is the time of each step in seconds since the start of the profile and row 1 is
+the light intensity that applies from that time until the next step. Each row is
+contiguous on disk so it can be binary searched or paged through a window at a time
+without ever reading the whole file. A year of 1 second steps (~31.5 million rows) is
+about 500 MB on disk but only the pages of the current window are ever resident.
+
+A compiled sequence (several profiles run back to back, e.g. day1, day2, day3) is a
+compiled profile plus a ``.segments.json`` index of where each profile starts.
+"""
+import json
+import logging
+import os
+import numpy as np
+from bisect import bisect_right
+from datetime import timedelta
+from typing import Callable, List, Optional, Tuple
+
+COMPILED_EXT: str = ".npy"
+SEGMENTS_EXT: str = ".segments.json"
+# Rows read per window when paging through a profile (2 x 8 bytes per row).
+WINDOW_ROWS: int = 4096
+# Rows written per chunk when compiling a profile.
+_WRITE_CHUNK_ROWS: int = 1 << 20
+# Rows read at a time when checking a compiled profile.
+_CHECK_CHUNK_ROWS: int = WINDOW_ROWS * 64
+
+logger = logging.getLogger(__name__)
+
+
+def compile_profile(seconds, intensities, path: str) -> str:
+    """Writes profile steps to a compiled profile file.
+
+    The file is written to a temporary name and moved into place so a reader never
+    sees a partially written profile.
+
+    Arguments:
+        seconds (array-like): Time of each step in seconds since the start of the profile.
+        intensities (array-like): Light intensity of each step.
+        path (str): Path of the compiled profile to create.
+
+    Returns (str):
+        The path of the compiled profile.
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    if seconds.shape != intensities.shape or seconds.ndim != 1 or not len(seconds):
+        raise ValueError("A compiled profile needs matching, non-empty 1-D time and intensity arrays.")
+    if np.any(np.diff(seconds) < 0):
+        raise ValueError("Profile times must be non-decreasing.")
+    return compile_rows(len(seconds), lambda start, stop: (seconds[start:stop], intensities[start:stop]), path)
+
+
+def compile_rows(
+    rows: int, fill: Callable[[int, int], Tuple[np.ndarray, np.ndarray]], path: str, chunk_rows: int = _WRITE_CHUNK_ROWS
+) -> str:
+    """Writes a compiled profile whose rows are produced a chunk at a time.
+
+    Profiles too large to hold in memory (e.g. generated ones) are written straight into
+    the memory-mapped file, so memory use is bounded by chunk_rows.
+
+    Arguments:
+        rows (int): Number of rows in the profile.
+        fill (callable): fill(start, stop) returns the (seconds, intensities) of rows [start, stop).
+        path (str): Path of the compiled profile to create.
+        chunk_rows (int): Rows requested from fill at a time.
+
+    Returns (str):
+        The path of the compiled profile.
+    """
+    tmp_path = path + ".tmp"
+    # open_memmap writes the .npy header; the rows are then written with plain file
+    # writes, which unlike writes through a memory map don't accumulate resident pages.
+    header = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=(2, rows))
+    del header
+    with open(tmp_path, "r+b") as outfile:
+        data_offset = _read_header(outfile)[3]
+        for start in range(0, rows, chunk_rows):
+            stop = min(start + chunk_rows, rows)
+            seconds, intensities = fill(start, stop)
+            outfile.seek(data_offset + start * 8)
+            outfile.write(np.ascontiguousarray(seconds, dtype=np.float64).tobytes())
+            outfile.seek(data_offset + (rows + start) * 8)
+            outfile.write(np.ascontiguousarray(intensities, dtype=np.float64).tobytes())
+    os.replace(tmp_path, path)
+    # A profile compiled over an old sequence of the same name isn't a sequence.
+    if os.path.exists(segments_path(path)):
+        os.remove(segments_path(path))
+    logger.info("Compiled %s profile rows to %s", f"{rows:,}", path)
+    return path
+
+
+def _read_header(infile) -> Tuple[tuple, bool, np.dtype, int]:
+    """Reads a .npy header, returning (shape, fortran_order, dtype, offset of the data)."""
+    version = np.lib.format.read_magic(infile)
+    read_header = (
+        np.lib.format.read_array_header_1_0
+        if version == (1, 0)
+        else np.lib.format.read_array_header_2_0
+    )
+    shape, fortran_order, dtype = read_header(infile)
+    return shape, fortran_order, dtype, infile.tell()
+
+
+def segments_path(path: str) -> str:
+    """Returns the path of the segment index kept alongside a compiled sequence."""
+    return os.path.splitext(path)[0] + SEGMENTS_EXT
+
+
+def compile_sequence(parts: List[Tuple[str, "CompiledProfile", int]], path: str) -> str:
+    """Compiles profiles run one after another into a single flat compiled profile.
+
+    Each repeat of each profile becomes a segment that starts where the previous one
+    ended (its last step, which only marks the end of the profile, is dropped except at
+    the very end). As when run alone, a profile's first intensity applies from the start
+    of its segment. The start offset of every segment is saved in a segment index so the
+    segment running at any time is found with a binary search.
+
+    Arguments:
+        parts (list): (name, compiled profile, repeat count) of each profile in order.
+        path (str): Path of the compiled sequence to create.
+
+    Returns (str):
+        The path of the compiled sequence.
+    """
+    segments = [(name, profile) for name, profile, repeats in parts for _ in range(repeats)]
+    if not segments:
+        raise ValueError("A sequence needs at least one profile.")
+    if any(len(profile) < 2 for _, profile in segments):
+        raise ValueError("Every profile in a sequence needs at least two rows.")
+    total_rows = sum(len(profile) - 1 for _, profile in segments) + 1
+    tmp_path = path + ".tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=(2, total_rows))
+    index = {"names": [], "offsets": [], "durations": []}
+    counts = {name: sum(repeats for n, _, repeats in parts if n == name) for name, _, _ in parts}
+    done = {}
+    offset, row = 0.0, 0
+    for i, (name, profile) in enumerate(segments):
+        rows = len(profile) if i == len(segments) - 1 else len(profile) - 1
+        for start in range(0, rows, _WRITE_CHUNK_ROWS):
+            seconds, intensities = profile.window(start, min(start + _WRITE_CHUNK_ROWS, rows))
+            if not start:
+                seconds[0] = 0.0
+            out[0, row : row + len(seconds)] = seconds + offset
+            out[1, row : row + len(seconds)] = intensities
+            row += len(seconds)
+        done[name] = done.get(name, 0) + 1
+        duration = profile.cycle_duration.total_seconds()
+        index["names"].append(f"{name} ({done[name]}/{counts[name]})" if counts[name] > 1 else name)
+        index["offsets"].append(offset)
+        index["durations"].append(duration)
+        offset += duration
+    out.flush()
+    del out
+    os.replace(tmp_path, path)
+    with open(segments_path(path), "w", encoding="utf-8") as outfile:
+        json.dump(index, outfile, indent=4)
+    logger.info("Compiled a sequence of %s profiles (%s rows) to %s", len(segments), f"{total_rows:,}", path)
+    return path
+
+
+class CompiledProfile:
+    """Read-only, windowed access to a compiled profile file.
+
+    Nothing but the file header is read when an instance is created. Lookups binary
+    search a memory map of the time row and data is otherwise read in small windows
+    that are unmapped after use, so resident memory does not grow with profile length.
+
+    Attributes:
+        path (str): Path of the compiled profile.
+
+    Methods:
+        cycle_duration (timedelta): Time of the last step, i.e. the length of one cycle.
+        search: Index of the first step at or after an elapsed number of seconds.
+        values_at: Intensities in effect at an array of elapsed seconds.
+        window: Times and intensities of a range of rows.
+        row: Time and intensity of one row, paged in a window at a time.
+        between: Times and intensities covering a span of elapsed seconds.
+        segment_at: For a compiled sequence, the profile (segment) running at a time.
+    """
+
+    def __init__(self, path: str):
+        """Initializes the CompiledProfile class by reading the .npy header."""
+        self.path: str = path
+        with open(path, "rb") as infile:
+            shape, fortran_order, dtype, self._data_offset = _read_header(infile)
+        if len(shape) != 2 or shape[0] != 2 or fortran_order or dtype != np.float64:
+            raise ValueError(f"{path} is not a compiled light profile.")
+        self._rows: int = shape[1]
+        self._window_start: int = 0
+        self._window = None
+        self._segments: Optional[dict] = None
+        if os.path.exists(segments_path(path)):
+            with open(segments_path(path), "r", encoding="utf-8") as infile:
+                self._segments = json.load(infile)
+
+    @property
+    def segment_count(self) -> int:
+        """Returns the number of profiles in a compiled sequence, or 0 if not a sequence."""
+        return len(self._segments["offsets"]) if self._segments else 0
+
+    def segment_at(self, elapsed_seconds: float) -> Optional[dict]:
+        """Returns the segment of a compiled sequence in effect at elapsed_seconds.
+
+        Returns (dict or None):
+            "index" (zero based), "name", "offset" and "duration" (both in seconds) of the
+            segment, or None if this isn't a sequence.
+        """
+        if not self._segments:
+            return None
+        offsets = self._segments["offsets"]
+        index = min(max(0, bisect_right(offsets, elapsed_seconds) - 1), len(offsets) - 1)
+        return {
+            "index": index,
+            "name": self._segments["names"][index],
+            "offset": offsets[index],
+            "duration": self._segments["durations"][index],
+        }
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _map(self, field: int, start: int, stop: int) -> np.memmap:
+        """Memory maps rows [start, stop) of one field (0: seconds, 1: intensity)."""
+        offset = self._data_offset + (field * self._rows + start) * 8
+        return np.memmap(self.path, dtype=np.float64, mode="r", offset=offset, shape=(stop - start,))
+
+    @property
+    def cycle_duration(self) -> timedelta:
+        """Returns the time of the last step in the profile."""
+        return timedelta(seconds=float(self._map(0, self._rows - 1, self._rows)[0]))
+
+    def search(self, elapsed_seconds, side: str = "left"):
+        """Binary searches the step times for elapsed_seconds.
+
+        Arguments:
+            elapsed_seconds (float or array): Seconds since the start of the profile.
+            side (str): As for numpy.searchsorted.
+
+        Returns (int or array):
+            Insertion index(es) of elapsed_seconds into the step times.
+        """
+        times = self._map(0, 0, self._rows)
+        found = np.searchsorted(times, elapsed_seconds, side=side)
+        del times
+        return found
+
+    def values_at(self, elapsed_seconds: np.ndarray) -> np.ndarray:
+        """Returns the intensity in effect at each of an array of elapsed seconds.
+
+        Before the first step the first step's intensity is in effect, as the Light
+        Controller applies it as soon as a profile starts.
+
+        The elapsed seconds are searched for in sorted order, and only the span of
+        intensities they land in is read, in order, so the mapped file is walked once
+        instead of being read at random.
+        """
+        elapsed_seconds = np.asarray(elapsed_seconds, dtype=np.float64)
+        queries = elapsed_seconds.ravel()
+        values = np.empty(len(queries))
+        if not len(queries):
+            return values.reshape(elapsed_seconds.shape)
+        is_sorted = bool(np.all(queries[1:] >= queries[:-1]))
+        order = None if is_sorted else np.argsort(queries)
+        times = self._map(0, 0, self._rows)
+        rows = np.searchsorted(times, queries if is_sorted else queries[order], side="right") - 1
+        del times
+        np.clip(rows, 0, self._rows - 1, out=rows)
+        intensities = self._map(1, int(rows[0]), int(rows[-1]) + 1)
+        if is_sorted:
+            values[:] = intensities[rows - rows[0]]
+        else:
+            values[order] = intensities[rows - rows[0]]
+        del intensities
+        return values.reshape(elapsed_seconds.shape)
+
+    def window(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns in-memory copies of the times and intensities of rows [start, stop)."""
+        start = max(0, start)
+        stop = min(self._rows, stop)
+        if stop <= start:
+            return np.empty(0), np.empty(0)
+        return np.array(self._map(0, start, stop)), np.array(self._map(1, start, stop))
+
+    def row(self, idx: int) -> Tuple[timedelta, float]:
+        """Returns the (time, intensity) of a row, reading a new window only when needed."""
+        if idx < 0:
+            idx += self._rows
+        if self._window is None or not 0 <= idx - self._window_start < len(self._window[0]):
+            self._window_start = idx
+            self._window = self.window(idx, idx + WINDOW_ROWS)
+        pos = idx - self._window_start
+        return timedelta(seconds=float(self._window[0][pos])), float(self._window[1][pos])
+
+    def between(self, start_seconds: float, end_seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the steps needed to describe the profile from start to end seconds.
+
+        The step in effect at start_seconds is included so the returned slice fully
+        defines the light intensity over the span.
+        """
+        first = max(0, int(self.search(start_seconds, side="right")) - 1)
+        last = int(self.search(end_seconds, side="right"))
+        return self.window(first, last)
+
+
+def check_compiled_rows(profile: CompiledProfile) -> None:
+    """Checks the rows of a compiled profile a chunk at a time, as compile_profile checks its input.
+
+    Raises:
+        ValueError: Unless it has at least 2 rows, every time and intensity is finite and
+            the times don't decrease.
+    """
+    if len(profile) < 2:
+        raise ValueError(f"{profile.path} has fewer than 2 rows.")
+    previous = -np.inf
+    for start in range(0, len(profile), _CHECK_CHUNK_ROWS):
+        seconds, intensities = profile.window(start, start + _CHECK_CHUNK_ROWS)
+        if not (np.isfinite(seconds).all() and np.isfinite(intensities).all()):
+            raise ValueError(f"{profile.path} has times or intensities that aren't finite.")
+        if seconds[0] < previous or np.any(np.diff(seconds) < 0):
+            raise ValueError("Profile times must be non-decreasing.")
+        previous = seconds[-1]
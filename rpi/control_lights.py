@@ -1,51 +1,168 @@
 import json
 import logging
 import os
-import pandas as pd
+import queue
+import threading
 from datetime import datetime, date, time, timedelta
-from time import sleep
 from typing import Optional
 from climate_web_utilities import (
     CONFIG_NAME,
+    HISTORY_COLUMNS,
+    HISTORY_NAME,
     LIVE_FOLDER_PATH,
     RETRIEVE_CONFIG,
-    times_to_timedeltas,
+    open_compiled_profile,
 )
+from clock import SYSTEM_CLOCK, SystemClock
+from compiled_profile import CompiledProfile
 from light_utilities import flash_lights_thrice, send_to_arduino
+from log_files import setup_logging
+from profiling import install_controller_handler
+from realtime import REALTIME, JitterRecorder, enable_realtime
+from timeline import Timeline
 
-logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 CONFIG_PATH = os.path.join(LIVE_FOLDER_PATH, CONFIG_NAME)
+HISTORY_PATH = os.path.join(LIVE_FOLDER_PATH, HISTORY_NAME)
+# How often the scheduling error summary in climate_config.json is refreshed, and the least
+# time before the next change there must be to refresh it then.
+JITTER_SUMMARY_INTERVAL = timedelta(seconds=10)
+JITTER_SUMMARY_MIN_SLACK = timedelta(seconds=0.1)
 
 
-def find_next_row(df: pd.DataFrame, elapsed_time: timedelta) -> int:
-    """Find the next row of the Dataframe that elapsed_time > elapsed_time.
+def find_next_row(profile: CompiledProfile, elapsed_time: timedelta) -> int:
+    """Find the next row of the profile whose time is at or after elapsed_time.
 
     Arguments:
-        df (DataFrame): A dataframe where the first column are timedeltas that light intensities are to be set.
+        profile (CompiledProfile): The compiled profile whose rows are the times light intensities are to be set.
         elapsed_time (timedelta): The amount of time since the profile was started.
     Returns (int):
-        Index of the next row in the dataframe where time <= the elapsed time.
+        Index of the next row in the profile where elapsed time <= time.
     """
-    time_column_name: str = df.columns[0]
-    row_idx: int = 0
-    # Note: Time values in the dataframe are type datetime.timedelta's
-    next_time = df[time_column_name][row_idx]
-    while elapsed_time > next_time and row_idx + 1 < len(df):
-        next_time = df[time_column_name][row_idx + 1]
-        row_idx += 1
-    return row_idx
+    # Binary search of the memory-mapped times; the profile is never read in full.
+    return min(int(profile.search(elapsed_time.total_seconds())), len(profile) - 1)
+
+
+def wait_until(target: datetime, clock: SystemClock = SYSTEM_CLOCK) -> datetime:
+    """Sleeps until the target time, waking at least every 0.5 s. Returns the time woken."""
+    now = clock.now()
+    while now < target:
+        clock.sleep(min((target - now).total_seconds(), 0.5))
+        now = clock.now()
+    return now
 
 
 def save_config(config: dict) -> None:
     """Save climate_config.json."""
-    with open(CONFIG_PATH, "w", encoding="utf-8") as outfile:
+    # Written to a temporary file and moved into place so the web app never reads half of it.
+    tmp_path = f"{CONFIG_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
         json.dump(config, outfile, indent=4, sort_keys=True, default=str)
+    os.replace(tmp_path, CONFIG_PATH)
     return
 
 
-def control_lights():
-    """Controls light intensity and updates climate_config.json."""
+class ChangeRecorder:
+    """Records applied intensities off the control loop, in the order they were applied.
+
+    Each is appended to the history csv, logged and saved in climate_config.json by a
+    thread of its own, so the control loop only queues it. Changes queued while earlier
+    ones are being recorded are written together and the config is saved once for them.
+
+    Attributes:
+        config (dict): The config saved. Only the recorder's thread changes it once started.
+
+    Methods:
+        applied: Queues an applied intensity to be recorded.
+        save: Queues changes to the config to be saved.
+        close: Records everything queued, then stops.
+    """
+
+    def __init__(self, config: dict, history_path: str):
+        """Initializes the ChangeRecorder class and starts its thread."""
+        self.config = config
+        new_history = not os.path.exists(history_path)
+        self._history = open(history_path, "a", encoding="utf-8")
+        if new_history:
+            self._history.write(",".join(HISTORY_COLUMNS) + "\n")
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="change-recorder", daemon=True)
+        self._thread.start()
+
+    def applied(
+        self,
+        label: str,
+        time_point: datetime,
+        intensity: float,
+        applied: datetime,
+        scheduled: Optional[datetime],
+        error: Optional[float],
+        cycle: int,
+        row: int,
+    ) -> None:
+        """Queues an intensity applied at applied (for time_point) to be recorded; label starts its log message."""
+        self._queue.put((label, time_point, intensity, applied, scheduled, error, cycle, row))
+
+    def save(self, **changes) -> None:
+        """Queues changes to the config to be saved after the intensities queued before them."""
+        self._queue.put(changes)
+
+    def close(self) -> None:
+        """Records everything queued, then stops the thread and closes the history csv."""
+        self._queue.put(None)
+        self._thread.join()
+        self._history.close()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, dict):
+                    self.config.update(item)
+                else:
+                    self._record(*item)
+            # Readers of the history csv and config see whole batches.
+            self._history.flush()
+            save_config(self.config)
+
+    def _record(
+        self,
+        label: str,
+        time_point: datetime,
+        intensity: float,
+        applied: datetime,
+        scheduled: Optional[datetime],
+        error: Optional[float],
+        cycle: int,
+        row: int,
+    ) -> None:
+        self._history.write(f"{applied.isoformat()},{intensity},{scheduled.isoformat() if scheduled else ''}\n")
+        self.config["last_updated"] = time_point
+        self.config["last_intensity"] = int(intensity)
+        logger.info(
+            "%s: %s light intensity to %s by pid %s.",
+            time_point.strftime("%m/%d %H:%M:%S"), label, intensity, self.config["pid"],
+            extra={"cycle": cycle, "row": row, "intensity": intensity, "sched_error": error},
+        )
+
+
+def control_lights(clock: SystemClock = SYSTEM_CLOCK):
+    """Controls light intensity and updates climate_config.json.
+
+    Arguments:
+        clock (SystemClock): What the time is told and waited for by, e.g. a VirtualClock
+            to run through many cycles without waiting for them.
+    """
+    # Logs go through a queue to controller.log, so logging never waits on a write.
+    setup_logging("controller")
     # Get and save pid immediately before taking the time to flash the lights.
     pid = os.getpid()
     logger.info("Light controller starting as pid=%s", pid)
@@ -53,83 +170,108 @@ def control_lights():
     config["pid"] = pid
     start_time = config["_started"]
     save_config(config)
+    # The web app's /admin/profile can ask for a profile of this process.
+    install_controller_handler(LIVE_FOLDER_PATH)
     # Confirm new light controller by flashing lights:
     flash_lights_thrice()
-    # Read profile excel file
-    df = pd.read_excel(config["_profile_filepath"])
-    time_column_name, intensity_column_name = df.columns[:2]
-    # Transform input data time column to timedeltas
-    df = times_to_timedeltas(df)
+    # Open the compiled profile. Rows are paged in a window at a time as they're reached.
+    profile = open_compiled_profile(config["_profile_filepath"])
+    # Scheduling error of every change is recorded; real-time mode is opt-in.
+    jitter = JitterRecorder()
+    summarized = {"at": datetime.min, "count": 0}
+    config["realtime"] = enable_realtime() if REALTIME else None
+    # Applied intensities are written to the history csv, logged and saved off the control loop.
+    recorder = ChangeRecorder(config, HISTORY_PATH)
 
-    def update_and_report(time_point: datetime, update_intensity: float):
+    def update_and_report(
+        label: str, time_point: datetime, update_intensity: float, cycle: int, row: int,
+        scheduled: Optional[datetime] = None,
+    ) -> None:
+        """Applies an intensity and queues it to be recorded, with its scheduling error if scheduled."""
         send_to_arduino(update_intensity)
-        config["last_updated"] = time_point
-        config["last_intensity"] = int(update_intensity)
-        save_config(config)
+        applied = clock.now()
+        error = None
+        if scheduled:
+            error = (applied - scheduled).total_seconds()
+            jitter.record(error)
+        recorder.applied(label, time_point, update_intensity, applied, scheduled, error, cycle, row)
+
+    def refresh_jitter_summary(next_change: Optional[datetime] = None) -> None:
+        """Saves the scheduling error summary if it's due and there's time before next_change.
+
+        Summarizing takes percentiles of up to 65,536 errors, so it's done every
+        JITTER_SUMMARY_INTERVAL between changes rather than as each change is made.
+        """
+        now = clock.now()
+        if jitter.count == summarized["count"]:
+            return
+        if next_change is not None and (
+            now - summarized["at"] < JITTER_SUMMARY_INTERVAL or next_change - now < JITTER_SUMMARY_MIN_SLACK
+        ):
+            return
+        recorder.save(scheduling_error=jitter.summary())
+        summarized.update(at=now, count=jitter.count)
 
+    # A start scheduled ahead (e.g. one shared by several devices) is waited for.
+    if clock.now() < start_time:
+        logger.info("Waiting for the scheduled start at %s.", start_time.strftime("%m/%d %H:%M:%S"))
+        wait_until(start_time, clock)
     # Determine the profile cycle length and where the current time is relative to when it was started.
-    cycle_dur = max(df[time_column_name])
-    now = datetime.now()
+    timeline = Timeline(profile, start_time, config["run_continuously"])
+    now = clock.now()
     now = now - timedelta(microseconds=now.microsecond)
-    total_elapsed_time = now - start_time
-    cycle_num = total_elapsed_time // cycle_dur
-    cycle_start = start_time + cycle_num * cycle_dur
-    dur_into_cycle = now - cycle_start
-    if dur_into_cycle > cycle_dur and not config["run_continuously"]:
+    cycle_num, cycle_start, dur_into_cycle = timeline.position(now)
+    if timeline.completed(now):
         logger.info(
             "Duration since start already > profile cycle length. Light controller done."
         )
         controlling = False
-        row_count = len(df) - 1
+        row_count = len(profile) - 1
     else:
-        # Find the next row in the dataframe that is at or after the current elapsed time:
+        # Find the next row in the profile that is at or after the current elapsed time:
         # Note, this may not be the 1st row if a profile is "restarted".
-        row_count = max(0, find_next_row(df, dur_into_cycle) - 1)
-    next_time = df[time_column_name][row_count + 1]
-    intensity = df[intensity_column_name][row_count]
-    logger.info(
-        "%s: Initializing light intensity to %s by pid %s."
-        % (now.strftime("%m/%d %H:%M:%S"), intensity, config['pid'])
-    )
-    update_and_report(now, intensity)
+        row_count = max(0, find_next_row(profile, dur_into_cycle) - 1)
+    next_time = profile.row(min(row_count + 1, len(profile) - 1))[0]
+    intensity = profile.row(row_count)[1]
+    update_and_report("Initializing", now, intensity, cycle_num, row_count)
     last_intensity = intensity
+    scheduled = None
 
     controlling = True
     while controlling:
         # go thru each of the rows
-        while row_count < len(df)-1:
+        while row_count < len(profile)-1:
             if intensity != last_intensity:
                 # Set light intensity
-                logger.info(
-                    "%s: Updating light intensity to %s by pid %s."
-                    % (now.strftime("%m/%d %H:%M:%S"), intensity, config['pid'])
-                )
-                update_and_report(now, intensity)
+                update_and_report("Updating", now, intensity, cycle_num, row_count, scheduled)
                 last_intensity = intensity
 
-            while dur_into_cycle <= next_time:
-                sleep(0.5)
-                now = datetime.now()
-                now = now - timedelta(microseconds=now.microsecond)
+            scheduled = cycle_start + next_time
+            refresh_jitter_summary(scheduled)
+            if REALTIME:
+                # Wake at the scheduled time rather than polling whole seconds.
+                now = wait_until(scheduled, clock)
                 dur_into_cycle = now - cycle_start
+            else:
+                while dur_into_cycle <= next_time:
+                    clock.sleep(0.5)
+                    now = clock.now()
+                    now = now - timedelta(microseconds=now.microsecond)
+                    dur_into_cycle = now - cycle_start
             row_count += 1
             # Extract the "next" row's time and the new intensity:
-            next_time = df[time_column_name][row_count + 1] if row_count < len(df)-1 else df[time_column_name][1]
-            intensity = df[intensity_column_name][row_count]
+            next_time = profile.row(row_count + 1)[0] if row_count < len(profile)-1 else profile.row(1)[0]
+            intensity = profile.row(row_count)[1]
         row_count = 0
         cycle_num += 1
-        now = datetime.now()
+        now = clock.now()
         now = now - timedelta(microseconds=now.microsecond)
-        cycle_start = start_time + cycle_num * cycle_dur
+        cycle_start = timeline.cycle_start(cycle_num)
         dur_into_cycle = now - cycle_start
         controlling = config["run_continuously"]
-        intensity = df[intensity_column_name].iloc[0] if config["run_continuously"] else df[intensity_column_name].iloc[-1]
+        intensity = profile.row(0)[1] if config["run_continuously"] else profile.row(-1)[1]
     if intensity != last_intensity:
-        logger.info(
-            "%s, Final light intensity to %s by pid %s."
-            % (now.strftime("%m/%d %H:%M:%S"), intensity, config['pid'])
-        )
-        update_and_report(now, intensity)
-    config["rpi_time_script_finished"] = datetime.now()
-    config["pid"] = None
-    save_config(config)
+        update_and_report("Final", now, intensity, cycle_num, row_count, scheduled)
+    refresh_jitter_summary()
+    recorder.save(rpi_time_script_finished=clock.now(), pid=None)
+    recorder.close()
@@ -0,0 +1,250 @@
+"""Deploys one profile to several devices at once, all starting it at the same time.
+
+Devices are the web apps listed in data/devices.json, keyed by IP address (or
+"host:port"), each optionally with a "port" (default DEFAULT_PORT). Each selected device
+is deployed to concurrently:
+    1. GET  /api/library/<hash>          does its library already hold the profile,
+                                         simplified the same way?
+    2. POST /api/library                 if not, upload it (the original file, so the
+                                         device's library stores it under the same hash,
+                                         with the simplification settings, so the device
+                                         runs the same simplified profile)
+    3. POST /api/library/<hash>/run      run it from the common "started" time
+Every device is given the same scheduled start a little in the future (start_in seconds),
+so their runs stay in step however long each transfer takes, as long as the devices'
+clocks are synchronized (e.g. by NTP). A device's Light Controller waits for the start.
+
+Devices refuse these requests unless their web app was started with an ADMIN_TOKEN, and
+the same token is passed.
+
+Example, start a looping profile on two devices a minute from now:
+    python3 rpi/fleet_deploy.py profile.xlsx --devices BB8,R2D2 --start-in 60 --loop
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from profile_library import file_hash
+from profile_simplify import DEFAULT_MAX_ERROR, DEFAULT_MIN_DWELL, DEFAULT_TOLERANCE
+
+DEVICES_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "devices.json")
+DEFAULT_PORT: int = 5000
+# Time allowed for every device to receive the profile before the common start.
+DEFAULT_START_DELAY: float = 30
+REQUEST_TIMEOUT: float = 60
+
+logger = logging.getLogger(__name__)
+
+
+def load_devices(path: str = DEVICES_PATH) -> Dict[str, dict]:
+    """Returns the devices in a devices.json, by IP address (or "host:port")."""
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def device_url(key: str, info: dict) -> str:
+    """Returns the base URL of a device's web app, e.g. http://130.20.214.15:5000"""
+    if ":" in key:
+        return f"http://{key}"
+    return f"http://{key}:{info.get('port', DEFAULT_PORT)}"
+
+
+def select_devices(devices: Dict[str, dict], names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Returns the devices whose name or key is in names (case-insensitive), or all of them.
+
+    Raises:
+        ValueError: If a name matches no device.
+    """
+    if not names:
+        return dict(devices)
+    wanted = {name.strip().lower() for name in names}
+    selected = {
+        key: info for key, info in devices.items() if key.lower() in wanted or info.get("name", "").lower() in wanted
+    }
+    found = {key.lower() for key in selected} | {info.get("name", "").lower() for info in selected.values()}
+    missing = wanted - found
+    if missing:
+        raise ValueError(f"Unknown devices: {', '.join(sorted(missing))}")
+    return selected
+
+
+def _call(
+    url: str, token: Optional[str], data: Optional[bytes] = None, content_type: Optional[str] = None
+) -> Optional[dict]:
+    """Makes a request and returns its JSON response, or None if it's a 404."""
+    req = urllib.request.Request(url, data=data)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    if token:
+        req.add_header("X-Admin-Token", token)
+    try:
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+
+def _file_upload(filepath: str, name: str, simplify: Optional[dict] = None) -> tuple:
+    """Encodes a profile upload (and its simplification settings) as a multipart/form-data body and its content type."""
+    boundary = uuid.uuid4().hex
+    with open(filepath, "rb") as infile:
+        content = infile.read()
+    fields = {"name": name}
+    if simplify:
+        fields.update(simplify="1", **{key: str(value) for key, value in simplify.items()})
+    body = b"".join(
+        (
+            *(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+                for key, value in fields.items()
+            ),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="{os.path.basename(filepath)}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode(),
+            content,
+            f"\r\n--{boundary}--\r\n".encode(),
+        )
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def deploy_to_device(
+    key: str,
+    info: dict,
+    filepath: str,
+    content_hash: str,
+    name: str,
+    started: datetime,
+    run_continuous: bool,
+    token: Optional[str] = None,
+    simplify: Optional[dict] = None,
+) -> dict:
+    """Puts a profile on one device, if it isn't already there, and runs it from started.
+
+    A device holding the profile simplified differently (or not at all) is sent it again
+    with the simplification settings, which its library applies to its stored copy.
+
+    Returns (dict):
+        device, address, ok, uploaded (whether the profile had to be sent), latency_s
+        (from the first request to the run starting), started (as the device
+        acknowledged it) and error (if not ok).
+    """
+    base_url = device_url(key, info)
+    result = {"device": info.get("name", key), "address": base_url, "ok": False, "uploaded": False}
+    begun = time.monotonic()
+    try:
+        held = _call(f"{base_url}/api/library/{content_hash}", token)
+        if held is None or (json.loads(held["simplify"]) if held.get("simplify") else None) != simplify:
+            body, content_type = _file_upload(filepath, name, simplify)
+            entry = _call(f"{base_url}/api/library", token, body, content_type)
+            if entry is None or entry["hash"] != content_hash:
+                raise ValueError("the device stored the profile under a different hash")
+            result["uploaded"] = True
+        # Sent with this machine's UTC offset so devices in other time zones start at the same moment.
+        run = json.dumps({"started": started.astimezone().isoformat(), "run_continuous": run_continuous}).encode()
+        response = _call(f"{base_url}/api/library/{content_hash}/run", token, run, "application/json")
+        if response is None:
+            raise ValueError("the device no longer holds the profile")
+        result.update(ok=True, started=response["started"])
+    except (OSError, ValueError, KeyError) as e:
+        result["error"] = str(e)
+        logger.warning("Deploying %s to %s failed: %s", name, base_url, e)
+    result["latency_s"] = round(time.monotonic() - begun, 3)
+    return result
+
+
+def deploy(
+    filepath: str,
+    devices: Dict[str, dict],
+    name: Optional[str] = None,
+    start_in: float = DEFAULT_START_DELAY,
+    run_continuous: bool = False,
+    token: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    simplify: Optional[dict] = None,
+) -> dict:
+    """Deploys a profile to devices concurrently, all to start at the same time.
+
+    Arguments:
+        filepath (str): The profile, as it would be uploaded to /run.
+        devices (dict): The devices to deploy to, as in devices.json.
+        name (str): Name to catalog the profile by on the devices (default: its file name).
+        start_in (float): Seconds from now every device starts the profile.
+        run_continuous (bool): Loop the profile rather than run it once.
+        token (str): The devices' ADMIN_TOKEN.
+        content_hash (str): The file's sha256, if already known.
+        simplify (dict): tolerance, min_dwell and max_error for the devices to simplify it
+            with (see profile_simplify), or None to run it as it is.
+
+    Returns (dict):
+        hash, started and a result per device (see deploy_to_device).
+    """
+    content_hash = content_hash or file_hash(filepath)
+    name = name or os.path.basename(filepath)
+    now = datetime.now()
+    started = now - timedelta(microseconds=now.microsecond) + timedelta(seconds=round(start_in))
+    logger.info("Deploying %s (%s) to %s devices from %s", name, content_hash, len(devices), started)
+    with ThreadPoolExecutor(max_workers=max(1, len(devices))) as executor:
+        futures = [
+            executor.submit(
+                deploy_to_device, key, info, filepath, content_hash, name, started, run_continuous, token, simplify
+            )
+            for key, info in devices.items()
+        ]
+        results = [future.result() for future in futures]
+    return {"hash": content_hash, "started": started.isoformat(), "devices": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("profile", help="Profile file to deploy.")
+    parser.add_argument("--devices", default="", help="Comma separated device names or addresses (default: all).")
+    parser.add_argument("--devices-file", default=DEVICES_PATH)
+    parser.add_argument("--name", help="Name to catalog the profile by (default: its file name).")
+    parser.add_argument("--start-in", type=float, default=DEFAULT_START_DELAY, help="Seconds until the common start.")
+    parser.add_argument("--loop", action="store_true", help="Run the profile continuously.")
+    parser.add_argument("--token", default=os.environ.get("ADMIN_TOKEN"), help="The devices' ADMIN_TOKEN.")
+    parser.add_argument("--simplify", action="store_true", help="Have the devices simplify the profile.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="See profile_simplify.py.")
+    parser.add_argument("--min-dwell", type=float, default=DEFAULT_MIN_DWELL, help="See profile_simplify.py.")
+    parser.add_argument("--max-error", type=float, default=DEFAULT_MAX_ERROR, help="See profile_simplify.py.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    try:
+        devices = select_devices(load_devices(args.devices_file), args.devices.split(",") if args.devices else None)
+    except ValueError as e:
+        parser.error(str(e))
+    simplify = (
+        {"tolerance": args.tolerance, "min_dwell": args.min_dwell, "max_error": args.max_error}
+        if args.simplify
+        else None
+    )
+    results = deploy(args.profile, devices, args.name, args.start_in, args.loop, args.token, simplify=simplify)
+    print(f"{os.path.basename(args.profile)} ({results['hash'][:12]}) starts at {results['started']}")
+    print(f"{'device':<16}{'address':<32}{'result':<10}{'sent':<6}{'latency s':>10}")
+    for result in results["devices"]:
+        print(
+            f"{result['device']:<16}{result['address']:<32}{'ok' if result['ok'] else 'FAILED':<10}"
+            f"{'yes' if result['uploaded'] else 'no':<6}{result['latency_s']:>10}"
+            + (f"  {result['error']}" if not result["ok"] else "")
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=4)
+    sys.exit(0 if all(result["ok"] for result in results["devices"]) else 1)
+
+
+if __name__ == "__main__":
+    main()
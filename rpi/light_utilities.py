@@ -11,27 +11,28 @@ import serial
 # can be set up by the reboot_climate_web_app.sh.
 COMM_PORT = "/dev/ttyACM0"
 BAUD_RATE = 9600
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# class Arduino:
-#     """A dummy Arduino class to facilitate testing.
+# Set FAKE_ARDUINO=1 to run without lights (e.g. for development or load testing).
+FAKE_ARDUINO = os.environ.get("FAKE_ARDUINO", "").lower() in ("1", "true", "yes")
 
-#     To use uncomment this class, comment out the `ARDUINO = serial.Serial...` line below,
-#     and uncomment the `ARDUINO = Arduino()` line below that.
-#     """
 
-#     def __init__(self) -> None:
-#         self.is_open = True
+class Arduino:
+    """A dummy Arduino class to facilitate testing.
 
-#     def write(self, message):
-#         print(f"Sent to Arduino: {message}")
+    Used in place of the serial connection when the FAKE_ARDUINO environment variable is set.
+    """
+
+    def __init__(self) -> None:
+        self.is_open = True
+
+    def write(self, message):
+        logger.debug("Sent to Arduino: %s", message)
 
 
 try:
-    ARDUINO = serial.Serial(port=COMM_PORT, baudrate=BAUD_RATE)
-    # ARDUINO = Arduino()
+    ARDUINO = Arduino() if FAKE_ARDUINO else serial.Serial(port=COMM_PORT, baudrate=BAUD_RATE)
     IS_ARDUINO_SETUP = True
 
 except Exception as e:
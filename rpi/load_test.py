@@ -0,0 +1,306 @@
+"""Local load test of the climate web app with a stand-in Arduino.
+
+Starts the web app on this machine with FAKE_ARDUINO set and its static/live folders in a
+temporary directory, replays a mix of page views, profile views and profile uploads from
+concurrent simulated users, then reports request latency percentiles, error rates and the
+CPU and memory used by the web app (including any Light Controller it spawned).
+
+Example, 20 users for 2 minutes:
+    python3 rpi/load_test.py --users 20 --duration 120 --json results.json
+"""
+import argparse
+import json
+import logging
+import mimetypes
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import numpy as np
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+
+RPI_FOLDER: str = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROFILES: List[str] = sorted(glob(os.path.join(RPI_FOLDER, "default_profiles", "*.xlsx")))
+# Relative weights of each kind of traffic: view 'live' (with its plot), open the viewer,
+# upload a profile to the viewer, open the run page and upload and run a new profile.
+DEFAULT_MIX: str = "live=10,viewer=3,view_upload=3,run_page=2,run_upload=1"
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Reports redirects as responses rather than following them."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_OPENER = urllib.request.build_opener(_NoRedirect)
+
+
+def _multipart(fields: Dict[str, str], files: Dict[str, str]) -> Tuple[bytes, str]:
+    """Encodes form fields and files as a multipart/form-data body."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, path in files.items():
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        with open(path, "rb") as infile:
+            content = infile.read()
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{os.path.basename(path)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+            + content
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def request(url: str, data: Optional[bytes] = None, content_type: Optional[str] = None) -> int:
+    """Makes a request and reads the whole response.
+
+    Returns (int):
+        The HTTP status code. Redirects and HTTP errors are returned, not raised.
+    """
+    req = urllib.request.Request(url, data=data)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    try:
+        with _OPENER.open(req, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class LoadTest:
+    """Replays mixed traffic against a web app and records what happened.
+
+    Attributes:
+        base_url (str): The web app's address, e.g. http://127.0.0.1:5050
+        profiles (list): Profile files used for uploads.
+        mix (dict): Relative weight of each action.
+        results (list): (action, seconds, ok) of every completed action.
+    """
+
+    def __init__(self, base_url: str, profiles: List[str], mix: Dict[str, float], seed: int = 0):
+        """Initializes the LoadTest class."""
+        self.base_url = base_url
+        self.profiles = profiles
+        self.mix = mix
+        self.results: List[Tuple[str, float, bool]] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def live(self) -> bool:
+        ok = request(self.base_url + "/live") == 200
+        return request(self.base_url + "/static/live/live_plot.png") in (200, 404) and ok
+
+    def viewer(self) -> bool:
+        return request(self.base_url + "/viewer") == 200
+
+    def view_upload(self) -> bool:
+        body, content_type = _multipart({}, {"file": self._random.choice(self.profiles)})
+        ok = request(self.base_url + "/viewer", body, content_type) == 200
+        return request(self.base_url + "/display_plot") in (200, 302) and ok
+
+    def run_page(self) -> bool:
+        return request(self.base_url + "/run") == 200
+
+    def run_upload(self) -> bool:
+        body, content_type = _multipart(
+            {"run_continuous": "loop"}, {"file": self._random.choice(self.profiles)}
+        )
+        return request(self.base_url + "/run", body, content_type) in (200, 302)
+
+    def user(self, deadline: float) -> None:
+        """Acts as one user, performing randomly chosen actions until the deadline."""
+        actions, weights = zip(*self.mix.items())
+        while time.monotonic() < deadline:
+            with self._lock:
+                action = self._random.choices(actions, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = getattr(self, action)()
+            except Exception as e:
+                logger.debug("%s failed: %s", action, e)
+                ok = False
+            with self._lock:
+                self.results.append((action, time.perf_counter() - start, ok))
+
+    def run(self, users: int, duration: float) -> None:
+        """Runs the given number of concurrent users for duration seconds."""
+        deadline = time.monotonic() + duration
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            for _ in range(users):
+                pool.submit(self.user, deadline)
+
+    def summary(self) -> dict:
+        """Returns latency percentiles (ms) and error rates overall and per action."""
+        summary = {}
+        for action in ["all"] + list(self.mix):
+            rows = [r for r in self.results if action in ("all", r[0])]
+            if not rows:
+                continue
+            latencies = np.array([r[1] for r in rows]) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary[action] = {
+                "count": len(rows),
+                "error_rate": sum(not r[2] for r in rows) / len(rows),
+                "p50_ms": round(p50, 1),
+                "p95_ms": round(p95, 1),
+                "p99_ms": round(p99, 1),
+            }
+        return summary
+
+
+class ResourceMonitor(threading.Thread):
+    """Samples the CPU and resident memory of a process and its children."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        """Initializes the ResourceMonitor class."""
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self._stop_event = threading.Event()
+        self._tracked: Dict[int, psutil.Process] = {}
+
+    def _processes(self) -> List[psutil.Process]:
+        # Keep the same Process objects between samples so cpu_percent has a baseline.
+        current = [self.process] + self.process.children(recursive=True)
+        self._tracked = {p.pid: self._tracked.get(p.pid, p) for p in current}
+        return list(self._tracked.values())
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            cpu, rss = 0.0, 0
+            for proc in self._processes():
+                try:
+                    cpu += proc.cpu_percent()
+                    rss += proc.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            self.cpu_percent.append(cpu)
+            self.rss_mb.append(rss / 1e6)
+
+    def stop(self) -> dict:
+        """Stops sampling and returns the mean and max CPU (%) and RSS (MB)."""
+        self._stop_event.set()
+        self.join()
+        if not self.cpu_percent:
+            return {}
+        return {
+            "cpu_mean_percent": round(float(np.mean(self.cpu_percent)), 1),
+            "cpu_max_percent": round(float(np.max(self.cpu_percent)), 1),
+            "rss_mean_mb": round(float(np.mean(self.rss_mb)), 1),
+            "rss_max_mb": round(float(np.max(self.rss_mb)), 1),
+        }
+
+
+def start_app(static_folder: str, port: int) -> subprocess.Popen:
+    """Starts the web app with a fake Arduino and the given static folder."""
+    os.makedirs(os.path.join(static_folder, "live"), exist_ok=True)
+    env = dict(
+        os.environ,
+        FAKE_ARDUINO="1",
+        CLIMATE_STATIC_FOLDER=static_folder,
+        CLIMATE_LOG_FOLDER=os.path.join(static_folder, "logs"),
+    )
+    command = (
+        "import climate_web_interface as web; "
+        f"web.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    )
+    server = subprocess.Popen([sys.executable, "-c", command], cwd=RPI_FOLDER, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if request(f"http://127.0.0.1:{port}/") == 200:
+                return server
+        except OSError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.25)
+    server.kill()
+    raise RuntimeError("The web app did not start.")
+
+
+def stop_app(server: subprocess.Popen) -> None:
+    """Stops the web app and any Light Controller it started."""
+    try:
+        children = psutil.Process(server.pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        children = []
+    for child in children:
+        child.kill()
+    server.terminate()
+    server.wait(timeout=10)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parses "action=weight,..." into a dict, checking the actions exist."""
+    weights = {}
+    for item in mix.split(","):
+        action, weight = item.split("=")
+        if not callable(getattr(LoadTest, action.strip(), None)):
+            raise ValueError(f"Unknown action: {action}")
+        weights[action.strip()] = float(weight)
+    return weights
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of traffic to replay.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Traffic weights (default: {DEFAULT_MIX}).")
+    parser.add_argument("--profiles", nargs="+", default=DEFAULT_PROFILES, help="Profiles to upload.")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for a repeatable traffic sequence.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="climate_load_test_") as static_folder:
+        server = start_app(static_folder, args.port)
+        try:
+            test = LoadTest(f"http://127.0.0.1:{args.port}", args.profiles, parse_mix(args.mix), args.seed)
+            # Start a profile so 'live' has something to show.
+            test.run_upload()
+            monitor = ResourceMonitor(server.pid)
+            monitor.start()
+            logger.info("Running %s users for %s seconds...", args.users, args.duration)
+            test.run(args.users, args.duration)
+            resources = monitor.stop()
+        finally:
+            stop_app(server)
+
+    results = {"users": args.users, "duration_s": args.duration, "requests": test.summary(), "server": resources}
+    print(f"{'action':<12}{'count':>8}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action, row in results["requests"].items():
+        print(
+            f"{action:<12}{row['count']:>8}{row['error_rate']:>9.1%}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+    print(", ".join(f"{key}: {value}" for key, value in resources.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Persistent, non-blocking logging to size-rotated JSON lines files.
+
+Each process logs through a QueueHandler: a log call only formats its message and puts the
+record on a queue, and a background QueueListener thread writes it to the process' own
+<name>.log in LOG_FOLDER (rotated at LOG_MAX_BYTES, keeping LOG_BACKUPS old files) and to
+the console (e.g. the tmux session). The web app logs to web_app.log and the Light
+Controller, a separate process, to controller.log, so no two processes ever write or
+rotate the same file.
+
+Each line is a JSON object with time, level, logger, pid, process and message, plus any
+structured fields passed in a log call's extra, e.g. the Light Controller's cycle,
+intensity and sched_error, so weeks of logs can be filtered by field:
+    python3 rpi/log_files.py controller --level WARNING --field cycle=12
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+from datetime import datetime
+from glob import glob
+from typing import Dict, Iterator, List, Optional
+
+LOG_FOLDER: str = os.environ.get(
+    "CLIMATE_LOG_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+)
+LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES: int = 10 * 1024 * 1024
+LOG_BACKUPS: int = 10
+CONSOLE_FORMAT: str = "%(levelname)s:%(name)s:%(message)s"
+# Attributes every LogRecord has; any others were passed in extra and are logged as fields.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+logger = logging.getLogger(__name__)
+
+# This process' listener, what stops it at exit, and the pid and name it was set up for.
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_STOP_AT_EXIT: Optional[multiprocessing.util.Finalize] = None
+_CONFIGURED: Optional[tuple] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed in extra."""
+
+    def __init__(self, process_name: str):
+        """Initializes the JsonLinesFormatter class."""
+        super().__init__()
+        self.process_name = process_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "process": self.process_name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                line[key] = value
+        return json.dumps(line, default=str)
+
+
+def log_path(process_name: str, folder: str = LOG_FOLDER) -> str:
+    """Returns the path of a process' current log file."""
+    return os.path.join(folder, f"{process_name}.log")
+
+
+def setup_logging(process_name: str, folder: str = LOG_FOLDER, level: str = LOG_LEVEL) -> None:
+    """Sends this process' logs through a queue to its own rotating log file and the console.
+
+    Replaces any handlers already on the root logger, including ones inherited from the
+    parent of a forked process (whose listener thread doesn't exist in the child). Calling
+    it again in the same process with the same name does nothing.
+
+    Arguments:
+        process_name (str): Names the log file, e.g. "web_app" or "controller".
+        folder (str): Where log files are kept.
+        level (str): The root logger's level.
+    """
+    global _LISTENER, _STOP_AT_EXIT, _CONFIGURED
+    if _CONFIGURED == (os.getpid(), process_name):
+        return
+    if _LISTENER is not None and _CONFIGURED[0] == os.getpid():
+        # A stopped listener can't be stopped again at exit.
+        _STOP_AT_EXIT.cancel()
+        _LISTENER.stop()
+    os.makedirs(folder, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_path(process_name, folder), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonLinesFormatter(process_name))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    _LISTENER = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _LISTENER.start()
+    _CONFIGURED = (os.getpid(), process_name)
+    # Writes out whatever is still queued when the process exits. A multiprocessing child
+    # (e.g. the Light Controller) ends with os._exit, skipping atexit, but runs these
+    # finalizers first; the main process runs them at exit.
+    _STOP_AT_EXIT = multiprocessing.util.Finalize(None, _LISTENER.stop, exitpriority=10)
+    logger.debug("Logging to %s", log_path(process_name, folder))
+
+
+def search_logs(
+    process_name: str,
+    folder: str = LOG_FOLDER,
+    level: Optional[str] = None,
+    since: Optional[datetime] = None,
+    fields: Optional[Dict[str, str]] = None,
+) -> Iterator[dict]:
+    """Yields a process' log lines, oldest first across rotated files, that match filters.
+
+    Arguments:
+        process_name (str): Whose logs, e.g. "web_app" or "controller".
+        folder (str): Where log files are kept.
+        level (str): Only lines at this level or above.
+        since (datetime): Only lines logged at or after this time.
+        fields (dict): Only lines whose fields equal these values (compared as strings).
+
+    Returns (iterator of dict):
+        The matching lines.
+    """
+    path = log_path(process_name, folder)
+    # <name>.log.10 is the oldest, <name>.log the newest.
+    rotated = sorted(glob(path + ".*"), key=lambda name: int(name.rsplit(".", 1)[1]), reverse=True)
+    min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+    since_text = since.isoformat(timespec="milliseconds") if since else None
+    for filepath in rotated + [path]:
+        if not os.path.exists(filepath):
+            continue
+        with open(filepath, "r", encoding="utf-8") as infile:
+            for text in infile:
+                try:
+                    line = json.loads(text)
+                except ValueError:
+                    continue
+                # ISO times of the same length compare in time order as strings.
+                if since_text and line["time"] < since_text:
+                    continue
+                if logging.getLevelName(line["level"]) < min_level:
+                    continue
+                if fields and any(str(line.get(key)) != value for key, value in fields.items()):
+                    continue
+                yield line
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Search a process' JSON lines logs.")
+    parser.add_argument("process", choices=("web_app", "controller"))
+    parser.add_argument("--folder", default=LOG_FOLDER)
+    parser.add_argument("--level", help="Minimum level, e.g. WARNING.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="ISO date/time, e.g. 2024-05-01T06:00.")
+    parser.add_argument("--field", action="append", default=[], help="key=value, e.g. cycle=12. Repeatable.")
+    args = parser.parse_args(argv)
+    fields = dict(field.split("=", 1) for field in args.field)
+    for line in search_logs(args.process, args.folder, args.level, args.since, fields):
+        print(json.dumps(line))
+
+
+if __name__ == "__main__":
+    main()
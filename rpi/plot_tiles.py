@@ -0,0 +1,261 @@
+"""A zoomable pyramid of plot tiles of a running profile's schedule and applied intensities.
+
+Tile i at zoom level z covers [started + i * span, started + (i + 1) * span) where span is
+ZOOM_SPANS[z], so any cycle of a multi-week looping run can be panned to and zoomed into
+down to a minute. Tiles are rendered on first request, each as a min/max envelope of the
+steps in every pixel column so even a week of 1 second steps draws in constant time, and
+kept in an on-disk LRU cache.
+
+A tile's cache key is the profile (path, size and modification time), when it started,
+whether it loops, the tile's range and how far the applied-intensity history has reached
+into it: not yet, the time of the last applied intensity while it's growing inside the
+range, or complete once it has passed the end. The tile containing the present also keys
+on a coarse bucket of the current time so its now-line keeps up. So a tile is rendered
+again only when what's in its time range changes.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+import matplotlib.dates as mdates
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from matplotlib.figure import Figure
+from typing import Callable, Iterator, Optional, Tuple
+from profile_export import iter_applied_history, iter_schedule
+from timeline import Timeline
+
+# Time spanned by one tile at each zoom level, from most zoomed out.
+ZOOM_SPANS: Tuple[timedelta, ...] = (
+    timedelta(days=7),
+    timedelta(days=1),
+    timedelta(hours=6),
+    timedelta(hours=1),
+    timedelta(minutes=10),
+    timedelta(minutes=1),
+)
+TILE_WIDTH_PX: int = 600
+TILE_HEIGHT_PX: int = 400
+_TILE_DPI: int = 100
+TILE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+# The tile containing the present is rendered again each time the present moves on by this
+# fraction of its span, but no more often than NOW_BUCKET_MIN.
+NOW_BUCKETS_PER_TILE: int = 100
+NOW_BUCKET_MIN: timedelta = timedelta(seconds=5)
+
+logger = logging.getLogger(__name__)
+
+
+def tile_range(started: datetime, zoom: int, index: int) -> Tuple[datetime, datetime]:
+    """Returns the (start, end) times covered by a tile."""
+    span = ZOOM_SPANS[zoom]
+    return started + index * span, started + (index + 1) * span
+
+
+def _history_state(last_updated: Optional[datetime], start: datetime, end: datetime) -> Optional[str]:
+    """Returns how far the applied-intensity history has reached into a tile's range.
+
+    None before it reaches the range, the last applied time while within it and
+    "complete" once it has passed the end.
+    """
+    if not last_updated or last_updated < start:
+        return None
+    if last_updated >= end:
+        return "complete"
+    return last_updated.isoformat()
+
+
+def _now_bucket(now: datetime, start: datetime, end: datetime) -> Optional[int]:
+    """Returns which coarse bucket of a tile's range the present is in, None outside it."""
+    if not start <= now < end:
+        return None
+    return (now - start) // max((end - start) / NOW_BUCKETS_PER_TILE, NOW_BUCKET_MIN)
+
+
+def tile_key(config: dict, zoom: int, index: int, now: Optional[datetime] = None) -> str:
+    """Returns the cache file name of a tile of the live profile described by config.
+
+    Arguments:
+        config (dict): The live climate config, as returned by RETRIEVE_CONFIG.
+        zoom (int): Zoom level, an index into ZOOM_SPANS.
+        index (int): Tile number at that zoom level, from when the profile started.
+        now (datetime): The present (default: now).
+
+    Returns (str):
+        A file name that changes whenever what the tile shows changes.
+    """
+    start, end = tile_range(config["_started"], zoom, index)
+    stat = os.stat(config["_profile_filepath"])
+    last_updated = config["last_updated"]
+    fingerprint = [
+        config["_profile_filepath"],
+        stat.st_size,
+        stat.st_mtime_ns,
+        config["_started"].isoformat(),
+        config["run_continuously"],
+        zoom,
+        index,
+        # Applied intensities are only appended, so a tile only changes while they're
+        # arriving within its range, and once they've passed it it's complete.
+        _history_state(last_updated, start, end),
+        # The now-line of the tile containing the present moves without anything being applied.
+        _now_bucket(now or datetime.now(), start, end),
+    ]
+    digest = hashlib.sha1(json.dumps(fingerprint).encode()).hexdigest()[:16]
+    return f"{zoom}_{index}_{digest}.png"
+
+
+def envelope(
+    chunks: Iterator, start: datetime, end: datetime, buckets: int, until: Optional[datetime] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reduces a step function to its minimum and maximum in each of equal time buckets.
+
+    Arguments:
+        chunks (iterator of DataFrame): Steps in time order with "time" and "intensity" columns.
+        start (datetime): Start of the first bucket.
+        end (datetime): End of the last bucket.
+        buckets (int): Number of buckets.
+        until (datetime): Buckets starting after this are left empty (NaN).
+
+    Returns (tuple):
+        (bucket edges as datetime64, minimums, maximums). Buckets before the first
+        step are NaN; later buckets without steps hold the previous step's intensity.
+    """
+    start64 = np.datetime64(start, "us")
+    width = (np.datetime64(end, "us") - start64) / buckets
+    lows = np.full(buckets, np.nan)
+    highs = np.full(buckets, np.nan)
+    lasts = np.full(buckets, np.nan)
+    for chunk in chunks:
+        times = chunk["time"].to_numpy(dtype="datetime64[us]")
+        values = chunk["intensity"].to_numpy(dtype=np.float64)
+        bins = np.clip(((times - start64) / width).astype(np.int64), 0, buckets - 1)
+        np.fmin.at(lows, bins, values)
+        np.fmax.at(highs, bins, values)
+        # Steps are in time order so the last assignment to a bucket is its last step.
+        lasts[bins] = values
+    # Carry each bucket's last intensity forward through buckets without steps and into
+    # the start of the next bucket with steps.
+    filled = np.where(np.isnan(lasts), 0, np.arange(buckets))
+    carried = lasts[np.maximum.accumulate(filled)]
+    previous = np.concatenate(([np.nan], carried[:-1]))
+    lows = np.fmin(lows, previous)
+    highs = np.fmax(highs, previous)
+    edges = start64 + width * np.arange(buckets + 1)
+    if until is not None:
+        after = edges[:-1] > np.datetime64(until, "us")
+        lows[after] = np.nan
+        highs[after] = np.nan
+    return edges, lows, highs
+
+
+def render_tile(
+    timeline: Timeline,
+    history_path: str,
+    start: datetime,
+    end: datetime,
+    path: str,
+    now: Optional[datetime] = None,
+) -> None:
+    """Renders the schedule and applied intensities between start and end as a png.
+
+    Arguments:
+        timeline (Timeline): The profile being run.
+        history_path (str): Path of the Light Controller's applied-intensity history csv.
+        start (datetime): Start of the tile.
+        end (datetime): End of the tile.
+        path (str): Where to save the png.
+        now (datetime): Applied intensities aren't drawn past this time (default: now).
+    """
+    now = now or datetime.now()
+    buckets = TILE_WIDTH_PX
+    fig = Figure(figsize=(TILE_WIDTH_PX / _TILE_DPI, TILE_HEIGHT_PX / _TILE_DPI), dpi=_TILE_DPI)
+    ax = fig.add_subplot()
+    for chunks, label, color, until in (
+        (iter_schedule(timeline, start, end), "Scheduled", "tab:blue", None),
+        (iter_applied_history(history_path, start, end), "Applied", "tab:orange", now),
+    ):
+        edges, lows, highs = envelope(chunks, start, end, buckets, until)
+        if np.isnan(lows).all():
+            continue
+        # Close the last bucket so the step lines reach the end of the tile.
+        lows, highs = np.append(lows, lows[-1]), np.append(highs, highs[-1])
+        ax.fill_between(edges, lows, highs, step="post", color=color, alpha=0.3, linewidth=0)
+        ax.step(edges, lows, where="post", color=color, linewidth=1, label=label)
+        ax.step(edges, highs, where="post", color=color, linewidth=1)
+    if start <= now < end:
+        ax.axvline(x=now, linestyle="--", color="r")
+    ax.set_xlim(start, end)
+    ax.set_ylim(-2, 105)
+    ax.grid(True)
+    span = end - start
+    time_fmt = "%m/%d" if span > timedelta(days=1) else "%m/%d %H:%M" if span > timedelta(minutes=10) else "%H:%M:%S"
+    ax.xaxis.set_major_formatter(mdates.DateFormatter(time_fmt))
+    ax.set_title(f"{start:%m/%d %H:%M:%S} - {end:%m/%d %H:%M:%S}", fontsize="small")
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(loc="upper right", fontsize="small")
+    fig.autofmt_xdate(rotation=90, ha="center")
+    fig.tight_layout()
+    fig.savefig(path, format="png")
+
+
+class TileCache:
+    """A folder of rendered tiles, evicting the least recently used beyond a size limit.
+
+    Attributes:
+        folder (str): Where tiles are kept. Tiles already there are reused.
+        max_bytes (int): Total size of tiles kept.
+
+    Methods:
+        get: Returns the path of a tile, rendering it first if it isn't cached.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        """Initializes the TileCache class."""
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # Tile name -> size, from least to most recently used.
+        self._tiles: "OrderedDict[str, int]" = OrderedDict()
+        existing = [entry for entry in os.scandir(folder) if entry.name.endswith(".png")]
+        for entry in sorted(existing, key=lambda entry: entry.stat().st_mtime):
+            self._tiles[entry.name] = entry.stat().st_size
+        self._bytes: int = sum(self._tiles.values())
+
+    def get(self, name: str, render: Callable[[str], None]) -> str:
+        """Returns the path of a cached tile, first calling render(path) if it isn't cached.
+
+        Arguments:
+            name (str): The tile's cache file name (see tile_key).
+            render (callable): Renders the tile to the path it's given.
+
+        Returns (str):
+            The tile's path.
+        """
+        path = os.path.join(self.folder, name)
+        with self._lock:
+            if name in self._tiles and os.path.exists(path):
+                self._tiles.move_to_end(name)
+                # Keep the order on disk for when the cache is reloaded.
+                os.utime(path)
+                return path
+        # Render outside the lock (so other tiles are served meanwhile) and move the tile
+        # into place in one step so it's never read half written.
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        render(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += os.path.getsize(path) - self._tiles.pop(name, 0)
+            self._tiles[name] = os.path.getsize(path)
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                evicted, size = self._tiles.popitem(last=False)
+                self._bytes -= size
+                try:
+                    os.remove(os.path.join(self.folder, evicted))
+                except FileNotFoundError:
+                    pass
+        logger.debug("Rendered tile %s", name)
+        return path
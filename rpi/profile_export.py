@@ -0,0 +1,198 @@
+"""Generators that stream profile schedules and applied-intensity history as csv or parquet.
+
+Everything is produced in chunks of at most EXPORT_CHUNK_ROWS rows so months of data can be
+exported in constant memory without temporary files.
+"""
+import io
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from compiled_profile import WINDOW_ROWS
+from timeline import Timeline
+
+EXPORT_CHUNK_ROWS: int = WINDOW_ROWS * 16
+EXPORT_FORMATS: dict = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+
+    IS_PARQUET_AVAILABLE = True
+except ImportError:
+    IS_PARQUET_AVAILABLE = False
+
+
+def iter_schedule(timeline: Timeline, start: datetime, end: datetime) -> Iterator[pd.DataFrame]:
+    """Yields the scheduled (time, intensity) steps of a running profile between start and end.
+
+    The step in effect at start is yielded with its time set to start. When looping, the
+    last row of each cycle is replaced by the first row of the next, yielded at the start
+    of the next cycle even if its own time is later, as the Light Controller does.
+
+    Arguments:
+        timeline (Timeline): The profile being run, when it started and whether it loops.
+        start (datetime): Start of the range to export.
+        end (datetime): End of the range to export.
+
+    Yields (DataFrame):
+        Chunks with "time" (datetime64) and "intensity" columns.
+    """
+    profile = timeline.profile
+    loops = timeline.run_continuously and timeline.cycle_duration > timedelta(0)
+    rows_per_cycle = len(profile) - 1 if loops else len(profile)
+    start = max(start, timeline.started)
+    cycle_num, cycle_start, dur_into_cycle = timeline.position(start)
+    # Begin at the step in effect at the start of the range.
+    row = max(0, int(profile.search(dur_into_cycle.total_seconds(), side="right")) - 1)
+    first = True
+    while True:
+        if cycle_start > end or (cycle_num and not loops):
+            return
+        while row < rows_per_cycle:
+            seconds, intensities = profile.window(row, min(row + EXPORT_CHUNK_ROWS, rows_per_cycle))
+            times = np.datetime64(cycle_start, "us") + (seconds * 1e6).astype("timedelta64[us]")
+            if first:
+                times[0] = np.datetime64(start, "us")
+                first = False
+            elif row == 0:
+                times[0] = np.datetime64(cycle_start, "us")
+            in_range = times <= np.datetime64(end, "us")
+            if in_range.any():
+                yield pd.DataFrame({"time": times[in_range], "intensity": intensities[in_range]})
+            if not in_range.all():
+                return
+            row += len(seconds)
+        cycle_num += 1
+        cycle_start = timeline.cycle_start(cycle_num)
+        row = 0
+
+
+def iter_applied_history(
+    path: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Iterator[pd.DataFrame]:
+    """Yields rows of the Light Controller's applied-intensity history between start and end.
+
+    Arguments:
+        path (str): Path of the history csv.
+        start (datetime): Start of the range to export, or None for the beginning.
+        end (datetime): End of the range to export, or None for the end.
+
+    Yields (DataFrame):
+        Chunks with "time", "intensity" and "scheduled_time" columns.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as infile:
+        columns = infile.readline().decode("utf-8").strip().split(",")
+        # Skip straight to the first row at or after start rather than parsing every row before it.
+        offset = _history_offset(infile, start) if start else infile.tell()
+        if offset >= os.fstat(infile.fileno()).st_size:
+            return
+        infile.seek(offset)
+        # Times written on a whole second have no fraction, so the format can vary by row.
+        for chunk in pd.read_csv(
+            infile,
+            names=columns,
+            header=None,
+            chunksize=EXPORT_CHUNK_ROWS,
+            parse_dates=["time", "scheduled_time"],
+            date_format="ISO8601",
+        ):
+            if start:
+                chunk = chunk[chunk["time"] >= start]
+            if end:
+                if len(chunk) and chunk["time"].iloc[0] > end:
+                    return
+                chunk = chunk[chunk["time"] <= end]
+            if len(chunk):
+                yield chunk
+
+
+def _history_time(line: bytes) -> Optional[datetime]:
+    """Returns the applied time of a history csv row, or None if the row is incomplete."""
+    try:
+        return datetime.fromisoformat(line.split(b",", 1)[0].decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _history_offset(infile, when: datetime) -> int:
+    """Returns the byte offset of the first history row applied at or after a moment.
+
+    Rows are appended in the order they're applied, so the file is bisected by byte
+    offset, reading one row at each step, instead of being parsed from the start.
+
+    Arguments:
+        infile (file): The history csv, opened in binary mode.
+        when (datetime): The moment.
+
+    Returns (int):
+        The offset, the end of the file if every row is before the moment.
+    """
+    infile.seek(0)
+    infile.readline()
+    low = max(infile.tell(), 1)
+    high = infile.seek(0, os.SEEK_END)
+    while low < high:
+        mid = (low + high) // 2
+        # Move to the start of the first row starting at or after mid.
+        infile.seek(mid - 1)
+        infile.readline()
+        line = infile.readline()
+        applied = _history_time(line) if line.endswith(b"\n") else None
+        if applied is None or applied >= when:
+            high = mid
+        else:
+            low = infile.tell()
+    infile.seek(low - 1)
+    infile.readline()
+    return infile.tell()
+
+
+def stream_csv(chunks: Iterator[pd.DataFrame]) -> Iterator[str]:
+    """Serializes dataframe chunks as one csv, yielding the text of each chunk."""
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file that hands back whatever has been written since it was last asked."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Serializes dataframe chunks as one parquet file, one row group per chunk."""
+    sink = _ChunkSink()
+    writer = None
+    for chunk in chunks:
+        table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
@@ -0,0 +1,299 @@
+"""A persistent library of uploaded profiles, deduplicated by content, with an SQLite catalog.
+
+Each distinct profile is kept once, as <sha256><original extension> alongside its compiled
+<sha256>.npy and a preview thumbnail <sha256>.png, in the library folder. The catalog
+(catalog.sqlite) records its name, hash, row count, cycle length, intensity range, upload
+time and when it was last run, indexed by name and upload time, so listing, searching and
+re-launching a stored profile never re-reads or re-parses it.
+
+A profile may be simplified when it's added (see profile_simplify). The simplified form,
+<sha256>.simplified.npy, is what's run, plotted and described in the catalog (along with
+the settings, the original row count and the measured maximum deviation) while the
+original is kept for download.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from contextlib import closing
+from datetime import datetime, timedelta
+from matplotlib.figure import Figure
+from typing import List, Optional, Tuple
+from werkzeug.utils import secure_filename
+from climate_web_utilities import compile_valid_profile, compiled_profile_path
+from compiled_profile import COMPILED_EXT, WINDOW_ROWS, CompiledProfile
+from plot_tiles import envelope
+from profile_export import iter_schedule
+from profile_simplify import simplify_profile
+from timeline import Timeline
+
+CATALOG_NAME: str = "catalog.sqlite"
+SIMPLIFIED_SUFFIX: str = ".simplified"
+THUMBNAIL_WIDTH_PX: int = 300
+THUMBNAIL_HEIGHT_PX: int = 120
+_THUMBNAIL_DPI: int = 100
+_HASH_CHUNK_BYTES: int = 1 << 20
+# Rows read at a time when computing a profile's intensity range.
+_STATS_CHUNK_ROWS: int = WINDOW_ROWS * 64
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS profiles (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL COLLATE NOCASE,
+    extension TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    cycle_seconds REAL NOT NULL,
+    min_intensity REAL,
+    max_intensity REAL,
+    uploaded TEXT NOT NULL,
+    last_run TEXT,
+    original_rows INTEGER,
+    simplify TEXT,
+    max_deviation REAL
+);
+CREATE INDEX IF NOT EXISTS profiles_name ON profiles (name);
+CREATE INDEX IF NOT EXISTS profiles_uploaded ON profiles (uploaded);
+"""
+_COLUMNS: Tuple[str, ...] = (
+    "hash",
+    "name",
+    "extension",
+    "rows",
+    "cycle_seconds",
+    "min_intensity",
+    "max_intensity",
+    "uploaded",
+    "last_run",
+    "original_rows",
+    "simplify",
+    "max_deviation",
+)
+# Columns added since the catalog was first created, added to older catalogs when opened.
+_ADDED_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("original_rows", "INTEGER"),
+    ("simplify", "TEXT"),
+    ("max_deviation", "REAL"),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(filepath: str) -> str:
+    """Returns the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as infile:
+        for block in iter(lambda: infile.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render_thumbnail(profile: CompiledProfile, path: str) -> None:
+    """Renders a small plot of one whole cycle of a profile as a png."""
+    start = datetime(2000, 1, 1)
+    end = start + max(profile.cycle_duration, timedelta(seconds=1))
+    edges, lows, highs = envelope(
+        iter_schedule(Timeline(profile, start, False), start, end), start, end, THUMBNAIL_WIDTH_PX
+    )
+    hours = (edges - np.datetime64(start, "us")) / np.timedelta64(1, "h")
+    fig = Figure(
+        figsize=(THUMBNAIL_WIDTH_PX / _THUMBNAIL_DPI, THUMBNAIL_HEIGHT_PX / _THUMBNAIL_DPI),
+        dpi=_THUMBNAIL_DPI,
+    )
+    ax = fig.add_subplot()
+    lows, highs = np.append(lows, lows[-1]), np.append(highs, highs[-1])
+    ax.fill_between(hours, lows, highs, step="post", linewidth=0)
+    ax.step(hours, lows, where="post", color="tab:blue", linewidth=1)
+    ax.step(hours, highs, where="post", color="tab:blue", linewidth=1)
+    ax.set_xlim(hours[0], hours[-1])
+    ax.set_ylim(0, 105)
+    ax.tick_params(labelsize="x-small")
+    fig.tight_layout(pad=0.2)
+    fig.savefig(path, format="png")
+
+
+class ProfileLibrary:
+    """Stored profiles and their catalog.
+
+    Attributes:
+        folder (str): Where profiles, their compiled forms, thumbnails and the catalog are kept.
+
+    Methods:
+        add: Stores an uploaded profile (once per distinct content), optionally simplified, and catalogs it.
+        get: Returns a profile's catalog entry.
+        search: Lists profiles, most recently uploaded first, optionally by name or hash prefix.
+        checkout: Puts a stored profile's compiled form in a folder to be run.
+        record_run: Records a stored profile was run.
+        original_path, compiled_path, thumbnail_path: Where a stored profile's files are.
+    """
+
+    def __init__(self, folder: str):
+        """Initializes the ProfileLibrary class."""
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._catalog_path = os.path.join(folder, CATALOG_NAME)
+        # Serializes storing and cataloging profiles. Simplifying one, which can take a while,
+        # is done outside it.
+        self._lock = threading.Lock()
+        with closing(self._connect()) as connection, connection:
+            connection.executescript(_SCHEMA)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(profiles)")}
+            for column, column_type in _ADDED_COLUMNS:
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE profiles ADD COLUMN {column} {column_type}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call, as Flask serves requests from several threads.
+        connection = sqlite3.connect(self._catalog_path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def original_path(self, entry: dict) -> str:
+        """Returns the path of a stored profile as it was uploaded."""
+        return os.path.join(self.folder, entry["hash"] + entry["extension"])
+
+    def _compiled_path(self, content_hash: str, simplified: bool) -> str:
+        suffix = SIMPLIFIED_SUFFIX if simplified else ""
+        return os.path.join(self.folder, content_hash + suffix + COMPILED_EXT)
+
+    def compiled_path(self, entry: dict) -> str:
+        """Returns the path of a stored profile's compiled form, simplified if it was."""
+        return self._compiled_path(entry["hash"], bool(entry.get("simplify")))
+
+    def thumbnail_path(self, entry: dict) -> str:
+        """Returns the path of a stored profile's preview thumbnail."""
+        return os.path.join(self.folder, entry["hash"] + ".png")
+
+    def add(self, filepath: str, name: Optional[str] = None, simplify: Optional[dict] = None) -> Optional[dict]:
+        """Stores an uploaded profile in the library, parsing and compiling it only if it's new.
+
+        The uploaded file is moved into the library, or removed if its content is already
+        there or it isn't a valid profile. Content already there is only simplified again
+        if simplify differs from how it was simplified before.
+
+        Arguments:
+            filepath (str): Path of the uploaded profile.
+            name (str): Name to catalog it by (default: its file name).
+            simplify (dict): tolerance, min_dwell and max_error to simplify it with (see
+                profile_simplify), or None to run it as uploaded.
+
+        Returns (dict):
+            The profile's catalog entry, or None if it isn't a valid profile.
+        """
+        name = name or os.path.basename(filepath)
+        content_hash = file_hash(filepath)
+        settings = json.dumps(simplify, sort_keys=True) if simplify else None
+        with self._lock:
+            entry = self.get(content_hash)
+            if entry and os.path.exists(self.compiled_path(entry)):
+                os.remove(filepath)
+                if entry["simplify"] == settings:
+                    logger.info("Profile %s is already in the library as %s", name, entry["name"])
+                    return entry
+                # Simplify the stored profile's full compiled form differently.
+                profile = CompiledProfile(self._compiled_path(content_hash, False))
+            else:
+                entry = {
+                    "hash": content_hash,
+                    "extension": os.path.splitext(filepath)[1].lower(),
+                    "name": name,
+                    "uploaded": datetime.now().isoformat(timespec="seconds"),
+                    "last_run": None,
+                }
+                stored_path = self.original_path(entry)
+                shutil.move(filepath, stored_path)
+                profile = compile_valid_profile(stored_path)
+                if profile is None:
+                    os.remove(stored_path)
+                    return None
+        entry.update(original_rows=len(profile), simplify=settings, max_deviation=None)
+        if simplify:
+            # Simplifying a long profile takes a while, so it's done outside the lock, to a
+            # file of this call's own that's moved into place below.
+            simplified_path = self._compiled_path(content_hash, True)
+            tmp_path = f"{simplified_path}.{threading.get_ident()}{COMPILED_EXT}"
+            try:
+                report = simplify_profile(profile, tmp_path, **simplify)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            entry["max_deviation"] = report["max_deviation"]
+        with self._lock:
+            if simplify:
+                os.replace(tmp_path, simplified_path)
+                profile = CompiledProfile(simplified_path)
+            elif os.path.exists(self._compiled_path(content_hash, True)):
+                # No longer simplified (a running copy is a separate hard link).
+                os.remove(self._compiled_path(content_hash, True))
+            low, high = np.inf, -np.inf
+            for start in range(0, len(profile), _STATS_CHUNK_ROWS):
+                intensities = profile.window(start, start + _STATS_CHUNK_ROWS)[1]
+                low, high = min(low, float(intensities.min())), max(high, float(intensities.max()))
+            render_thumbnail(profile, self.thumbnail_path(entry))
+            entry.update(
+                rows=len(profile),
+                cycle_seconds=profile.cycle_duration.total_seconds(),
+                min_intensity=low,
+                max_intensity=high,
+            )
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO profiles ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join(':' + column for column in _COLUMNS)})",
+                    entry,
+                )
+        logger.info("Profile %s added to the library: %s rows", name, entry["rows"])
+        return entry
+
+    def get(self, content_hash: str) -> Optional[dict]:
+        """Returns the catalog entry of the profile with the given hash, or None."""
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT * FROM profiles WHERE hash = ?", (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def search(self, query: str = "", limit: int = 100) -> List[dict]:
+        """Lists profiles whose name or hash starts with query, most recently uploaded first."""
+        # Prefix matches (rather than anywhere in the name) can use the indexes.
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT * FROM profiles WHERE name LIKE :pattern ESCAPE '\\' "
+                "UNION SELECT * FROM profiles WHERE hash LIKE :pattern ESCAPE '\\' "
+                "ORDER BY uploaded DESC LIMIT :limit",
+                {"pattern": pattern, "limit": limit},
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def checkout(self, entry: dict, folder: str) -> str:
+        """Puts a stored profile's compiled form in folder, to be run, and records it was run.
+
+        Arguments:
+            entry (dict): The profile's catalog entry.
+            folder (str): Folder to put it in, e.g. the 'live' folder.
+
+        Returns (str):
+            Path of the compiled profile in folder, named after the profile.
+        """
+        # Names cataloged before they were made safe as file names are made safe here.
+        path = compiled_profile_path(os.path.join(folder, secure_filename(entry["name"]) or entry["hash"]))
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            # A hard link costs nothing however long the profile, and removing it when the
+            # run is over leaves the library's copy.
+            os.link(self.compiled_path(entry), path)
+        except OSError:
+            shutil.copyfile(self.compiled_path(entry), path)
+        self.record_run(entry)
+        return path
+
+    def record_run(self, entry: dict) -> None:
+        """Records that a stored profile was (just) run."""
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE profiles SET last_run = ? WHERE hash = ?",
+                (datetime.now().isoformat(timespec="seconds"), entry["hash"]),
+            )
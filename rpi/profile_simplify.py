@@ -0,0 +1,269 @@
+"""Simplification of light profiles: fewer steps, within a bound on how far any intensity moves.
+
+Profiles exported from instruments or spreadsheets often carry thousands of steps that only
+wiggle by tiny amounts, and every step costs the Light Controller a serial command and a
+config save and costs plots points. So a profile can be simplified when it's uploaded:
+    1. Adjacent steps whose intensities span no more than `tolerance` are merged into one.
+    2. Steps lasting less than `min_dwell` seconds are absorbed by the step before them.
+Each resulting step's intensity is the middle of the range of intensities it replaced, and
+no step may replace a range wider than 2 * `max_error`, so no moment's intensity moves by
+more than max_error; a step that can't be merged or absorbed within it is kept. The
+profile's last step (the end of a cycle) is kept as is, so the cycle length and a run-once
+profile's final intensity are unchanged.
+
+Example, to try settings on a profile before uploading it:
+    python3 rpi/profile_simplify.py profile.xlsx simplified.npy --tolerance 1 --min-dwell 60 --max-error 2
+"""
+import argparse
+import logging
+import os
+import numpy as np
+from itertools import chain
+from typing import Iterable, Iterator, Tuple
+from climate_web_utilities import compile_valid_profile
+from compiled_profile import WINDOW_ROWS, CompiledProfile, compile_rows
+
+DEFAULT_TOLERANCE: float = 1.0
+DEFAULT_MIN_DWELL: float = 0.0
+DEFAULT_MAX_ERROR: float = 2.0
+# Rows of a profile simplified, or compared when measuring the deviation, at a time. Joining
+# a chunk's steps keeps tables of about 2 * log2(_CHUNK_ROWS) times its size (~16 MB).
+_CHUNK_ROWS: int = WINDOW_ROWS * 16
+
+logger = logging.getLogger(__name__)
+
+# Steps a chunk at a time: (starts, lows, highs), the start time of each step and the range
+# of intensities it covers.
+Steps = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _profile_steps(profile: CompiledProfile, chunk_rows: int) -> Iterator[Steps]:
+    """Yields every step of a profile but its last row, read a chunk of rows at a time."""
+    last = len(profile) - 1
+    for start in range(0, last, chunk_rows):
+        seconds, intensities = profile.window(start, min(start + chunk_rows, last))
+        yield seconds, intensities, intensities
+
+
+def _run_starts(lows: np.ndarray, highs: np.ndarray, limit: float, breaks: np.ndarray) -> np.ndarray:
+    """Returns where each run starts when steps are joined into runs from the first step on.
+
+    A run ends before the step that would make the intensities it covers span more than
+    limit, or before a step marked in breaks. Where every step's run would end is found
+    at once, by extending each by the largest blocks of steps (of 2**k, from tables of
+    their minimums and maximums) that keep it within limit; the span only grows as a run
+    does, so that's where it ends. Only the runs reached from the first step are kept.
+
+    Returns (ndarray):
+        The index of the first step of each run.
+    """
+    count = len(lows)
+    # The first break after each step.
+    next_breaks = np.minimum.accumulate(np.where(breaks, np.arange(count), count)[::-1])[::-1]
+    next_breaks = np.append(next_breaks[1:], count)
+    # Runs that can't take in the next step end there; only the others are extended.
+    ends = np.arange(1, count + 1)
+    joins_next = np.maximum(highs[:-1], highs[1:]) - np.minimum(lows[:-1], lows[1:]) <= limit
+    active = np.flatnonzero(joins_next & (next_breaks[:-1] > ends[:-1]))
+    active_ends, run_lows, run_highs = ends[active], lows[active], highs[active]
+    block_lows, block_highs = [lows], [highs]
+    while 2 ** len(block_lows) <= count:
+        half = 2 ** (len(block_lows) - 1)
+        block_lows.append(np.minimum(block_lows[-1][:-half], block_lows[-1][half:]))
+        block_highs.append(np.maximum(block_highs[-1][:-half], block_highs[-1][half:]))
+    for level in reversed(range(len(block_lows))):
+        extended = np.flatnonzero(active_ends + 2 ** level <= count)
+        joined_lows = np.minimum(run_lows[extended], block_lows[level][active_ends[extended]])
+        joined_highs = np.maximum(run_highs[extended], block_highs[level][active_ends[extended]])
+        fits = joined_highs - joined_lows <= limit
+        extended = extended[fits]
+        active_ends[extended] += 2 ** level
+        run_lows[extended], run_highs[extended] = joined_lows[fits], joined_highs[fits]
+    ends[active] = active_ends
+    ends = np.minimum(ends, next_breaks)
+    # The first 2**k runs' starts, then the 2**k after them reached by jumping 2**k runs
+    # at a time from each, and so on until the end.
+    jumps = np.append(ends, count)
+    starts = np.zeros(1, dtype=np.int64)
+    while starts[-1] < count:
+        starts = np.concatenate((starts, jumps[starts]))
+        jumps = jumps[jumps]
+    return starts[starts < count]
+
+
+def _join(steps: Steps, limit: float, min_dwell: float, end: float) -> Steps:
+    """Joins steps into runs (see _join_runs), the last step lasting until end."""
+    starts, lows, highs = steps
+    if min_dwell > 0:
+        breaks = np.diff(starts, append=end) >= min_dwell
+    else:
+        breaks = np.zeros(len(starts), dtype=bool)
+    first = _run_starts(lows, highs, limit, breaks)
+    return starts[first], np.minimum.reduceat(lows, first), np.maximum.reduceat(highs, first)
+
+
+def _join_runs(chunks: Iterable[Steps], limit: float, min_dwell: float = 0.0, end: float = 0.0) -> Iterator[Steps]:
+    """Joins runs of adjacent steps while the intensities each run covers span no more than limit.
+
+    With min_dwell, only steps shorter than min_dwell join the run before them, so short
+    steps are absorbed. The run still open at the end of a chunk is carried into the next,
+    and when absorbing so is the chunk's last step, whose length is only known once the
+    next step (or end) is reached.
+    """
+    held = 1 if min_dwell > 0 else 0
+    waiting = None
+    for chunk in chunks:
+        steps = chunk if waiting is None else tuple(np.concatenate(pair) for pair in zip(waiting, chunk))
+        ready = len(steps[0]) - held
+        if ready <= 0:
+            waiting = steps
+            continue
+        runs = _join(tuple(part[:ready] for part in steps), limit, min_dwell, steps[0][ready] if held else end)
+        if len(runs[0]) > 1:
+            yield tuple(part[:-1] for part in runs)
+        waiting = tuple(np.concatenate((run[-1:], part[ready:])) for run, part in zip(runs, steps))
+    if waiting is not None:
+        yield _join(waiting, limit, min_dwell, end)
+
+
+def _check_settings(tolerance: float, min_dwell: float, max_error: float) -> None:
+    """Raises ValueError if a simplification setting isn't a finite number of zero or more."""
+    settings = (tolerance, min_dwell, max_error)
+    if not all(np.isfinite(settings)) or min(settings) < 0:
+        raise ValueError("Simplification settings must be finite numbers of zero or more.")
+
+
+def _simplified_chunks(
+    chunks: Iterable[Steps], end: float, tolerance: float, min_dwell: float, max_error: float
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields simplified (seconds, intensities) of steps a chunk at a time, all but the last row."""
+    merge_limit = min(tolerance, 2 * max_error)
+    steps = _join_runs(chunks, merge_limit)
+    if min_dwell > 0:
+        # Absorbing can leave neighbours close enough to merge.
+        steps = _join_runs(_join_runs(steps, 2 * max_error, min_dwell, end), merge_limit)
+    for starts, lows, highs in steps:
+        yield starts, (lows + highs) / 2
+
+
+def simplify_steps(
+    seconds: np.ndarray, intensities: np.ndarray, tolerance: float, min_dwell: float, max_error: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns a profile's steps simplified (see the module docstring).
+
+    Arguments:
+        seconds (ndarray): Time of each step in seconds since the start of the profile.
+        intensities (ndarray): Light intensity of each step.
+        tolerance (float): Steps are merged while their intensities span no more than this.
+        min_dwell (float): Steps shorter than this many seconds are absorbed (0 to keep all).
+        max_error (float): The most any moment's intensity may move.
+
+    Returns (tuple):
+        The simplified (seconds, intensities).
+    """
+    _check_settings(tolerance, min_dwell, max_error)
+    seconds = np.asarray(seconds, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    if len(seconds) < 3:
+        return seconds.copy(), intensities.copy()
+    starts, values = seconds[:-1], intensities[:-1]
+    chunks = (
+        (starts[row : row + _CHUNK_ROWS], values[row : row + _CHUNK_ROWS], values[row : row + _CHUNK_ROWS])
+        for row in range(0, len(starts), _CHUNK_ROWS)
+    )
+    simplified = list(_simplified_chunks(chunks, float(seconds[-1]), tolerance, min_dwell, max_error))
+    return (
+        np.concatenate([chunk[0] for chunk in simplified] + [seconds[-1:]]),
+        np.concatenate([chunk[1] for chunk in simplified] + [intensities[-1:]]),
+    )
+
+
+def max_deviation(original: CompiledProfile, simplified: CompiledProfile) -> float:
+    """Returns the most the intensity in effect at any time differs between two profiles.
+
+    Both are step functions and the simplified profile's steps are a subset of the
+    original's, so comparing them at every original step time covers every moment. Of
+    several steps at the same time only the last is ever in effect, so the original is
+    compared by the intensity in effect at each time rather than each step's own.
+    """
+    deviation = 0.0
+    for start in range(0, len(original), _CHUNK_ROWS):
+        times = original.window(start, start + _CHUNK_ROWS)[0]
+        differences = simplified.values_at(times) - original.values_at(times)
+        deviation = max(deviation, float(np.max(np.abs(differences))))
+    return deviation
+
+
+def simplify_profile(
+    profile: CompiledProfile, path: str, tolerance: float, min_dwell: float, max_error: float
+) -> dict:
+    """Compiles a simplified copy of a profile and reports what simplifying it did.
+
+    The profile is read from its memory map, and simplified, a chunk of rows at a time. The
+    simplified rows are spooled to temporary files until they're counted, then written
+    with compile_rows, so memory use doesn't grow with the profile's length.
+
+    Arguments:
+        profile (CompiledProfile): The profile to simplify.
+        path (str): Path of the simplified compiled profile (.npy) to create.
+        tolerance, min_dwell, max_error (float): See simplify_steps.
+
+    Returns (dict):
+        original_rows, rows, reduction_percent and max_deviation (measured, not the bound).
+    """
+    _check_settings(tolerance, min_dwell, max_error)
+    last_seconds, last_intensities = profile.window(len(profile) - 1, len(profile))
+    steps = _profile_steps(profile, _CHUNK_ROWS)
+    chunks = _simplified_chunks(steps, float(last_seconds[0]), tolerance, min_dwell, max_error)
+    spool_paths = (f"{path}.seconds.tmp", f"{path}.intensities.tmp")
+    try:
+        rows = 0
+        with open(spool_paths[0], "wb") as seconds_file, open(spool_paths[1], "wb") as intensities_file:
+            for seconds, intensities in chain(chunks, [(last_seconds, last_intensities)]):
+                seconds.astype(np.float64).tofile(seconds_file)
+                intensities.astype(np.float64).tofile(intensities_file)
+                rows += len(seconds)
+
+        def fill(start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+            """Returns simplified rows [start, stop) from the spool."""
+            return tuple(
+                np.fromfile(spool_path, dtype=np.float64, count=stop - start, offset=start * 8)
+                for spool_path in spool_paths
+            )
+
+        simplified = CompiledProfile(compile_rows(rows, fill, path))
+    finally:
+        for spool_path in spool_paths:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+    report = {
+        "original_rows": len(profile),
+        "rows": len(simplified),
+        "reduction_percent": round(100 * (1 - len(simplified) / len(profile)), 2),
+        "max_deviation": max_deviation(profile, simplified),
+    }
+    logger.info("Simplified %s to %s: %s", os.path.basename(profile.path), os.path.basename(path), report)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("profile", help="Profile file (.xlsx, .csv, .parquet, .arrow, .feather or .npy).")
+    parser.add_argument("outfile", help="Simplified compiled profile (.npy) to create.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Intensity span merged into one step.")
+    parser.add_argument("--min-dwell", type=float, default=DEFAULT_MIN_DWELL, help="Shortest step kept, in seconds.")
+    parser.add_argument("--max-error", type=float, default=DEFAULT_MAX_ERROR, help="Most any moment's intensity may move.")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+    profile = compile_valid_profile(args.profile)
+    if profile is None:
+        parser.error(f"{args.profile} isn't a valid profile.")
+    report = simplify_profile(profile, args.outfile, args.tolerance, args.min_dwell, args.max_error)
+    print(
+        f"{report['original_rows']:,} -> {report['rows']:,} rows ({report['reduction_percent']}% fewer), "
+        f"max deviation {report['max_deviation']:g}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""On-demand profiling of the web app and Light Controller processes.
+
+Two kinds of capture, each for a given number of seconds:
+    - "sample": a thread records the stack of every other thread every SAMPLE_INTERVAL
+      seconds. Low, constant overhead; written as collapsed stacks (one "a;b;c count" line
+      per distinct stack, readable by flamegraph.pl and speedscope).
+    - "cprofile": deterministic profiling of every function call, written as a pstats
+      file (python -m pstats <file>, snakeviz). In the web app only requests handled
+      during the capture are profiled, by one profiler, one request at a time: a process
+      can only have one active profiler (from Python 3.12), so requests overlapping the
+      one being profiled are counted but not profiled.
+
+The Light Controller is asked for a capture by writing PROFILE_REQUEST_NAME into the live
+folder and sending it SIGUSR1, whether or not this run of the web app started it (see
+controller_pid). Nothing is profiled and no hooks do any work unless a
+capture is active.
+
+Captures are requested through /admin/profile, which is only enabled when the
+ADMIN_TOKEN environment variable is set, and saved in PROFILE_FOLDER (outside 'static' so
+they're only downloadable with the token).
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import signal
+import sys
+import tempfile
+import threading
+import time
+import psutil
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+ADMIN_TOKEN: Optional[str] = os.environ.get("ADMIN_TOKEN") or None
+PROFILE_FOLDER: str = os.environ.get(
+    "CLIMATE_PROFILE_FOLDER", os.path.join(tempfile.gettempdir(), "climate_profiles")
+)
+PROFILE_REQUEST_NAME: str = "profile_request.json"
+PROFILE_MODES: Dict[str, str] = {"sample": ".txt", "cprofile": ".prof"}
+SAMPLE_INTERVAL: float = 0.005
+MAX_CAPTURE_SECONDS: float = 300
+DEFAULT_TOP: int = 20
+# Leeway between when a process was created and when it saved the config, for the
+# imprecision of process creation times.
+_CREATE_TIME_SLACK: float = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def _function_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+class Sampler(threading.Thread):
+    """Samples the stacks of other threads at a fixed interval.
+
+    Attributes:
+        interval (float): Seconds between samples.
+        thread_ids (set): Threads to sample, or None for all but the sampler itself.
+        exclude (set): Threads not to sample.
+        samples (int): Number of samples taken.
+        stacks (Counter): Number of times each collapsed stack (root first) was seen.
+    """
+
+    def __init__(
+        self,
+        interval: float = SAMPLE_INTERVAL,
+        thread_ids: Optional[Set[int]] = None,
+        exclude: Optional[Set[int]] = None,
+    ):
+        """Initializes the Sampler class."""
+        super().__init__(daemon=True, name="profiling-sampler")
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.exclude = exclude or set()
+        self.samples: int = 0
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        ignored = self.exclude | {threading.get_ident()}
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in ignored or (self.thread_ids and thread_id not in self.thread_ids):
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_function_name(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        """Stops sampling."""
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path: str) -> None:
+        """Writes the samples as collapsed stacks."""
+        with open(path, "w", encoding="utf-8") as outfile:
+            for stack, count in self.stacks.most_common():
+                outfile.write(f"{stack} {count}\n")
+
+    def summary(self, top: int = DEFAULT_TOP) -> List[dict]:
+        """Returns the functions most often on the stack, by share of samples they were on top of it."""
+        own, anywhere = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            names = stack.split(";")
+            own[names[-1]] += count
+            for name in set(names):
+                anywhere[name] += count
+        total = max(1, sum(self.stacks.values()))
+        return [
+            {
+                "function": name,
+                "self_percent": round(100 * count / total, 2),
+                "total_percent": round(100 * anywhere[name] / total, 2),
+            }
+            for name, count in own.most_common(top)
+        ]
+
+
+def pstats_summary(stats: pstats.Stats, top: int = DEFAULT_TOP) -> List[dict]:
+    """Returns the functions that took the most time themselves, from cProfile stats."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    return [
+        {
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "self_seconds": round(self_time, 6),
+            "total_seconds": round(total_time, 6),
+        }
+        for (filename, line, name), (_, calls, self_time, total_time, _) in rows
+    ]
+
+
+def _write_summary(stem: str, summary: dict) -> None:
+    # Written last, and moved into place, so its presence means the capture is complete.
+    with open(stem + ".json.tmp", "w", encoding="utf-8") as outfile:
+        json.dump(summary, outfile, indent=4)
+    os.replace(stem + ".json.tmp", stem + ".json")
+
+
+class _RequestProfiles:
+    """A web app cProfile capture: one profiler, enabled by one request at a time."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        # Held by the request being profiled.
+        self.lock = threading.Lock()
+        self.profiled: int = 0
+        self.skipped: int = 0
+        self._counts_lock = threading.Lock()
+
+    def count(self, profiled: bool) -> None:
+        with self._counts_lock:
+            if profiled:
+                self.profiled += 1
+            else:
+                self.skipped += 1
+
+
+# The web app's active cProfile capture, if any, and the capture the current request is profiled in.
+_REQUEST_PROFILES: Optional[_RequestProfiles] = None
+_REQUEST_LOCAL = threading.local()
+
+
+def request_started() -> None:
+    """Starts profiling the current request if a web app cProfile capture is active and free."""
+    capture = _REQUEST_PROFILES
+    if capture is None:
+        return
+    if not capture.lock.acquire(blocking=False):
+        capture.count(profiled=False)
+        return
+    try:
+        capture.profile.enable()
+    except ValueError:
+        # Another profiler (e.g. a debugger's) is already active in this process.
+        capture.lock.release()
+        capture.count(profiled=False)
+        return
+    _REQUEST_LOCAL.active = capture
+
+
+def request_finished() -> None:
+    """Stops profiling the current request, if it's being profiled."""
+    capture = getattr(_REQUEST_LOCAL, "active", None)
+    if capture is not None:
+        capture.profile.disable()
+        _REQUEST_LOCAL.active = None
+        capture.count(profiled=True)
+        capture.lock.release()
+
+
+def capture_web_app(mode: str, seconds: float, stem: str, top: int = DEFAULT_TOP) -> dict:
+    """Profiles the web app (this process) for some seconds, blocking until done.
+
+    Arguments:
+        mode (str): "sample" or "cprofile".
+        seconds (float): How long to capture.
+        stem (str): Path, without extension, of the files to save.
+        top (int): Number of functions in the summary.
+
+    Returns (dict):
+        The summary: target, mode, seconds, file and the top functions, and for cprofile
+        the number of requests profiled and skipped.
+    """
+    global _REQUEST_PROFILES
+    path = stem + PROFILE_MODES[mode]
+    if mode == "sample":
+        # The calling thread is only waiting for the capture to end.
+        sampler = Sampler(exclude={threading.get_ident()})
+        sampler.start()
+        time.sleep(seconds)
+        sampler.stop()
+        sampler.write(path)
+        functions = sampler.summary(top)
+        requests = None
+    else:
+        capture = _RequestProfiles()
+        _REQUEST_PROFILES = capture
+        time.sleep(seconds)
+        _REQUEST_PROFILES = None
+        # Waits for the request being profiled, if any, to finish.
+        with capture.lock:
+            stats = pstats.Stats(capture.profile) if capture.profiled else pstats.Stats()
+        stats.dump_stats(path)
+        functions = pstats_summary(stats, top)
+        requests = {"profiled": capture.profiled, "skipped": capture.skipped}
+    summary = {"target": "web", "mode": mode, "seconds": seconds, "file": os.path.basename(path), "top": functions}
+    if requests:
+        summary["requests"] = requests
+    _write_summary(stem, summary)
+    return summary
+
+
+def controller_pid(pid: Optional[int], config_path: str) -> Optional[int]:
+    """Returns the pid of the Light Controller saved in its config if it's still running it.
+
+    The Light Controller is forked from the web app, so it's recognized by running the same
+    command line as this process and having been created before the config was last saved.
+    So one started by an earlier run of the web app is found, but a stale pid since reused
+    by an unrelated process isn't.
+
+    Arguments:
+        pid (int): The pid saved in the config, if any.
+        config_path (str): Path of the config the Light Controller saves.
+
+    Returns (int):
+        The pid, or None if it isn't the Light Controller's.
+    """
+    if not pid or pid == os.getpid():
+        return None
+    try:
+        process = psutil.Process(pid)
+        if process.status() == psutil.STATUS_ZOMBIE:
+            return None
+        if process.create_time() > os.path.getmtime(config_path) + _CREATE_TIME_SLACK:
+            return None
+        if process.cmdline() != psutil.Process().cmdline():
+            return None
+    except (psutil.Error, OSError):
+        return None
+    return pid
+
+
+def request_controller_capture(
+    live_folder: str, pid: int, mode: str, seconds: float, stem: str, top: int = DEFAULT_TOP
+) -> Optional[dict]:
+    """Asks the Light Controller to profile itself, blocking until it's done.
+
+    Returns (dict):
+        The summary the Light Controller saved, or None if it didn't in time.
+    """
+    with open(os.path.join(live_folder, PROFILE_REQUEST_NAME), "w", encoding="utf-8") as outfile:
+        json.dump({"mode": mode, "seconds": seconds, "stem": stem, "top": top}, outfile)
+    os.kill(pid, signal.SIGUSR1)
+    deadline = time.monotonic() + seconds + 10
+    while time.monotonic() < deadline:
+        if os.path.exists(stem + ".json"):
+            with open(stem + ".json", "r", encoding="utf-8") as infile:
+                return json.load(infile)
+        time.sleep(0.2)
+    return None
+
+
+def install_controller_handler(live_folder: str) -> None:
+    """Lets the Light Controller (this process' main thread) be profiled on SIGUSR1."""
+    main_thread = threading.main_thread().ident
+    active = {}
+
+    def finish(summary_functions: List[dict], request: dict, path: str) -> None:
+        summary = {
+            "target": "controller",
+            "mode": request["mode"],
+            "seconds": request["seconds"],
+            "file": os.path.basename(path),
+            "top": summary_functions,
+        }
+        _write_summary(request["stem"], summary)
+        active.clear()
+        logger.info("Profile capture saved: %s", path)
+
+    def stop_cprofile(signum, frame) -> None:
+        profile, request = active["profile"], active["request"]
+        profile.disable()
+        path = request["stem"] + PROFILE_MODES["cprofile"]
+        profile.dump_stats(path)
+        finish(pstats_summary(pstats.Stats(profile), request["top"]), request, path)
+
+    def stop_sampler(sampler: Sampler, request: dict) -> None:
+        sampler.stop()
+        path = request["stem"] + PROFILE_MODES["sample"]
+        sampler.write(path)
+        finish(sampler.summary(request["top"]), request, path)
+
+    def start(signum, frame) -> None:
+        request_path = os.path.join(live_folder, PROFILE_REQUEST_NAME)
+        try:
+            with open(request_path, "r", encoding="utf-8") as infile:
+                request = json.load(infile)
+            os.remove(request_path)
+        except (OSError, ValueError) as e:
+            logger.warning("Profile capture requested without a valid request: %s", e)
+            return
+        if active or request.get("mode") not in PROFILE_MODES:
+            logger.warning("Profile capture request ignored: %s", request)
+            return
+        logger.info("Profile capture starting: %s", request)
+        active["request"] = request
+        if request["mode"] == "sample":
+            sampler = Sampler(thread_ids={main_thread})
+            sampler.start()
+            threading.Timer(request["seconds"], stop_sampler, (sampler, request)).start()
+        else:
+            # Signal handlers run in the main thread, so this profiles the control loop.
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Another profiler (e.g. a debugger's) is already active in this process.
+                logger.warning("Profile capture couldn't start: %s", e)
+                active.clear()
+                return
+            active["profile"] = profile
+            signal.signal(signal.SIGALRM, stop_cprofile)
+            signal.setitimer(signal.ITIMER_REAL, request["seconds"])
+
+    signal.signal(signal.SIGUSR1, start)
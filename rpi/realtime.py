@@ -0,0 +1,118 @@
+"""Real-time scheduling support and scheduling error (jitter) recording for the Light Controller.
+
+Real-time mode is opt-in: set REALTIME_CONTROLLER=1 before starting the web app (and so the
+Light Controller) and optionally REALTIME_CPU=<cpu number> to pin the controller to a CPU,
+e.g. one isolated from the web app. Each step is only taken as far as the OS allows; running
+as root (or with CAP_SYS_NICE and CAP_IPC_LOCK) enables all of them.
+"""
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import numpy as np
+from bisect import bisect_right
+from typing import Optional
+
+REALTIME: bool = os.environ.get("REALTIME_CONTROLLER", "").lower() in ("1", "true", "yes")
+REALTIME_CPU: Optional[int] = (
+    int(os.environ["REALTIME_CPU"]) if os.environ.get("REALTIME_CPU", "").isdigit() else None
+)
+# SCHED_FIFO priority, kept below the kernel's own real-time threads (50).
+REALTIME_PRIORITY: int = 20
+# Fallback niceness when real-time scheduling isn't permitted.
+ELEVATED_NICENESS: int = -10
+# Histogram bin edges of scheduling error in ms. Early changes land in the first bin.
+JITTER_BIN_EDGES_MS: tuple = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+_MCL_CURRENT: int = 1
+
+logger = logging.getLogger(__name__)
+
+
+def enable_realtime(cpu: Optional[int] = REALTIME_CPU) -> dict:
+    """Raises the calling process' scheduling priority, pins and locks it where allowed.
+
+    Arguments:
+        cpu (int): CPU to pin the process to, or None to leave its affinity alone.
+
+    Returns (dict):
+        What was achieved: "scheduler", "cpu" and "memory_locked".
+    """
+    achieved = {"scheduler": "default", "cpu": None, "memory_locked": False}
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(REALTIME_PRIORITY))
+        achieved["scheduler"] = f"SCHED_FIFO:{REALTIME_PRIORITY}"
+    except (AttributeError, PermissionError, OSError) as e:
+        logger.warning("Real-time scheduling not permitted (%s), trying niceness instead.", e)
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, ELEVATED_NICENESS)
+            achieved["scheduler"] = f"nice:{ELEVATED_NICENESS}"
+        except (AttributeError, PermissionError, OSError) as e:
+            logger.warning("Raising priority not permitted: %s", e)
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            achieved["cpu"] = cpu
+        except (AttributeError, OSError) as e:
+            logger.warning("Could not pin to CPU %s: %s", cpu, e)
+    # Lock the pages currently mapped (code, libraries, heap) so they're never paged out.
+    # MCL_FUTURE isn't used as it would lock every page of a memory-mapped profile.
+    libc_name = ctypes.util.find_library("c")
+    if libc_name:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if libc.mlockall(_MCL_CURRENT) == 0:
+            achieved["memory_locked"] = True
+        else:
+            logger.warning("Could not lock memory: %s", os.strerror(ctypes.get_errno()))
+    # Move everything allocated so far out of the garbage collector's view so any
+    # collection during the control loop only has a few new objects to scan.
+    gc.collect()
+    gc.freeze()
+    logger.info("Real-time mode: %s", achieved)
+    return achieved
+
+
+class JitterRecorder:
+    """Records the scheduling error of light intensity changes into preallocated storage.
+
+    Attributes:
+        capacity (int): Number of most recent errors kept for percentiles.
+        count (int): Number of errors recorded in total.
+
+    Methods:
+        record: Records one scheduling error (in seconds) without allocating arrays.
+        summary: Returns the distribution of recorded errors as a json-serializable dict.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        """Initializes the JitterRecorder class."""
+        self.capacity: int = capacity
+        self.count: int = 0
+        self._errors_ms: np.ndarray = np.zeros(capacity)
+        self._histogram: list = [0] * len(JITTER_BIN_EDGES_MS)
+        self._max_ms: float = 0.0
+
+    def record(self, error_seconds: float) -> None:
+        """Records how late (positive) or early (negative) a change was made."""
+        error_ms = error_seconds * 1000.0
+        self._errors_ms[self.count % self.capacity] = error_ms
+        self._histogram[max(0, bisect_right(JITTER_BIN_EDGES_MS, error_ms) - 1)] += 1
+        if error_ms > self._max_ms:
+            self._max_ms = error_ms
+        self.count += 1
+
+    def summary(self) -> Optional[dict]:
+        """Returns the count, mean, percentiles and histogram of scheduling errors in ms."""
+        if not self.count:
+            return None
+        recent = self._errors_ms[: min(self.count, self.capacity)]
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+        return {
+            "count": self.count,
+            "mean_ms": round(float(recent.mean()), 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(self._max_ms, 3),
+            "histogram": {"edges_ms": list(JITTER_BIN_EDGES_MS), "counts": list(self._histogram)},
+        }
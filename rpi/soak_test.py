@@ -0,0 +1,238 @@
+"""Long-run soak test of the Light Controller and web app for memory and file descriptor leaks.
+
+Runs a Light Controller in this process on a VirtualClock through thousands of cycles of a
+short profile, with a stand-in Arduino and the static/live folders in a temporary
+directory, while another thread loads the web app's pages (live plot, status, plot tiles
+and profile uploads). Meanwhile RSS and open file descriptors are sampled and tracemalloc
+snapshots taken at intervals. The test fails (exit code 1) if, after a warm-up sample,
+any of them grows by more than its threshold, and reports the top allocation sites.
+
+Example, 5000 cycles and 2000 page loads:
+    python3 rpi/soak_test.py --cycles 5000 --page-loads 2000 --json soak.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import psutil
+from datetime import timedelta
+from typing import List, Optional
+
+RPI_FOLDER: str = os.path.dirname(os.path.abspath(__file__))
+# The soak profile: a change every STEP_SECONDS through STEPS intensities, then it loops.
+STEP_SECONDS: int = 10
+STEPS: int = 6
+# Frames kept per traced allocation, enough to see past numpy and matplotlib internals.
+TRACE_FRAMES: int = 5
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
+
+class MemoryMonitor(threading.Thread):
+    """Samples this process' RSS, open file descriptors and traced memory at intervals.
+
+    Attributes:
+        interval (float): Seconds between samples.
+        samples (list): {"elapsed_s", "rss_mb", "fds", "traced_mb"} of every sample.
+        baseline (Snapshot): tracemalloc snapshot at the warm-up sample, compared against.
+        latest (Snapshot): The most recent tracemalloc snapshot.
+    """
+
+    def __init__(self, interval: float = 5.0, warmup_samples: int = 1):
+        """Initializes the MemoryMonitor class."""
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.warmup_samples = warmup_samples
+        self.samples: List[dict] = []
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.latest: Optional[tracemalloc.Snapshot] = None
+        self._process = psutil.Process()
+        self._start_time = time.monotonic()
+        self._stop_event = threading.Event()
+
+    def sample(self) -> None:
+        """Records one sample and snapshot."""
+        snapshot = tracemalloc.take_snapshot()
+        self.samples.append(
+            {
+                "elapsed_s": round(time.monotonic() - self._start_time, 1),
+                "rss_mb": round(self._process.memory_info().rss / 1e6, 1),
+                "fds": self._process.num_fds(),
+                "traced_mb": round(tracemalloc.get_traced_memory()[0] / 1e6, 2),
+            }
+        )
+        # Only the warm-up and latest snapshots are kept; each can be large.
+        if len(self.samples) == self.warmup_samples + 1:
+            self.baseline = snapshot
+        self.latest = snapshot
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        """Stops sampling, taking a final sample."""
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+    def growth(self) -> dict:
+        """Returns how much RSS (MB), fds and traced memory (MB) grew since the warm-up sample."""
+        baseline = self.samples[min(self.warmup_samples, len(self.samples) - 1)]
+        final = self.samples[-1]
+        return {
+            key: round(final[key] - baseline[key], 2) for key in ("rss_mb", "fds", "traced_mb")
+        }
+
+    def top_allocations(self, top: int = 10) -> List[str]:
+        """Returns the allocation sites whose memory grew the most since the warm-up sample."""
+        if self.baseline is None or self.latest is None:
+            return []
+        return [str(stat) for stat in self.latest.compare_to(self.baseline, "lineno")[:top]]
+
+
+class PageLoader(threading.Thread):
+    """Loads the web app's pages in a loop, as users watching a long run would."""
+
+    def __init__(self, app, page_loads: int, upload_path: str):
+        """Initializes the PageLoader class."""
+        super().__init__(daemon=True)
+        self.client = app.test_client()
+        self.page_loads = page_loads
+        self.upload_name = os.path.basename(upload_path)
+        with open(upload_path, "rb") as infile:
+            self.upload = infile.read()
+        self.loads: int = 0
+        self.errors: int = 0
+
+    def run(self) -> None:
+        while self.loads < self.page_loads:
+            # Tiles at a fine zoom move on through the run so new ones keep being rendered.
+            urls = ["/live", "/status", "/jitter", "/tiles/1/0.png", f"/tiles/5/{self.loads % 500}.png"]
+            for url in urls:
+                self._check(self.client.get(url).status_code in (200, 302))
+            if self.loads % 50 == 0:
+                response = self.client.post(
+                    "/viewer",
+                    data={"file": (io.BytesIO(self.upload), self.upload_name)},
+                    content_type="multipart/form-data",
+                )
+                self._check(response.status_code == 200)
+
+    def _check(self, ok: bool) -> None:
+        self.loads += 1
+        self.errors += not ok
+
+
+def run_soak(cycles: int, page_loads: int, interval: float, static_folder: str) -> dict:
+    """Runs the soak test and returns what was measured.
+
+    Arguments:
+        cycles (int): Profile cycles for the Light Controller to run (virtually).
+        page_loads (int): Web app requests to make.
+        interval (float): Seconds between memory samples.
+        static_folder (str): Temporary folder for uploads and the live folder.
+
+    Returns (dict):
+        Counts, duration, every memory sample, growth and the top allocation sites.
+    """
+    # The web app's modules read these when they're imported.
+    os.makedirs(os.path.join(static_folder, "live"), exist_ok=True)
+    os.environ.update(
+        FAKE_ARDUINO="1", CLIMATE_STATIC_FOLDER=static_folder, CLIMATE_LOG_FOLDER=os.path.join(static_folder, "logs")
+    )
+    sys.path.insert(0, RPI_FOLDER)
+    import numpy as np
+    import climate_web_interface as web
+    from climate_web_utilities import LIVE_FOLDER_PATH, ClimateConfig
+    from clock import ClockStopped, VirtualClock
+    from compiled_profile import compile_profile
+    from control_lights import control_lights
+
+    seconds = np.arange(STEPS + 1) * STEP_SECONDS
+    intensities = np.linspace(0, 100, STEPS + 1)
+    profile_path = compile_profile(seconds, intensities, os.path.join(LIVE_FOLDER_PATH, "soak.npy"))
+    upload_path = compile_profile(seconds, intensities[::-1], os.path.join(static_folder, "upload.npy"))
+    config = ClimateConfig(profile_path, True)
+    config.update()
+    clock = VirtualClock(config.started, stop_at=config.started + cycles * timedelta(seconds=int(seconds[-1])))
+
+    # Tracing starts after the imports and setup so snapshots only hold what the run
+    # allocates, which keeps them small and quick to take and compare.
+    tracemalloc.start(TRACE_FRAMES)
+    monitor = MemoryMonitor(interval)
+    monitor.sample()
+    monitor.start()
+    pages = PageLoader(web.app, page_loads, upload_path)
+    pages.start()
+    started = time.monotonic()
+    try:
+        control_lights(clock)
+    except ClockStopped:
+        pass
+    controller_seconds = time.monotonic() - started
+    pages.join()
+    monitor.stop()
+    tracemalloc.stop()
+    return {
+        "cycles": cycles,
+        "controller_seconds": round(controller_seconds, 1),
+        "page_loads": pages.loads,
+        "page_errors": pages.errors,
+        "duration_s": round(time.monotonic() - started, 1),
+        "samples": monitor.samples,
+        "growth": monitor.growth(),
+        "top_allocations": monitor.top_allocations(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=2000, help="Profile cycles to run.")
+    parser.add_argument("--page-loads", type=int, default=1000, help="Web app requests to make.")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between memory samples.")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50)
+    parser.add_argument("--max-fd-growth", type=int, default=5)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=10)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="climate_soak_test_") as static_folder:
+        results = run_soak(args.cycles, args.page_loads, args.interval, static_folder)
+
+    limits = {"rss_mb": args.max_rss_growth_mb, "fds": args.max_fd_growth, "traced_mb": args.max_traced_growth_mb}
+    results["failures"] = [
+        f"{key} grew by {results['growth'][key]} (limit {limit})"
+        for key, limit in limits.items()
+        if results["growth"][key] > limit
+    ]
+    if results["page_errors"]:
+        results["failures"].append(f"{results['page_errors']} page loads failed")
+    print(
+        f"{results['cycles']} cycles in {results['controller_seconds']} s, "
+        f"{results['page_loads']} page loads ({results['page_errors']} failed) in {results['duration_s']} s"
+    )
+    print(f"{'elapsed s':>10}{'rss MB':>10}{'fds':>6}{'traced MB':>11}")
+    for sample in results["samples"]:
+        print(f"{sample['elapsed_s']:>10}{sample['rss_mb']:>10}{sample['fds']:>6}{sample['traced_mb']:>11}")
+    print("Growth since warm-up:", ", ".join(f"{key}: {value}" for key, value in results["growth"].items()))
+    print("Top allocation sites by growth:")
+    for stat in results["top_allocations"]:
+        print("   ", stat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=4)
+    for failure in results["failures"]:
+        print("FAIL:", failure)
+    sys.exit(1 if results["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Procedurally generated light profiles following the sun, optionally with clouds.
+
+Intensities are computed with numpy over whole chunks of time at once and written straight
+into the compiled profile format, so even a year at 1 second resolution (~31.5 million rows)
+is generated in a few seconds with bounded memory.
+
+Example, a week of June at PNNL's latitude with some cloud:
+    python3 rpi/solar_profile.py june_week.npy --day-of-year 160 --days 7 --cloud-cover 0.4
+"""
+import argparse
+import logging
+import os
+import numpy as np
+from typing import Optional, Tuple
+from compiled_profile import compile_rows
+
+SECONDS_PER_DAY: int = 86400
+# Richland, WA
+DEFAULT_LATITUDE: float = 46.3
+# The most rows (and cloud knots) a profile may have: a leap year at 1 second resolution.
+MAX_ROWS: int = 366 * SECONDS_PER_DAY + 1
+# Rows generated at a time: a day of 1 second rows.
+_CHUNK_ROWS: int = SECONDS_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+
+def solar_declination(day_of_year: np.ndarray) -> np.ndarray:
+    """Returns the sun's declination (radians) on each day of the year (1-365)."""
+    return np.radians(23.44) * np.sin(2 * np.pi * (284 + day_of_year) / 365)
+
+
+def day_length_hours(latitude: float, day_of_year: np.ndarray) -> np.ndarray:
+    """Returns the hours from sunrise to sunset at a latitude (degrees) on each day of the year."""
+    cos_hour_angle = -np.tan(np.radians(latitude)) * np.tan(solar_declination(day_of_year))
+    # Clipping covers polar day (24 hrs) and polar night (0 hrs).
+    return 2 * np.degrees(np.arccos(np.clip(cos_hour_angle, -1, 1))) / 15
+
+
+def sun_intensity(
+    latitude: float,
+    day_of_year: np.ndarray,
+    second_of_day: np.ndarray,
+    photoperiod: Optional[float] = None,
+) -> np.ndarray:
+    """Returns the relative (0-1) intensity of sunlight, with solar noon at 12:00.
+
+    Arguments:
+        latitude (float): Latitude in degrees.
+        day_of_year (ndarray): Day of the year (1-365) of each point.
+        second_of_day (ndarray): Seconds since midnight of each point.
+        photoperiod (float): If given, hours of light each day, centered on noon, with a
+            sine shaped rise and fall, in place of the astronomical day.
+
+    Returns (ndarray):
+        Relative intensity, 1 at the highest the sun reaches during the year (or every
+        noon when a photoperiod is given) and 0 at night.
+    """
+    hours_from_noon = second_of_day / 3600 - 12
+    if photoperiod is not None:
+        phase = np.pi * (hours_from_noon / photoperiod + 0.5)
+        return np.where(np.abs(hours_from_noon) < photoperiod / 2, np.sin(phase), 0.0)
+    phi = np.radians(latitude)
+    delta = solar_declination(day_of_year)
+    sin_elevation = np.sin(phi) * np.sin(delta) + np.cos(phi) * np.cos(delta) * np.cos(
+        np.radians(15 * hours_from_noon)
+    )
+    # Normalize by the year's highest noon sun (at a solstice) so seasons differ in strength.
+    highest = np.sin(min(np.pi / 2, np.pi / 2 - abs(phi) + np.radians(23.44)))
+    return np.clip(sin_elevation / highest, 0, 1)
+
+
+def cloud_attenuation(
+    seconds: np.ndarray, cloud_cover: float, knots: np.ndarray, cloud_timescale: float
+) -> np.ndarray:
+    """Returns the fraction (0-1) of sunlight let through by clouds at each time.
+
+    Cloudiness is random values at knots every cloud_timescale seconds, linearly
+    interpolated between them, so the same knots give the same, continuous clouds
+    however the times are chunked.
+    """
+    if not cloud_cover:
+        return np.ones_like(seconds)
+    return 1 - cloud_cover * np.interp(seconds / cloud_timescale, np.arange(len(knots)), knots)
+
+
+def generate_solar_profile(
+    path: str,
+    latitude: float = DEFAULT_LATITUDE,
+    day_of_year: int = 172,
+    days: int = 1,
+    resolution: float = 1,
+    peak_intensity: float = 100,
+    photoperiod: Optional[float] = None,
+    cloud_cover: float = 0.0,
+    cloud_timescale: float = 600,
+    seed: int = 0,
+) -> str:
+    """Generates a solar light profile and writes it as a compiled profile.
+
+    Arguments:
+        path (str): Path of the compiled profile (.npy) to create.
+        latitude (float): Latitude in degrees (-90 to 90).
+        day_of_year (int): Day of the year (1-365) of the first day, e.g. 172 for June 21.
+        days (int): Number of days in the profile.
+        resolution (float): Seconds between rows.
+        peak_intensity (float): Intensity (0-100) of the brightest sunlight.
+        photoperiod (float): Hours of light per day, replacing the astronomical day length.
+        cloud_cover (float): Fraction (0-1) of light clouds can block.
+        cloud_timescale (float): Seconds over which cloudiness changes (more than 0).
+        seed (int): Seed of the random cloud cover, for reproducible profiles.
+
+    Returns (str):
+        The path of the compiled profile.
+
+    Raises:
+        ValueError: If a parameter is out of range or the profile would have more than
+            MAX_ROWS rows.
+    """
+    settings = [latitude, resolution, peak_intensity, cloud_cover, cloud_timescale]
+    if not np.all(np.isfinite(settings + ([] if photoperiod is None else [photoperiod]))):
+        raise ValueError("Settings must be finite numbers.")
+    if not -90 <= latitude <= 90 or not 1 <= day_of_year <= 365 or days < 1:
+        raise ValueError("Latitude must be -90 to 90, day of year 1 to 365 and days at least 1.")
+    if resolution <= 0 or not 0 <= peak_intensity <= 100 or not 0 <= cloud_cover <= 1:
+        raise ValueError("Resolution must be positive, peak intensity 0 to 100 and cloud cover 0 to 1.")
+    if cloud_timescale <= 0:
+        raise ValueError("Cloud timescale must be positive.")
+    if photoperiod is not None and not 0 < photoperiod <= 24:
+        raise ValueError("Photoperiod must be more than 0 and at most 24 hours.")
+    duration = days * SECONDS_PER_DAY
+    # The last row marks the end of the profile so it loops seamlessly.
+    rows = int(np.ceil(duration / resolution)) + 1
+    if rows > MAX_ROWS or duration / cloud_timescale > MAX_ROWS:
+        raise ValueError(
+            f"At most {MAX_ROWS:,} rows are generated: use fewer days, a coarser resolution "
+            "or a longer cloud timescale."
+        )
+    knots = np.random.default_rng(seed).random(int(np.ceil(duration / cloud_timescale)) + 2)
+
+    def fill(start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        seconds = np.minimum(np.arange(start, stop) * resolution, duration)
+        days_in = seconds // SECONDS_PER_DAY
+        intensity = sun_intensity(
+            latitude, (day_of_year - 1 + days_in) % 365 + 1, seconds - days_in * SECONDS_PER_DAY, photoperiod
+        )
+        intensity *= cloud_attenuation(seconds, cloud_cover, knots, cloud_timescale)
+        return seconds, np.rint(peak_intensity * intensity)
+
+    logger.info(
+        "Generating %s days of solar profile from day %s at latitude %s every %s s",
+        days, day_of_year, latitude, resolution,
+    )
+    return compile_rows(rows, fill, path, chunk_rows=max(1, int(_CHUNK_ROWS // resolution)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Compiled profile (.npy) to write.")
+    parser.add_argument("--latitude", type=float, default=DEFAULT_LATITUDE)
+    parser.add_argument("--day-of-year", type=int, default=172)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--resolution", type=float, default=1, help="Seconds between rows.")
+    parser.add_argument("--peak-intensity", type=float, default=100)
+    parser.add_argument("--photoperiod", type=float, help="Hours of light per day.")
+    parser.add_argument("--cloud-cover", type=float, default=0.0)
+    parser.add_argument("--cloud-timescale", type=float, default=600, help="Seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_solar_profile(
+        os.path.abspath(args.path),
+        latitude=args.latitude,
+        day_of_year=args.day_of_year,
+        days=args.days,
+        resolution=args.resolution,
+        peak_intensity=args.peak_intensity,
+        photoperiod=args.photoperiod,
+        cloud_cover=args.cloud_cover,
+        cloud_timescale=args.cloud_timescale,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+    main()
@@ -0,0 +1,85 @@
+"""The timeline of a running profile: where any moment falls in its cycles and the intensity scheduled then.
+
+This is the one place cycle arithmetic is done. The Light Controller, the live plot, the
+status API and data exports all use it so they agree on which cycle is running and what
+intensity should be on.
+
+Semantics (those of the Light Controller):
+    - The cycle length is the time of the profile's last step.
+    - A looping profile restarts every cycle, so its last step's intensity is never applied;
+      the first step's intensity is applied at the start of every cycle.
+    - A profile run once holds its last step's intensity after it completes.
+    - Before the first step the first step's intensity is in effect.
+    - Before the profile was started nothing is scheduled (NaN).
+"""
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Tuple
+from compiled_profile import CompiledProfile
+
+
+class Timeline:
+    """A profile, when it was started and whether it loops.
+
+    Attributes:
+        profile (CompiledProfile): The profile being run.
+        started (datetime): When the profile was started.
+        run_continuously (bool): Whether the profile loops.
+        cycle_duration (timedelta): The length of one cycle of the profile.
+
+    Methods:
+        cycle_start: When a given cycle starts.
+        position: The cycle number, cycle start and time into the cycle of a moment.
+        completed: Whether a profile run once has finished by a moment.
+        intensity_at: Scheduled intensity at an array of timestamps, in one vectorized call.
+    """
+
+    def __init__(self, profile: CompiledProfile, started: datetime, run_continuously: bool):
+        """Initializes the Timeline class."""
+        self.profile = profile
+        self.started = started
+        self.run_continuously = run_continuously
+        self.cycle_duration: timedelta = profile.cycle_duration
+        self._loops: bool = run_continuously and self.cycle_duration > timedelta(0)
+
+    def cycle_start(self, cycle_num: int) -> datetime:
+        """Returns when the given (zero based) cycle starts."""
+        return self.started + cycle_num * self.cycle_duration
+
+    def position(self, when: datetime) -> Tuple[int, datetime, timedelta]:
+        """Returns where a moment falls in the profile's cycles.
+
+        Arguments:
+            when (datetime): The moment.
+
+        Returns (tuple):
+            (cycle number, cycle start time, duration into the cycle). A profile run once
+            stays in cycle 0, so the duration into it keeps growing after it completes.
+        """
+        elapsed = when - self.started
+        cycle_num = max(0, elapsed // self.cycle_duration) if self._loops else 0
+        cycle_start = self.cycle_start(cycle_num)
+        return cycle_num, cycle_start, when - cycle_start
+
+    def completed(self, when: datetime) -> bool:
+        """Returns whether a profile run once has finished by the given moment."""
+        return not self.run_continuously and when - self.started > self.cycle_duration
+
+    def intensity_at(self, timestamps) -> np.ndarray:
+        """Returns the scheduled intensity at each timestamp.
+
+        Arguments:
+            timestamps (array-like of datetime64 or datetime): Moments to evaluate, in any order.
+
+        Returns (ndarray):
+            Intensities, NaN for moments before the profile was started.
+        """
+        timestamps = np.asarray(timestamps, dtype="datetime64[us]")
+        elapsed = (timestamps - np.datetime64(self.started, "us")) / np.timedelta64(1, "s")
+        cycle_seconds = self.cycle_duration.total_seconds()
+        if self._loops:
+            into_cycle = np.mod(elapsed, cycle_seconds)
+        else:
+            into_cycle = np.minimum(elapsed, cycle_seconds)
+        intensities = self.profile.values_at(into_cycle).astype(np.float64)
+        return np.where(elapsed < 0, np.nan, intensities)
@@ -0,0 +1,18 @@
+"""The rpi modules are imported by bare name, as the web app imports them.
+
+The web app's folders are pointed at a temporary directory and a stand-in Arduino is used
+before anything from rpi is imported, as load_test.py and soak_test.py do.
+"""
+import os
+import sys
+import tempfile
+
+RPI_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rpi")
+_STATIC_FOLDER = tempfile.mkdtemp(prefix="climate_tests_")
+os.makedirs(os.path.join(_STATIC_FOLDER, "live"), exist_ok=True)
+os.environ.update(
+    FAKE_ARDUINO="1",
+    CLIMATE_STATIC_FOLDER=_STATIC_FOLDER,
+    CLIMATE_LOG_FOLDER=os.path.join(_STATIC_FOLDER, "logs"),
+)
+sys.path.insert(0, RPI_FOLDER)
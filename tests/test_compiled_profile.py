@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from datetime import timedelta
+import compiled_profile
+from climate_web_utilities import check_profile_validity, compile_valid_profile
+from compiled_profile import CompiledProfile, check_compiled_rows, compile_profile, compile_sequence
+
+
+@pytest.fixture
+def profile(tmp_path):
+    path = compile_profile([0, 10, 20, 30], [5, 50, 20, 0], str(tmp_path / "profile.npy"))
+    return CompiledProfile(path)
+
+
+def test_compile_profile_round_trips(profile):
+    assert len(profile) == 4
+    assert profile.cycle_duration == timedelta(seconds=30)
+    assert profile.row(1) == (timedelta(seconds=10), 50.0)
+    assert profile.row(-1) == (timedelta(seconds=30), 0.0)
+    seconds, intensities = profile.window(0, 10)
+    np.testing.assert_array_equal(seconds, [0, 10, 20, 30])
+    np.testing.assert_array_equal(intensities, [5, 50, 20, 0])
+
+
+@pytest.mark.parametrize(
+    "seconds, intensities",
+    [([], []), ([0, 1], [1]), ([0, 2, 1], [1, 2, 3]), ([[0, 1]], [[1, 2]])],
+)
+def test_compile_profile_rejects_bad_steps(tmp_path, seconds, intensities):
+    with pytest.raises(ValueError):
+        compile_profile(seconds, intensities, str(tmp_path / "bad.npy"))
+
+
+def test_search_matches_searchsorted(profile):
+    assert profile.search(10) == 1
+    assert profile.search(10, side="right") == 2
+    assert profile.search(-1) == 0
+    assert profile.search(31) == 4
+    np.testing.assert_array_equal(profile.search(np.array([0, 5, 25])), [0, 1, 3])
+
+
+def test_values_at_holds_each_step_until_the_next(profile):
+    np.testing.assert_array_equal(profile.values_at(np.array([-5, 0, 9.9, 10, 29, 30, 99])), [5, 5, 5, 50, 20, 0, 0])
+
+
+def test_between_includes_the_step_in_effect(profile):
+    seconds, intensities = profile.between(15, 25)
+    np.testing.assert_array_equal(seconds, [10, 20])
+    np.testing.assert_array_equal(intensities, [50, 20])
+
+
+def test_segment_at_finds_each_profile_of_a_sequence(tmp_path, profile):
+    day = CompiledProfile(compile_profile([0, 60], [100, 100], str(tmp_path / "day.npy")))
+    sequence = CompiledProfile(
+        compile_sequence([("profile", profile, 2), ("day", day, 1)], str(tmp_path / "sequence.npy"))
+    )
+    assert sequence.segment_count == 3
+    assert sequence.cycle_duration == timedelta(seconds=120)
+    assert len(sequence) == 3 + 3 + 2
+    assert sequence.segment_at(0)["name"] == "profile (1/2)"
+    assert sequence.segment_at(29.9)["index"] == 0
+    assert sequence.segment_at(30) == {"index": 1, "name": "profile (2/2)", "offset": 30.0, "duration": 30.0}
+    assert sequence.segment_at(60)["name"] == "day"
+    # Past either end clamps to the first or last segment.
+    assert sequence.segment_at(-1)["index"] == 0
+    assert sequence.segment_at(1000)["index"] == 2
+    assert profile.segment_at(0) is None
+
+
+def write_npy(path, array) -> str:
+    np.save(path, np.asarray(array, dtype=np.float64))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "array",
+    [
+        np.empty((2, 0)),
+        [[0.0], [50.0]],
+        [[0.0, np.nan, 20], [1, 2, 0]],
+        [[0.0, 10, 20], [1, np.inf, 0]],
+        [[0.0, 20, 10], [1, 2, 0]],
+    ],
+    ids=["empty", "one row", "nan time", "infinite intensity", "decreasing"],
+)
+def test_uploaded_compiled_profiles_are_checked(tmp_path, array):
+    path = write_npy(tmp_path / "upload.npy", array)
+    with pytest.raises(ValueError):
+        check_compiled_rows(CompiledProfile(path))
+    assert not check_profile_validity(path)
+    assert compile_valid_profile(path) is None
+
+
+def test_decreasing_times_across_chunks_are_found(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiled_profile, "_CHECK_CHUNK_ROWS", 3)
+    seconds = np.arange(10.0)
+    seconds[6] = 4.5
+    path = write_npy(tmp_path / "upload.npy", [seconds, np.ones(10)])
+    with pytest.raises(ValueError):
+        check_compiled_rows(CompiledProfile(path))
+    seconds[6] = 6
+    check_compiled_rows(CompiledProfile(write_npy(tmp_path / "upload.npy", [seconds, np.ones(10)])))
@@ -0,0 +1,58 @@
+import threading
+import numpy as np
+import pandas as pd
+import control_lights
+from climate_web_utilities import LIVE_FOLDER_PATH, RETRIEVE_CONFIG, ClimateConfig
+from clock import VirtualClock
+from compiled_profile import compile_profile
+from realtime import JitterRecorder
+
+
+def test_scheduling_error_is_summarized_between_changes(monkeypatch):
+    monkeypatch.setattr(control_lights, "setup_logging", lambda name: None)
+    monkeypatch.setattr(control_lights, "flash_lights_thrice", lambda: None)
+    summaries = []
+    summary = JitterRecorder.summary
+    monkeypatch.setattr(JitterRecorder, "summary", lambda self: summaries.append(self.count) or summary(self))
+    # A minute of changes every second, run once.
+    seconds = np.arange(61.0)
+    path = compile_profile(seconds, seconds % 2 * 50, f"{LIVE_FOLDER_PATH}/jitter.npy")
+    config = ClimateConfig(path, False)
+    config.update()
+    try:
+        control_lights.control_lights(VirtualClock(config.started))
+        saved = RETRIEVE_CONFIG()["scheduling_error"]
+    finally:
+        config.cleanup()
+    assert saved["count"] == summaries[-1] == 60
+    # Every JITTER_SUMMARY_INTERVAL (10 s) and once at the end, not at each of the 60 changes.
+    assert len(summaries) <= 60 / control_lights.JITTER_SUMMARY_INTERVAL.total_seconds() + 1
+
+
+def test_changes_are_recorded_off_the_control_loop(monkeypatch):
+    monkeypatch.setattr(control_lights, "setup_logging", lambda name: None)
+    monkeypatch.setattr(control_lights, "flash_lights_thrice", lambda: None)
+    saved_by = []
+    save_config = control_lights.save_config
+    monkeypatch.setattr(
+        control_lights, "save_config", lambda config: saved_by.append(threading.current_thread()) or save_config(config)
+    )
+    seconds = np.arange(31.0)
+    path = compile_profile(seconds, seconds % 2 * 50, f"{LIVE_FOLDER_PATH}/recorded.npy")
+    config = ClimateConfig(path, False)
+    config.update()
+    try:
+        control_lights.control_lights(VirtualClock(config.started))
+        saved = RETRIEVE_CONFIG()
+        history = pd.read_csv(control_lights.HISTORY_PATH, parse_dates=["time"], date_format="ISO8601")
+    finally:
+        config.cleanup()
+    # Only the pid is saved by the control loop itself, before the first change.
+    assert saved_by[0] is threading.current_thread()
+    assert all(thread is not threading.current_thread() for thread in saved_by[1:])
+    assert saved["pid"] is None and saved["rpi_time_script_finished"] is not None
+    assert saved["last_intensity"] == 0
+    # The initial intensity and every change, in order.
+    assert len(history) == 31
+    assert history["time"].is_monotonic_increasing
+    np.testing.assert_array_equal(history["intensity"], [0, 50] * 15 + [0])
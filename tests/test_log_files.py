@@ -0,0 +1,29 @@
+import json
+import logging
+import multiprocessing
+from log_files import log_path, search_logs, setup_logging
+
+LINES = 2000
+
+
+def log_lines(folder: str) -> None:
+    setup_logging("child", folder)
+    for line in range(LINES):
+        logging.getLogger("child").info("line %s", line, extra={"line": line})
+
+
+def test_forked_child_logs_every_line_before_exiting(tmp_path):
+    child = multiprocessing.get_context("fork").Process(target=log_lines, args=(str(tmp_path),))
+    child.start()
+    child.join(timeout=30)
+    assert child.exitcode == 0
+    with open(log_path("child", str(tmp_path)), encoding="utf-8") as infile:
+        lines = [json.loads(text) for text in infile]
+    assert [line["line"] for line in lines if "line" in line] == list(range(LINES))
+
+
+def test_search_logs_filters_by_field(tmp_path):
+    child = multiprocessing.get_context("fork").Process(target=log_lines, args=(str(tmp_path),))
+    child.start()
+    child.join(timeout=30)
+    assert [line["message"] for line in search_logs("child", str(tmp_path), fields={"line": "7"})] == ["line 7"]
@@ -0,0 +1,62 @@
+import pytest
+from datetime import datetime, timedelta
+from compiled_profile import compile_profile
+from plot_tiles import ZOOM_SPANS, TileCache, tile_key, tile_range
+
+STARTED = datetime(2024, 5, 1, 6, 0, 0)
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    profile_path = compile_profile([0, 3600, 7200], [10, 60, 0], str(tmp_path / "profile.npy"))
+    return lambda last_updated: {
+        "_profile_filepath": profile_path,
+        "_started": STARTED,
+        "run_continuously": True,
+        "last_updated": last_updated,
+    }
+
+
+def test_tile_key_changes_as_history_advances_through_the_tile(make_config):
+    zoom, index = 3, 1
+    start, end = tile_range(STARTED, zoom, index)
+    assert end - start == ZOOM_SPANS[zoom]
+    keys = [
+        tile_key(make_config(last_updated), zoom, index)
+        for last_updated in (None, start - timedelta(seconds=1), start, start + timedelta(minutes=30), end)
+    ]
+    # Nothing applied within the tile yet.
+    assert keys[0] == keys[1]
+    # Every applied intensity within it, and its completion, changes it.
+    assert len(set(keys[1:])) == 4
+    # Once history has passed the tile, it stays the same.
+    assert tile_key(make_config(end + timedelta(days=3)), zoom, index) == keys[-1]
+
+
+def test_tile_rendered_before_history_reached_it_is_rendered_again(tmp_path, make_config):
+    cache = TileCache(str(tmp_path / "tiles"))
+    renders = []
+
+    def render(path):
+        renders.append(path)
+        with open(path, "wb") as outfile:
+            outfile.write(b"png")
+
+    zoom, index = 3, 0
+    start, end = tile_range(STARTED, zoom, index)
+    for last_updated in (start - timedelta(minutes=5), end + timedelta(minutes=5), end + timedelta(hours=5)):
+        cache.get(tile_key(make_config(last_updated), zoom, index), render)
+    assert len(renders) == 2
+
+
+def test_tile_key_of_the_present_tile_follows_now(make_config):
+    zoom, index = 3, 1
+    start, end = tile_range(STARTED, zoom, index)
+    config = make_config(start + timedelta(minutes=10))
+    key_at = lambda minutes: tile_key(config, zoom, index, start + timedelta(minutes=minutes))
+    # The now-line moves on within the tile, but only by a coarse bucket at a time.
+    assert key_at(20) == key_at(20.01)
+    assert key_at(20) != key_at(40)
+    # Tiles not containing the present don't depend on it.
+    past = tile_key(config, zoom, 0, end + timedelta(minutes=5))
+    assert past == tile_key(config, zoom, 0, end + timedelta(hours=5))
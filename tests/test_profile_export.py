@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+from compiled_profile import CompiledProfile, compile_profile
+from profile_export import iter_applied_history, iter_schedule, stream_csv
+from timeline import Timeline
+
+STARTED = datetime(2024, 5, 1)
+HOUR = 3600.0
+
+
+def scheduled_at(chunks, moments: np.ndarray) -> np.ndarray:
+    """The intensity in effect at each moment according to exported steps."""
+    schedule = pd.concat(chunks)
+    times = schedule["time"].to_numpy(dtype="datetime64[us]")
+    rows = np.searchsorted(times, moments, side="right") - 1
+    return np.where(rows >= 0, schedule["intensity"].to_numpy()[np.maximum(rows, 0)], np.nan)
+
+
+@pytest.mark.parametrize("first_hour", [0, 3])
+@pytest.mark.parametrize("run_continuously", [True, False])
+def test_schedule_matches_timeline(tmp_path, first_hour, run_continuously):
+    seconds = np.array([first_hour, 6, 12, 24]) * HOUR
+    profile = CompiledProfile(compile_profile(seconds, [10, 30, 50, 0], str(tmp_path / "profile.npy")))
+    timeline = Timeline(profile, STARTED, run_continuously)
+    start, end = STARTED + timedelta(hours=2), STARTED + timedelta(days=3)
+    moments = np.datetime64(start, "us") + np.arange(0, 70 * 3600, 900) * np.timedelta64(1, "s")
+    exported = scheduled_at(iter_schedule(timeline, start, end), moments)
+    np.testing.assert_array_equal(exported, timeline.intensity_at(moments))
+
+
+def test_schedule_of_a_looping_profile_restarts_each_cycle(tmp_path):
+    seconds = np.array([3, 6, 12, 24]) * HOUR
+    profile = CompiledProfile(compile_profile(seconds, [10, 30, 50, 0], str(tmp_path / "profile.npy")))
+    schedule = pd.concat(iter_schedule(Timeline(profile, STARTED, True), STARTED, STARTED + timedelta(days=1)))
+    assert list(schedule["intensity"]) == [10, 30, 50, 10]
+    assert schedule["time"].iloc[-1] == STARTED + timedelta(days=1)
+
+
+def test_stream_csv_writes_one_header(tmp_path):
+    profile = CompiledProfile(compile_profile([0, HOUR, 2 * HOUR], [1, 2, 0], str(tmp_path / "profile.npy")))
+    text = "".join(stream_csv(iter_schedule(Timeline(profile, STARTED, True), STARTED, STARTED + timedelta(hours=5))))
+    assert text.splitlines()[0] == "time,intensity"
+    assert text.count("time") == 1
+    assert len(text.splitlines()) == 7
+
+
+@pytest.mark.parametrize("start_seconds", [None, -10, 0, 2.5, 3, 1234, 2997, 2999, 5000])
+def test_applied_history_seeks_to_start(tmp_path, start_seconds):
+    path = str(tmp_path / "applied_history.csv")
+    with open(path, "w") as outfile:
+        outfile.write("time,intensity,scheduled_time\n")
+        for second in range(0, 3000, 3):
+            # Whole seconds are written without microseconds, as datetime.isoformat does.
+            applied = STARTED + timedelta(seconds=second, microseconds=(second % 2) * 1500)
+            outfile.write(f"{applied.isoformat()},{second % 100},{(STARTED + timedelta(seconds=second)).isoformat()}\n")
+        # A row still being written by the Light Controller.
+        outfile.write(f"{(STARTED + timedelta(seconds=3000)).isoformat()},5")
+    history = pd.read_csv(path, parse_dates=["time", "scheduled_time"], date_format="ISO8601").iloc[:-1]
+    start = None if start_seconds is None else STARTED + timedelta(seconds=start_seconds)
+    end = STARTED + timedelta(seconds=2000)
+    expected = history[((history["time"] >= start) if start else True) & (history["time"] <= end)]
+    chunks = list(iter_applied_history(path, start, end))
+    exported = pd.concat(chunks) if chunks else expected.iloc[:0]
+    np.testing.assert_array_equal(exported["time"].to_numpy(), expected["time"].to_numpy())
+    np.testing.assert_array_equal(exported["intensity"].to_numpy(), expected["intensity"].to_numpy())
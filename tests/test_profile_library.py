@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from compiled_profile import CompiledProfile, compile_profile
+from profile_library import ProfileLibrary
+
+SIMPLIFY = {"tolerance": 2.0, "min_dwell": 0.0, "max_error": 1.0}
+
+
+def upload(tmp_path, name: str) -> str:
+    seconds = np.arange(1001.0)
+    return compile_profile(seconds, np.round(50 + 10 * np.sin(seconds / 50)), str(tmp_path / name))
+
+
+def test_add_simplifies_and_catalogs(tmp_path):
+    library = ProfileLibrary(str(tmp_path / "library"))
+    entry = library.add(upload(tmp_path, "wave.npy"), simplify=SIMPLIFY)
+    simplified = CompiledProfile(library.compiled_path(entry))
+    assert entry["original_rows"] == 1001
+    assert entry["rows"] == len(simplified) < 1001
+    assert entry["max_deviation"] <= SIMPLIFY["max_error"]
+    assert library.get(entry["hash"]) == entry
+    # The same content again, differently simplified, replaces the simplified form.
+    again = library.add(upload(tmp_path, "wave.npy"), simplify=dict(SIMPLIFY, tolerance=0.0))
+    assert again["rows"] > entry["rows"]
+    assert library.get(entry["hash"])["rows"] == len(CompiledProfile(library.compiled_path(again)))
+    # Nothing is left behind from simplifying.
+    assert sorted(os.listdir(library.folder)) == sorted(
+        [f"{entry['hash']}.npy", f"{entry['hash']}.simplified.npy", f"{entry['hash']}.png", "catalog.sqlite"]
+    )
+
+
+def test_concurrent_adds_leave_one_consistent_entry(tmp_path):
+    library = ProfileLibrary(str(tmp_path / "library"))
+    paths = [upload(tmp_path, f"wave{n}.npy") for n in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        entries = list(executor.map(lambda path: library.add(path, simplify=SIMPLIFY), paths))
+    assert len({entry["hash"] for entry in entries}) == 1
+    stored = library.get(entries[0]["hash"])
+    assert stored["rows"] == len(CompiledProfile(library.compiled_path(stored)))
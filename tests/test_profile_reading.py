@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, time, timedelta
+from climate_web_utilities import (
+    check_profile_validity,
+    compile_valid_profile,
+    expand_profile_points,
+    is_valid_profile_frame,
+    read_profile,
+    times_to_timedeltas,
+)
+
+EXPECTED = pd.to_timedelta(["0s", "30min", "36h"])
+
+
+@pytest.mark.parametrize(
+    "times",
+    [
+        pd.to_timedelta(["0s", "30min", "36h"]),
+        pd.to_datetime(["2024-05-01 06:00", "2024-05-01 06:30", "2024-05-02 18:00"]),
+        [0, 1 / 48, 1.5],
+        ["00:00:00", "00:30:00", "36:00:00"],
+        ["0 days 00:00:00", "0 days 00:30:00", "1 day 12:00:00"],
+        [datetime(2024, 5, 1, 6), datetime(2024, 5, 1, 6, 30), datetime(2024, 5, 2, 18)],
+        [timedelta(0), timedelta(minutes=30), timedelta(hours=36)],
+    ],
+    ids=["timedelta", "datetime64", "fractional days", "h:m:s strings", "day strings", "datetimes", "timedeltas"],
+)
+def test_times_to_timedeltas(times):
+    df = times_to_timedeltas(pd.DataFrame({"time": times, "intensity": [0, 50, 100]}))
+    assert pd.api.types.is_timedelta64_dtype(df["time"])
+    # Fractions of a day aren't exact in binary.
+    assert list(df["time"].dt.round("1s")) == list(EXPECTED)
+
+
+def test_times_to_timedeltas_times_of_day():
+    df = times_to_timedeltas(pd.DataFrame({"time": [time(0), time(6, 30)], "intensity": [0, 50]}))
+    assert list(df["time"]) == [pd.Timedelta(0), pd.Timedelta(hours=6, minutes=30)]
+
+
+def test_times_to_timedeltas_rejects_nonsense():
+    with pytest.raises(ValueError):
+        times_to_timedeltas(pd.DataFrame({"time": ["soon", "later"], "intensity": [0, 50]}))
+
+
+def test_expand_profile_points_draws_steps():
+    seconds, values = expand_profile_points(np.array([0.0, 10, 20, 30]), np.array([5.0, 5, 20, 0]))
+    np.testing.assert_array_equal(seconds, [0, 20, 20, 30, 30])
+    np.testing.assert_array_equal(values, [5, 5, 20, 20, 0])
+
+
+def test_expand_profile_points_draws_from_the_start():
+    # The first step's intensity is in effect from the start, before its own time.
+    seconds, values = expand_profile_points(np.array([10.0, 20]), np.array([5.0, 0]))
+    np.testing.assert_array_equal(seconds, [0, 20, 20])
+    np.testing.assert_array_equal(values, [5, 5, 0])
+    # A later slice of a profile starts at its step in effect, which isn't moved.
+    seconds, values = expand_profile_points(np.array([10.0, 20]), np.array([5.0, 0]), start=15)
+    np.testing.assert_array_equal(seconds, [10, 20, 20])
+
+
+@pytest.mark.parametrize("times", [[0, 60, 120], [0.0, 60.0, 120.0], [0, 1, 2]], ids=["ints", "whole floats", "days"])
+def test_times_to_timedeltas_refuses_whole_numbers(times):
+    with pytest.raises(ValueError, match="whole numbers"):
+        times_to_timedeltas(pd.DataFrame({"time": times, "intensity": [0, 50, 100]}))
+
+
+def test_profiles_need_numeric_intensities(tmp_path):
+    path = tmp_path / "profile.csv"
+    path.write_text("time,intensity\n00:00:00,low\n01:00:00,high\n02:00:00,off\n")
+    assert not is_valid_profile_frame(read_profile(str(path)))
+    assert not check_profile_validity(str(path))
+    assert compile_valid_profile(str(path)) is None
+    path.write_text("time,intensity\n00:00:00,10\n01:00:00,20.5\n02:00:00,0\n")
+    assert check_profile_validity(str(path))
+    assert len(compile_valid_profile(str(path))) == 3
+
+
+def test_csv_of_seconds_is_refused(tmp_path):
+    path = tmp_path / "seconds.csv"
+    path.write_text("time,intensity\n0,10\n60,20\n120,0\n")
+    assert not check_profile_validity(str(path))
+    assert compile_valid_profile(str(path)) is None
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import profile_simplify
+from compiled_profile import CompiledProfile, compile_profile
+from profile_simplify import max_deviation, simplify_profile, simplify_steps
+
+
+def random_profile(rng: np.random.Generator, rows: int):
+    """Steps of random lengths, some at the same time, wandering through random intensities."""
+    gaps = rng.choice([0, 0, 1, 2, 5, 30, 600], size=rows - 1)
+    seconds = np.concatenate(([0], np.cumsum(gaps))).astype(np.float64)
+    intensities = np.clip(np.cumsum(rng.integers(-3, 4, size=rows)) + 50, 0, 100).astype(np.float64)
+    return seconds, intensities
+
+
+def reference_simplify(seconds, intensities, tolerance, min_dwell, max_error):
+    """The simplification, one step at a time."""
+
+    def join(steps, limit, can_join):
+        runs = []
+        for i, (start, low, high) in enumerate(steps):
+            if runs and can_join(i) and max(runs[-1][2], high) - min(runs[-1][1], low) <= limit:
+                runs[-1] = (runs[-1][0], min(runs[-1][1], low), max(runs[-1][2], high))
+            else:
+                runs.append((start, low, high))
+        return runs
+
+    merge_limit = min(tolerance, 2 * max_error)
+    steps = join(list(zip(seconds[:-1], intensities[:-1], intensities[:-1])), merge_limit, lambda i: True)
+    if min_dwell > 0:
+        stops = [start for start, _, _ in steps[1:]] + [seconds[-1]]
+        steps = join(steps, 2 * max_error, lambda i: stops[i] - steps[i][0] < min_dwell)
+        steps = join(steps, merge_limit, lambda i: True)
+    return (
+        np.array([start for start, _, _ in steps] + [seconds[-1]]),
+        np.array([(low + high) / 2 for _, low, high in steps] + [intensities[-1]]),
+    )
+
+
+def test_simplify_steps_merges_and_absorbs():
+    seconds = np.array([0.0, 10, 20, 21, 30, 40])
+    intensities = np.array([10.0, 11, 50, 12, 12, 0])
+    simple_seconds, simple_intensities = simplify_steps(seconds, intensities, 1, 5, 1)
+    np.testing.assert_array_equal(simple_seconds, [0, 20, 21, 40])
+    np.testing.assert_array_equal(simple_intensities, [10.5, 50, 12, 0])
+
+
+def test_simplify_steps_rejects_negative_settings():
+    with pytest.raises(ValueError):
+        simplify_steps(np.arange(3.0), np.arange(3.0), -1, 0, 1)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("tolerance, min_dwell, max_error", [(1, 0, 2), (4, 60, 1.5), (10, 600, 2), (0, 5, 0)])
+def test_simplified_profile_stays_within_max_error(tmp_path, monkeypatch, seed, tolerance, min_dwell, max_error):
+    # Small chunks so runs and short steps are carried across many chunk boundaries.
+    monkeypatch.setattr(profile_simplify, "_CHUNK_ROWS", 7)
+    seconds, intensities = random_profile(np.random.default_rng(seed), 500)
+    profile = CompiledProfile(compile_profile(seconds, intensities, str(tmp_path / "profile.npy")))
+    report = simplify_profile(profile, str(tmp_path / "simplified.npy"), tolerance, min_dwell, max_error)
+    simplified = CompiledProfile(str(tmp_path / "simplified.npy"))
+    assert report["max_deviation"] == max_deviation(profile, simplified) <= max_error
+    assert report["rows"] == len(simplified) <= len(profile)
+    # Chunked or whole, the result is the same, and it ends where the profile does.
+    simple_seconds, simple_intensities = simplify_steps(seconds, intensities, tolerance, min_dwell, max_error)
+    np.testing.assert_array_equal(simplified.window(0, len(simplified))[0], simple_seconds)
+    np.testing.assert_array_equal(simplified.window(0, len(simplified))[1], simple_intensities)
+    assert simplified.row(-1) == profile.row(-1)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 7, 4096])
+@pytest.mark.parametrize("tolerance, min_dwell, max_error", [(1, 0, 2), (4, 60, 1.5), (10, 600, 2), (0, 5, 0), (3, 2, 100)])
+def test_simplify_steps_matches_joining_one_step_at_a_time(monkeypatch, chunk_rows, tolerance, min_dwell, max_error):
+    monkeypatch.setattr(profile_simplify, "_CHUNK_ROWS", chunk_rows)
+    for seed in range(3):
+        seconds, intensities = random_profile(np.random.default_rng(seed), 500)
+        simple_seconds, simple_intensities = simplify_steps(seconds, intensities, tolerance, min_dwell, max_error)
+        expected_seconds, expected_intensities = reference_simplify(seconds, intensities, tolerance, min_dwell, max_error)
+        np.testing.assert_array_equal(simple_seconds, expected_seconds)
+        np.testing.assert_array_equal(simple_intensities, expected_intensities)
+
+
+@pytest.mark.parametrize("setting", [float("nan"), float("inf"), -1])
+def test_simplify_steps_rejects_settings_that_arent_finite_and_non_negative(setting):
+    for settings in ((setting, 0, 1), (1, setting, 1), (1, 0, setting)):
+        with pytest.raises(ValueError):
+            simplify_steps(np.arange(3.0), np.arange(3.0), *settings)
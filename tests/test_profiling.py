@@ -0,0 +1,80 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import profiling
+
+
+def test_overlapping_requests_share_one_capture(tmp_path):
+    stem = str(tmp_path / "web")
+    capture = threading.Thread(target=profiling.capture_web_app, args=("cprofile", 0.5, stem))
+    capture.start()
+    while profiling._REQUEST_PROFILES is None:
+        time.sleep(0.01)
+    first_started, second_done = threading.Event(), threading.Event()
+
+    def first():
+        profiling.request_started()
+        first_started.set()
+        second_done.wait()
+        sum(range(1000))
+        profiling.request_finished()
+
+    def second():
+        first_started.wait()
+        # Only one profiler can be active at a time, so this one isn't profiled.
+        profiling.request_started()
+        profiling.request_finished()
+        second_done.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    capture.join()
+    with open(stem + ".json", "r", encoding="utf-8") as infile:
+        summary = json.load(infile)
+    assert summary["requests"] == {"profiled": 1, "skipped": 1}
+    assert os.path.exists(stem + ".prof")
+
+
+def test_capture_without_requests_is_saved(tmp_path):
+    summary = profiling.capture_web_app("cprofile", 0.1, str(tmp_path / "web"))
+    assert summary["requests"] == {"profiled": 0, "skipped": 0}
+    assert summary["top"] == []
+
+
+def test_controller_pid_recognizes_a_light_controller_forked_before_the_config_was_saved(tmp_path):
+    config_path = str(tmp_path / "climate_config.json")
+    controller = multiprocessing.get_context("fork").Process(target=time.sleep, args=(30,))
+    controller.start()
+    try:
+        with open(config_path, "w", encoding="utf-8") as outfile:
+            json.dump({"pid": controller.pid}, outfile)
+        assert profiling.controller_pid(controller.pid, config_path) == controller.pid
+        # Created after the config was last saved, so the pid was reused.
+        os.utime(config_path, (time.time() - 3600, time.time() - 3600))
+        assert profiling.controller_pid(controller.pid, config_path) is None
+    finally:
+        controller.kill()
+        controller.join()
+    assert profiling.controller_pid(controller.pid, config_path) is None
+
+
+def test_controller_pid_ignores_other_processes(tmp_path):
+    config_path = str(tmp_path / "climate_config.json")
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        time.sleep(0.2)
+        with open(config_path, "w", encoding="utf-8") as outfile:
+            json.dump({"pid": other.pid}, outfile)
+        assert profiling.controller_pid(other.pid, config_path) is None
+    finally:
+        other.kill()
+        other.wait()
+    assert profiling.controller_pid(None, config_path) is None
+    assert profiling.controller_pid(os.getpid(), config_path) is None
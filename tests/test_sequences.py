@@ -0,0 +1,25 @@
+import pytest
+from climate_web_utilities import natural_sort_key, parse_repeats
+
+
+def test_natural_sort_key_orders_numbers_by_value():
+    names = ["day10.xlsx", "day2.xlsx", "Day1.xlsx", "day1b.xlsx", "night.xlsx"]
+    assert sorted(names, key=natural_sort_key) == ["Day1.xlsx", "day1b.xlsx", "day2.xlsx", "day10.xlsx", "night.xlsx"]
+
+
+@pytest.mark.parametrize(
+    "repeats, count, expected",
+    [
+        ("", 3, [1, 1, 1]),
+        ("  ", 2, [1, 1]),
+        ("1,3,1", 3, [1, 3, 1]),
+        (" 2 , 4", 2, [2, 4]),
+        ("1,3", 3, None),
+        ("1,0,1", 3, None),
+        ("1,-2", 2, None),
+        ("1,x", 2, None),
+        ("1.5", 1, None),
+    ],
+)
+def test_parse_repeats(repeats, count, expected):
+    assert parse_repeats(repeats, count) == expected
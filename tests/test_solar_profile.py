@@ -0,0 +1,37 @@
+import pytest
+from compiled_profile import CompiledProfile
+from solar_profile import SECONDS_PER_DAY, generate_solar_profile
+
+
+def test_generates_a_day(tmp_path):
+    profile = CompiledProfile(
+        generate_solar_profile(str(tmp_path / "day.npy"), resolution=60, cloud_cover=0.5, cloud_timescale=300)
+    )
+    assert len(profile) == SECONDS_PER_DAY // 60 + 1
+    seconds, intensities = profile.window(0, len(profile))
+    assert seconds[-1] == SECONDS_PER_DAY
+    assert intensities[0] == 0 and 0 < intensities.max() <= 100
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        dict(cloud_timescale=0),
+        dict(cloud_timescale=-5),
+        dict(cloud_timescale=float("nan")),
+        dict(resolution=0),
+        dict(resolution=float("nan")),
+        dict(resolution=float("inf")),
+        dict(days=0),
+        dict(days=400),
+        dict(days=200, resolution=0.5),
+        dict(cloud_cover=0.5, cloud_timescale=1e-3),
+        dict(photoperiod=float("nan")),
+        dict(latitude=float("inf")),
+    ],
+)
+def test_rejects_bad_settings(tmp_path, options):
+    with pytest.raises(ValueError):
+        generate_solar_profile(str(tmp_path / "bad.npy"), **options)
+    assert not (tmp_path / "bad.npy").exists()
+
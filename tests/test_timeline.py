@@ -0,0 +1,75 @@
+import time
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from compiled_profile import CompiledProfile, compile_profile
+from timeline import Timeline
+
+STARTED = datetime(2024, 5, 1, 6, 0, 0)
+
+
+@pytest.fixture
+def profile(tmp_path):
+    return CompiledProfile(compile_profile([0, 10, 20, 30], [5, 50, 20, 0], str(tmp_path / "profile.npy")))
+
+
+def test_position_of_a_looping_profile(profile):
+    timeline = Timeline(profile, STARTED, True)
+    assert timeline.position(STARTED) == (0, STARTED, timedelta(0))
+    assert timeline.position(STARTED + timedelta(seconds=75)) == (
+        2,
+        STARTED + timedelta(seconds=60),
+        timedelta(seconds=15),
+    )
+    # Before the start is cycle 0, a negative time into it.
+    assert timeline.position(STARTED - timedelta(seconds=5)) == (0, STARTED, timedelta(seconds=-5))
+
+
+def test_position_of_a_profile_run_once_stays_in_cycle_0(profile):
+    timeline = Timeline(profile, STARTED, False)
+    assert timeline.position(STARTED + timedelta(seconds=75)) == (0, STARTED, timedelta(seconds=75))
+
+
+def test_completed(profile):
+    once, looping = Timeline(profile, STARTED, False), Timeline(profile, STARTED, True)
+    assert not once.completed(STARTED + timedelta(seconds=30))
+    assert once.completed(STARTED + timedelta(seconds=31))
+    assert not looping.completed(STARTED + timedelta(days=10))
+
+
+def test_intensity_at(profile):
+    moments = [STARTED + timedelta(seconds=s) for s in (-1, 0, 15, 29, 30, 45)]
+    looping = Timeline(profile, STARTED, True).intensity_at(moments)
+    once = Timeline(profile, STARTED, False).intensity_at(moments)
+    # A looping profile never applies its last step; one run once holds it.
+    np.testing.assert_array_equal(looping, [np.nan, 5, 50, 20, 5, 50])
+    np.testing.assert_array_equal(once, [np.nan, 5, 50, 20, 0, 0])
+
+
+def test_intensity_at_unsorted_timestamps_matches_a_direct_lookup(tmp_path):
+    rng = np.random.default_rng(0)
+    seconds = np.cumsum(rng.integers(1, 5, 10_000)).astype(np.float64)
+    intensities = rng.integers(0, 101, len(seconds)).astype(np.float64)
+    profile = CompiledProfile(compile_profile(seconds, intensities, str(tmp_path / "profile.npy")))
+    timeline = Timeline(profile, STARTED, True)
+    offsets = rng.uniform(-seconds[-1], 3 * seconds[-1], 50_000).reshape(250, 200)
+    moments = np.datetime64(STARTED, "us") + (offsets * 1e6).astype("timedelta64[us]")
+    into_cycle = np.mod(np.floor(offsets * 1e6) / 1e6, seconds[-1])
+    rows = np.clip(np.searchsorted(seconds, into_cycle, side="right") - 1, 0, len(seconds) - 1)
+    expected = np.where(offsets < 0, np.nan, intensities[rows])
+    np.testing.assert_array_equal(timeline.intensity_at(moments), expected)
+
+
+def test_intensity_at_many_unsorted_timestamps_is_fast(tmp_path):
+    rows = 5_000_000
+    path = compile_profile(np.arange(rows, dtype=np.float64), np.arange(rows) % 101, str(tmp_path / "profile.npy"))
+    timeline = Timeline(CompiledProfile(path), STARTED, True)
+    offsets = np.random.default_rng(0).integers(0, 3 * rows * 10**6, 1_000_000)
+    moments = np.datetime64(STARTED, "us") + offsets.astype("timedelta64[us]")
+    timeline.intensity_at(moments[:1000])
+    began = time.perf_counter()
+    intensities = timeline.intensity_at(moments)
+    # Searched in sorted order this takes ~0.3 s; looked up at random it took ~1.5 s.
+    assert time.perf_counter() - began < 0.8
+    # A looping profile never applies its last row, so a cycle is rows - 1 seconds long.
+    np.testing.assert_array_equal(intensities, offsets // 10**6 % (rows - 1) % 101)
@@ -0,0 +1,165 @@
+import json
+import multiprocessing
+import os
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import fleet_deploy
+import profiling
+from compiled_profile import compile_profile
+from profile_library import file_hash
+
+
+@pytest.fixture(scope="module")
+def web():
+    import climate_web_interface
+
+    yield climate_web_interface
+    if climate_web_interface.LIGHT_CONTROLLER is not None:
+        climate_web_interface.LIGHT_CONTROLLER.kill()
+
+
+@pytest.fixture
+def client(web):
+    return web.app.test_client()
+
+
+def test_fleet_api_is_refused_without_an_admin_token(client, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+    assert client.get("/api/library/abc").status_code == 403
+    assert client.post("/api/library").status_code == 403
+    assert client.post("/api/library/abc/run", json={}).status_code == 403
+    assert client.post("/api/deploy", json={}).status_code == 403
+
+
+def test_fleet_api_requires_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/library/abc").status_code == 403
+    assert client.get("/api/library/abc", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/library/abc", headers={"X-Admin-Token": "secret"}).status_code == 404
+
+
+@pytest.mark.parametrize("seconds", ["0", "-1", "nan", "inf", "soon"])
+def test_admin_profile_rejects_bad_durations(client, monkeypatch, seconds):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    response = client.get(f"/admin/profile/web?seconds={seconds}", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 400
+
+
+def test_admin_profile_only_signals_the_running_light_controller(web, client, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    signalled = []
+    monkeypatch.setattr(profiling, "request_controller_capture", lambda *args: signalled.append(args))
+    # A pid left in the config, e.g. by a controller that has since exited, that's alive
+    # as some other process.
+    monkeypatch.setattr(web, "RETRIEVE_CONFIG", lambda: {"pid": 1})
+    monkeypatch.setattr(web, "LIGHT_CONTROLLER", None)
+    response = client.get("/admin/profile/controller?seconds=1", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 404
+    assert not signalled
+
+
+def test_admin_profile_signals_a_light_controller_started_before_a_restart(web, client, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    signalled = []
+    monkeypatch.setattr(profiling, "request_controller_capture", lambda *args: signalled.append(args))
+    # Forked from an earlier run of the web app, so this one doesn't know it as LIGHT_CONTROLLER.
+    controller = multiprocessing.get_context("fork").Process(target=time.sleep, args=(30,))
+    controller.start()
+    config_path = os.path.join(web.app.config["LIVE_FOLDER"], web.CONFIG_NAME)
+    existed = os.path.exists(config_path)
+    try:
+        os.makedirs(web.app.config["LIVE_FOLDER"], exist_ok=True)
+        with open(config_path, "a", encoding="utf-8"):
+            pass
+        os.utime(config_path)
+        monkeypatch.setattr(web, "RETRIEVE_CONFIG", lambda: {"pid": controller.pid})
+        monkeypatch.setattr(web, "LIGHT_CONTROLLER", None)
+        response = client.get("/admin/profile/controller?seconds=1", headers={"X-Admin-Token": "secret"})
+    finally:
+        controller.kill()
+        controller.join()
+        if not existed:
+            os.remove(config_path)
+    # Signalled; the stand-in never saves a profile.
+    assert response.status_code == 504
+    assert signalled[0][1] == controller.pid
+
+
+def test_api_library_add_makes_the_name_safe(web, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    path = compile_profile([0, 60], [10, 0], str(tmp_path / "upload.npy"))
+    with open(path, "rb") as infile:
+        response = client.post(
+            "/api/library",
+            data={"file": (infile, "upload.npy"), "name": "../../outside/name.npy"},
+            headers={"X-Admin-Token": "secret"},
+            content_type="multipart/form-data",
+        )
+    assert response.status_code == 200
+    entry = response.get_json()
+    assert entry["name"] == "outside_name.npy"
+    os.makedirs(tmp_path / "live")
+    checked_out = web.LIBRARY.checkout(entry, str(tmp_path / "live"))
+    assert os.path.dirname(checked_out) == str(tmp_path / "live")
+    # A name cataloged before names were made safe is made safe when checked out.
+    checked_out = web.LIBRARY.checkout(dict(entry, name="../escape"), str(tmp_path / "live"))
+    assert checked_out == str(tmp_path / "live" / "escape.npy")
+
+
+def test_deploy_sends_simplification_settings(monkeypatch, tmp_path):
+    path = compile_profile([0, 60, 120], [10, 11, 0], str(tmp_path / "profile.npy"))
+    simplify = {"tolerance": 2.0, "min_dwell": 0.0, "max_error": 1.0}
+    held = {}
+    calls = []
+
+    def call(url, token, data=None, content_type=None):
+        calls.append((url, data))
+        if url.endswith("/run"):
+            return {"started": "2024-05-01T06:00:00"}
+        if data is not None:
+            held.update(hash=file_hash(path), simplify=json.dumps(simplify, sort_keys=True))
+            return held
+        return held or None
+
+    monkeypatch.setattr(fleet_deploy, "_call", call)
+    devices = {"127.0.0.1:5101": {"name": "pond"}}
+    results = fleet_deploy.deploy(path, devices, start_in=0, token="secret", simplify=simplify)
+    assert results["devices"][0]["uploaded"]
+    upload = calls[1][1]
+    assert b'name="simplify"' in upload and b'name="max_error"\r\n\r\n1.0' in upload
+    # Held, simplified the same way: not sent again. Held unsimplified: sent again.
+    assert not fleet_deploy.deploy(path, devices, start_in=0, simplify=simplify)["devices"][0]["uploaded"]
+    assert fleet_deploy.deploy(path, devices, start_in=0)["devices"][0]["uploaded"]
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "-1", "lots"])
+def test_parse_simplify_rejects_settings_that_arent_finite_and_non_negative(web, value):
+    for key in ("tolerance", "min_dwell", "max_error"):
+        with pytest.raises(ValueError):
+            web.parse_simplify({"simplify": "1", key: value})
+    assert web.parse_simplify({"simplify": "1", "tolerance": "0"})["tolerance"] == 0
+
+
+def test_api_library_run_converts_a_start_time_with_a_utc_offset_to_local_time(web, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    path = compile_profile([0, 60], [10, 0], str(tmp_path / "offset.npy"))
+    entry = web.LIBRARY.add(path, "offset.npy")
+    launched = []
+    monkeypatch.setattr(web, "launch_library_profiles", lambda entries, repeats, run, started: launched.append(started))
+    monkeypatch.setattr(web, "ACTIVE_CONFIG", SimpleNamespace(started=datetime(2024, 5, 1)))
+    monkeypatch.setattr(web, "LIGHT_CONTROLLER", SimpleNamespace(pid=None))
+    started = datetime(2024, 5, 1, 6, 0, tzinfo=timezone(timedelta(hours=-7)))
+    response = client.post(
+        f"/api/library/{entry['hash']}/run",
+        json={"started": started.isoformat(), "run_continuous": False},
+        headers={"X-Admin-Token": "secret"},
+    )
+    assert response.status_code == 200
+    # Naive, as the Light Controller compares it with datetime.now().
+    assert launched == [started.astimezone().replace(tzinfo=None)]
+    response = client.post(
+        f"/api/library/{entry['hash']}/run", json={"started": "at dawn"}, headers={"X-Admin-Token": "secret"}
+    )
+    assert response.status_code == 400